@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Elevator, Request
+from .models import Elevator, Request, RequestHistory
 
 admin.site.register(Elevator)
 admin.site.register(Request)
+admin.site.register(RequestHistory)
@@ -0,0 +1,126 @@
+from django.db import connections, router
+from django.db.models import Sum
+
+from elevator.models import TRIP_DIRECTION_CHOICES, DemandRollup
+
+DEMAND_BUCKET_MINUTES = 5
+DEMAND_COUNTERS = ('requests_count', 'trips_count', 'wait_seconds', 'ride_seconds')
+
+
+def get_demand_bucket(moment):
+    """
+    returns the start of the 5 minute bucket the moment falls in
+    """
+    return moment.replace(minute=moment.minute - moment.minute % DEMAND_BUCKET_MINUTES, second=0, microsecond=0)
+
+
+def get_trip_direction(pick_up_floor: int, destination_floor: int):
+    if destination_floor is None or destination_floor == pick_up_floor:
+        return TRIP_DIRECTION_CHOICES.UNKNOWN
+    return TRIP_DIRECTION_CHOICES.UP if destination_floor > pick_up_floor else TRIP_DIRECTION_CHOICES.DOWN
+
+
+def record_requests_created(requests, system_ids: dict):
+    """
+    counts new requests in the rollup, system_ids maps the elevator of each request to its system.
+    needs to run in the transaction creating the requests
+    """
+    changes = {}
+    for created_request in requests:
+        key = (
+            system_ids[created_request.elevator_id], get_demand_bucket(created_request.created_at),
+            created_request.pick_up_floor, TRIP_DIRECTION_CHOICES.UNKNOWN,
+        )
+        changes[key] = add_demand(changes.get(key), 1, 0, 0, 0)
+    save_demand(changes)
+
+
+def record_requests_fulfilled(requests, system_ids: dict):
+    """
+    counts the trips of users who got to their destination with the time they waited and rode,
+    requests which never boarded are not trips. needs to run in the transaction fulfilling the requests
+    """
+    changes = {}
+    for fulfilled_request in requests:
+        if fulfilled_request.boarded_at is None or fulfilled_request.fulfilled_at is None:
+            continue
+        key = (
+            system_ids[fulfilled_request.elevator_id], get_demand_bucket(fulfilled_request.created_at),
+            fulfilled_request.pick_up_floor,
+            get_trip_direction(fulfilled_request.pick_up_floor, fulfilled_request.destination_floor),
+        )
+        changes[key] = add_demand(
+            changes.get(key), 0, 1,
+            max(0, (fulfilled_request.boarded_at - fulfilled_request.created_at).total_seconds()),
+            max(0, (fulfilled_request.fulfilled_at - fulfilled_request.boarded_at).total_seconds()),
+        )
+    save_demand(changes)
+
+
+def add_demand(counters, requests_count, trips_count, wait_seconds, ride_seconds):
+    if counters is None:
+        return (requests_count, trips_count, wait_seconds, ride_seconds)
+    return tuple(map(sum, zip(counters, (requests_count, trips_count, wait_seconds, ride_seconds))))
+
+
+def save_demand(changes: dict):
+    """
+    adds the counters to their rollup rows in a single upsert, rows are written in key order so concurrent
+    upserts lock them in the same order
+    """
+    if not changes:
+        return
+    connection = connections[router.db_for_write(DemandRollup)]
+    quote = connection.ops.quote_name
+    table = quote(DemandRollup._meta.db_table)
+    key_columns = [quote(column) for column in ('system_id', 'bucket', 'floor', 'direction')]
+    counter_columns = [quote(column) for column in DEMAND_COUNTERS]
+    params = []
+    for (system_id, bucket, floor, direction), counters in sorted(changes.items()):
+        params.extend([system_id, connection.ops.adapt_datetimefield_value(bucket), floor, direction, *counters])
+    row = f"({', '.join(['%s'] * (len(key_columns) + len(counter_columns)))})"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(key_columns + counter_columns)}) VALUES {', '.join([row] * len(changes))} "
+            f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+            + ', '.join(f'{column} = {table}.{column} + EXCLUDED.{column}' for column in counter_columns),
+            params,
+        )
+
+
+def get_demand(system_id: int, after=None, before=None, floor: int = None, hour: int = None, by_floor: bool = False):
+    """
+    returns the rollup rows of a system, one per bucket, floor and direction or with by_floor the totals
+    of every floor busiest first. hour keeps the buckets starting in that hour of the day
+    """
+    rollups = DemandRollup.objects.filter(system_id=system_id)
+    if after is not None:
+        rollups = rollups.filter(bucket__gte=after)
+    if before is not None:
+        rollups = rollups.filter(bucket__lt=before)
+    if floor is not None:
+        rollups = rollups.filter(floor=floor)
+    if hour is not None:
+        rollups = rollups.filter(bucket__hour=hour)
+    if by_floor:
+        rows = [
+            {'floor': row['floor'], **{counter: row[f'total_{counter}'] for counter in DEMAND_COUNTERS}}
+            for row in rollups.values('floor').annotate(
+                **{f'total_{counter}': Sum(counter) for counter in DEMAND_COUNTERS}
+            ).order_by('-total_requests_count', 'floor')
+        ]
+    else:
+        rows = rollups.order_by('bucket', 'floor', 'direction').values('bucket', 'floor', 'direction', *DEMAND_COUNTERS)
+    return [summarize_demand(row) for row in rows]
+
+
+def summarize_demand(row: dict):
+    summary = {field: value for field, value in row.items() if field not in DEMAND_COUNTERS}
+    trips_count = row['trips_count']
+    summary.update({
+        'requests': row['requests_count'],
+        'trips': trips_count,
+        'average_wait_seconds': round(row['wait_seconds'] / trips_count, 3) if trips_count else None,
+        'average_ride_seconds': round(row['ride_seconds'] / trips_count, 3) if trips_count else None,
+    })
+    return summary
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from elevator.routing import mark_elevators_written
+
+NEXT_FLOOR = 'next-floor'
+ACTIVE_REQUESTS = 'active-requests'
+ELEVATOR_CACHE_KINDS = (NEXT_FLOOR, ACTIVE_REQUESTS)
+
+
+def get_elevator_cache_key(elevator_id: int, kind: str):
+    return f'elevator:{elevator_id}:{kind}'
+
+
+def get_or_set_elevator_cache(elevator_id: int, kind: str, compute):
+    """
+    returns the cached value of kind for the elevator, computing and caching it on a miss
+    """
+    key = get_elevator_cache_key(elevator_id, kind)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, getattr(settings, 'ELEVATOR_CACHE_TIMEOUT', 60))
+    return value
+
+
+def invalidate_elevator_cache(*elevator_ids):
+    """
+    drops the cached reads of the elevators, again once the surrounding transaction commits
+    so a read made before the commit can not keep stale data around, and keeps their reads on the primary for a while
+    """
+    keys = [get_elevator_cache_key(elevator_id, kind) for elevator_id in elevator_ids for kind in ELEVATOR_CACHE_KINDS]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+    transaction.on_commit(lambda: mark_elevators_written(*elevator_ids))
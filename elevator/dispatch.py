@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.exceptions import ValidationError
+
+from elevator import metrics
+from elevator.models import ELEVATOR_STATUS_CHOICES
+from system.models import DISPATCH_POLICY_CHOICES
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed by the cost matrix dispatcher
+    np = None
+
+COST_MATRIX_TIER = 5
+
+
+def cost_matrix_available():
+    return np is not None
+
+
+def uses_cost_matrix(system):
+    """
+    whether calls of the system are dispatched with the cost matrix, raises instead of quietly dispatching
+    a cost matrix system by the rules when numpy is missing
+    """
+    if system is None or system.dispatch_policy != DISPATCH_POLICY_CHOICES.COST_MATRIX:
+        return False
+    if not cost_matrix_available():
+        raise ImproperlyConfigured('cost_matrix dispatch needs numpy to be installed')
+    return True
+
+
+def get_dispatch_timings():
+    """
+    returns the seconds an elevator takes per floor and per stop, used to estimate times to arrival
+    """
+    return (
+        getattr(settings, 'ELEVATOR_FLOOR_TRAVEL_SECONDS', 2),
+        getattr(settings, 'ELEVATOR_STOP_SECONDS', 6),
+    )
+
+
+def get_fleet_arrays(elevators):
+    """
+    returns current floor, direction (1 up, -1 down, 0 idle) and lowest and highest floor of the route
+    of the elevators as arrays
+    """
+    current = np.fromiter((elevator.current_floor for elevator in elevators), dtype=np.float64, count=len(elevators))
+    direction = np.fromiter((
+        1 if elevator.elevator_status == ELEVATOR_STATUS_CHOICES.GOING_UP
+        else -1 if elevator.elevator_status == ELEVATOR_STATUS_CHOICES.GOING_DOWN
+        else 0
+        for elevator in elevators
+    ), dtype=np.float64, count=len(elevators))
+    lowest = np.fromiter((
+        elevator.current_floor if elevator.min_stop_floor is None else min(elevator.min_stop_floor, elevator.current_floor)
+        for elevator in elevators
+    ), dtype=np.float64, count=len(elevators))
+    highest = np.fromiter((
+        elevator.current_floor if elevator.max_stop_floor is None else max(elevator.max_stop_floor, elevator.current_floor)
+        for elevator in elevators
+    ), dtype=np.float64, count=len(elevators))
+    return current, direction, lowest, highest
+
+
+def count_stops_between(stops, low, high):
+    """
+    returns how many of the sorted stops are strictly between low and high, element wise
+    """
+    return np.maximum(0, np.searchsorted(stops, high, 'left') - np.searchsorted(stops, low, 'right'))
+
+
+def get_stops_before(elevators, pick_up_floors):
+    """
+    returns how many stops of its route plan each elevator (columns) makes before it reaches each pick up floor (rows),
+    following the same route as build_cost_matrix. a stop at the pick up floor itself is not counted
+    """
+    floors = np.asarray(pick_up_floors, dtype=np.float64)
+    stops_before = np.zeros((len(floors), len(elevators)))
+    for column, elevator in enumerate(elevators):
+        stops = np.asarray(sorted({*elevator.pick_up_stops, *elevator.drop_off_stops}), dtype=np.float64)
+        if not len(stops):
+            continue
+        current = elevator.current_floor
+        between = count_stops_between(stops, np.minimum(floors, current), np.maximum(floors, current))
+        if elevator.elevator_status == ELEVATOR_STATUS_CHOICES.GOING_UP:
+            # a call below waits for every stop above before the elevator comes down to it
+            behind = count_stops_between(stops, current, np.inf) + count_stops_between(stops, floors, current)
+            stops_before[:, column] = np.where(floors >= current, between, behind)
+        elif elevator.elevator_status == ELEVATOR_STATUS_CHOICES.GOING_DOWN:
+            behind = count_stops_between(stops, -np.inf, current) + count_stops_between(stops, current, floors)
+            stops_before[:, column] = np.where(floors <= current, between, behind)
+        else:
+            stops_before[:, column] = between
+    return stops_before
+
+
+def build_cost_matrix(elevators, pick_up_floors, floor_seconds: float, stop_seconds: float = 0):
+    """
+    returns the estimated seconds until each elevator (columns) reaches each pick up floor (rows).
+    an elevator going up serves every call above it before it turns around at the top of its route,
+    going down the other way round, stopping at each floor of its route plan on the way
+    """
+    current, direction, lowest, highest = get_fleet_arrays(elevators)
+    floors = np.asarray(pick_up_floors, dtype=np.float64)[:, None]
+
+    distance = np.where(
+        direction > 0,
+        np.where(floors >= current, floors - current, (highest - current) + (highest - floors)),
+        np.where(
+            direction < 0,
+            np.where(floors <= current, current - floors, (current - lowest) + (floors - lowest)),
+            np.abs(floors - current),
+        ),
+    )
+    return distance * floor_seconds + get_stops_before(elevators, pick_up_floors) * stop_seconds
+
+
+def assign_calls_by_cost(elevators, pick_up_floors):
+    """
+    returns the elevator chosen for each pick up floor out of in memory elevators and records the assignments
+    """
+    chosen = choose_elevators_by_cost(elevators, pick_up_floors)
+    metrics.registry.record_dispatch_tier(COST_MATRIX_TIER, len(chosen))
+    return chosen
+
+
+def choose_elevators_by_cost(elevators, pick_up_floors):
+    """
+    returns the elevator chosen for each pick up floor out of in memory elevators.
+    the cost matrix of the whole batch is built at once and calls are given the elevator arriving first in order,
+    every call given to an elevator delays the later calls it serves by one stop
+    """
+    if not elevators:
+        raise ValidationError('System is not initialized yet or all elevators are under maintainance')
+
+    floor_seconds, stop_seconds = get_dispatch_timings()
+    costs = build_cost_matrix(elevators, pick_up_floors, floor_seconds, stop_seconds)
+    added_stops = np.zeros(len(elevators))
+    chosen = []
+    for row in costs:
+        column = int((row + added_stops).argmin())
+        added_stops[column] += stop_seconds
+        chosen.append(elevators[column])
+    return chosen
@@ -0,0 +1,337 @@
+from bisect import bisect_left, bisect_right
+
+from elevator.models import DOOR_STATUS_CHOICES, ELEVATOR_STATUS_CHOICES, REQUEST_STATUS_CHOICES
+
+# dispatch and motion rules without the database, elevator/utils.py adapts the models to them.
+# the functions take anything having the fields of an Elevator, Car additionally keeps its pending
+# calls indexed by floor so a move only looks at the calls it serves
+
+
+class Call:
+    """
+    a user request held in memory
+    """
+    __slots__ = ('id', 'pick_up_floor', 'destination_floor', 'status')
+
+    def __init__(self, id, pick_up_floor: int, destination_floor: int = None, status: str = REQUEST_STATUS_CHOICES.ACTIVE):
+        self.id = id
+        self.pick_up_floor = pick_up_floor
+        self.destination_floor = destination_floor
+        self.status = status
+
+
+class Car:
+    """
+    an elevator held in memory with its pending calls.
+    pick_up_stops and drop_off_stops are the sorted route plan, waiting, riding and undecided
+    index the calls by the floor they are picked up at, dropped at or (without destination) picked up at.
+    only boarded calls are dropped off, the destination of a waiting call joins the plan when it boards
+    """
+    __slots__ = (
+        'id', 'current_floor', 'next_floor', 'elevator_status', 'door_status', 'is_under_maintainance',
+        'active_request_count', 'boarded_request_count', 'pick_up_stops', 'drop_off_stops',
+        'min_stop_floor', 'max_stop_floor', 'waiting', 'riding', 'undecided',
+    )
+
+    def __init__(
+        self, id, current_floor: int = 0, elevator_status: str = ELEVATOR_STATUS_CHOICES.IDLE, next_floor: int = None,
+        door_status: str = DOOR_STATUS_CHOICES.CLOSED, is_under_maintainance: bool = False,
+    ):
+        self.id = id
+        self.current_floor = current_floor
+        self.next_floor = next_floor
+        self.elevator_status = elevator_status
+        self.door_status = door_status
+        self.is_under_maintainance = is_under_maintainance
+        self.active_request_count = 0
+        self.boarded_request_count = 0
+        self.pick_up_stops = []
+        self.drop_off_stops = []
+        self.min_stop_floor = None
+        self.max_stop_floor = None
+        self.waiting = {}
+        self.riding = {}
+        self.undecided = {}
+
+    @property
+    def request_count(self):
+        return self.active_request_count + self.boarded_request_count
+
+
+def add_stop(stops: list, floor: int):
+    """
+    inserts floor into the sorted stop list unless it is already there
+    """
+    index = bisect_left(stops, floor)
+    if index == len(stops) or stops[index] != floor:
+        stops.insert(index, floor)
+
+def remove_stop(stops: list, floor: int):
+    """
+    removes floor from the sorted stop list if it is there
+    """
+    index = bisect_left(stops, floor)
+    if index < len(stops) and stops[index] == floor:
+        del stops[index]
+
+def has_stop(stops: list, floor: int):
+    """
+    whether floor is in the sorted stop list
+    """
+    index = bisect_left(stops, floor)
+    return index < len(stops) and stops[index] == floor
+
+def set_stop_range(elevator):
+    """
+    sets the lowest and highest stop floor of the elevator from its route plan
+    """
+    ends = [stops[position] for stops in (elevator.pick_up_stops, elevator.drop_off_stops) if stops for position in (0, -1)]
+    elevator.min_stop_floor = min(ends, default=None)
+    elevator.max_stop_floor = max(ends, default=None)
+
+def get_closest_floor(current_floor: int, *floors):
+    """
+    returns the floor closest to current floor ignoring missing ones, the first one wins a tie
+    """
+    closest_floor = None
+    for floor in floors:
+        if floor is not None and (closest_floor is None or abs(floor - current_floor) < abs(closest_floor - current_floor)):
+            closest_floor = floor
+    return closest_floor
+
+def get_next_floor(nearest_floor_above_to_board, nearest_floor_above_to_deboard, nearest_floor_down_to_board, nearest_floor_down_to_deboard, elevator_status: str, current_floor: int):
+    """
+    returns the next floor the elevator will be going to
+    """
+    if elevator_status == ELEVATOR_STATUS_CHOICES.IDLE and nearest_floor_above_to_deboard is None and nearest_floor_down_to_deboard is None:
+        # when elevator was at rest and someone boarded  it can be above or below or both
+        return get_closest_floor(current_floor, nearest_floor_above_to_board, nearest_floor_down_to_board)
+    elif elevator_status == ELEVATOR_STATUS_CHOICES.IDLE:
+        # when elevator was idle and someone boarded at current floor and has to go up or down.
+        return get_closest_floor(current_floor, nearest_floor_above_to_deboard, nearest_floor_down_to_deboard)
+    elif elevator_status == ELEVATOR_STATUS_CHOICES.GOING_UP:
+        # keep going up while someone is there to board/de board above, then turn around
+        if nearest_floor_above_to_board is None and nearest_floor_above_to_deboard is None:
+            return get_closest_floor(current_floor, nearest_floor_down_to_board, nearest_floor_down_to_deboard)
+        return get_closest_floor(current_floor, nearest_floor_above_to_board, nearest_floor_above_to_deboard)
+    else:
+        # case when list is going down we will take all requests which have to board or deboard till none are left in down side
+        if nearest_floor_down_to_board is None and nearest_floor_down_to_deboard is None:
+            return get_closest_floor(current_floor, nearest_floor_above_to_board, nearest_floor_above_to_deboard)
+        return get_closest_floor(current_floor, nearest_floor_down_to_board, nearest_floor_down_to_deboard)
+
+def get_nearest_floors_from_plan(elevator):
+    """
+    returns the nearest floor above to board, above to deboard, below to board and below to deboard
+    out of the route plan of the elevator, None when there is no such floor
+    """
+    def above(stops):
+        index = bisect_right(stops, elevator.current_floor)
+        return stops[index] if index < len(stops) else None
+
+    def below(stops):
+        index = bisect_left(stops, elevator.current_floor)
+        return stops[index - 1] if index else None
+
+    return (
+        above(elevator.pick_up_stops), above(elevator.drop_off_stops),
+        below(elevator.pick_up_stops), below(elevator.drop_off_stops),
+    )
+
+def get_next_floor_from_plan(elevator, elevator_status: str = None):
+    """
+    returns the next floor the elevator will be going to out of its route plan, None when it has no stops
+    """
+    return get_next_floor(
+        *get_nearest_floors_from_plan(elevator), elevator_status or elevator.elevator_status, elevator.current_floor
+    )
+
+def get_dispatch_rank(elevator, pickup_floor: int):
+    """
+    returns the same tier and tie-break ranking as get_elevators_ranked_for_pickup for an in memory elevator
+    having request_count set, lower is better. side_rank is not part of it, see choose_elevator
+    """
+    floor_difference = abs(elevator.current_floor - pickup_floor)
+    if elevator.current_floor == pickup_floor:
+        return (1, elevator.request_count, floor_difference, elevator.id)
+    if elevator.elevator_status == ELEVATOR_STATUS_CHOICES.IDLE:
+        return (2, floor_difference, floor_difference, elevator.id)
+    if (
+        (elevator.current_floor < pickup_floor and elevator.elevator_status == ELEVATOR_STATUS_CHOICES.GOING_UP) or
+        (elevator.current_floor > pickup_floor and elevator.elevator_status == ELEVATOR_STATUS_CHOICES.GOING_DOWN)
+    ):
+        return (3, floor_difference, elevator.request_count, elevator.id)
+    return (4, elevator.request_count, floor_difference, elevator.id)
+
+def choose_elevator(elevators, pickup_floor: int):
+    """
+    returns the most suitable of the elevators and the tier it won with, following the same tiers as
+    get_most_suitable_elevator, None when there are no elevators
+    """
+    if not elevators:
+        return None, None
+
+    ranks = [(get_dispatch_rank(elevator, pickup_floor), elevator) for elevator in elevators]
+    best_tier = min(rank[0] for rank, _ in ranks)
+    candidates = [(rank, elevator) for rank, elevator in ranks if rank[0] == best_tier]
+    if best_tier != 3:
+        return min(candidates, key=lambda candidate: candidate[0])[1], best_tier
+
+    #  nearest elevator below going up against nearest elevator above going down, least requests wins
+    nearest_on_each_side = [
+        min(side, key=lambda candidate: candidate[0])[1]
+        for side in (
+            [candidate for candidate in candidates if candidate[1].current_floor < pickup_floor],
+            [candidate for candidate in candidates if candidate[1].current_floor > pickup_floor],
+        )
+        if side
+    ]
+    return min(
+        nearest_on_each_side, key=lambda elevator: (elevator.request_count, elevator.current_floor > pickup_floor)
+    ), best_tier
+
+def get_elevator_coming_to(elevators, pickup_floor: int):
+    """
+    returns the first of the elevators somebody is already waiting for at the pickup floor, None when there is none
+    """
+    for elevator in elevators:
+        if has_stop(elevator.pick_up_stops, pickup_floor):
+            return elevator
+    return None
+
+def assign_elevator_to_pickup(elevator, pickup_floor: int, systems_max_floor: int):
+    """
+    updates elevator status and next floor for a newly assigned request
+    returns the status the new request should be created with
+    """
+    if elevator.elevator_status == ELEVATOR_STATUS_CHOICES.IDLE:
+        elevator.elevator_status = (
+            ELEVATOR_STATUS_CHOICES.GOING_UP if (
+                pickup_floor >= elevator.current_floor and
+                pickup_floor < systems_max_floor
+            )
+            else ELEVATOR_STATUS_CHOICES.GOING_DOWN
+        )
+        elevator.next_floor = pickup_floor
+
+    # if an eleavtor at same floor was assigned mark the request as boarded
+    if elevator.current_floor == pickup_floor:
+        return REQUEST_STATUS_CHOICES.BOARDED
+    return REQUEST_STATUS_CHOICES.ACTIVE
+
+def index_call(index: dict, stops: list, floor: int, call: Call):
+    calls = index.get(floor)
+    if calls is None:
+        index[floor] = calls = []
+        if stops is not None:
+            add_stop(stops, floor)
+    calls.append(call)
+
+def unindex_call(index: dict, stops: list, floor: int, call: Call):
+    calls = index.get(floor)
+    if calls is None or call not in calls:
+        return
+    calls.remove(call)
+    if not calls:
+        del index[floor]
+        if stops is not None:
+            remove_stop(stops, floor)
+
+def add_call(car: Car, call: Call):
+    """
+    adds a pending call of the car to its counters, route plan and indexes
+    """
+    if call.status == REQUEST_STATUS_CHOICES.ACTIVE:
+        car.active_request_count += 1
+        index_call(car.waiting, car.pick_up_stops, call.pick_up_floor, call)
+    else:
+        car.boarded_request_count += 1
+    if call.destination_floor is None:
+        index_call(car.undecided, None, call.pick_up_floor, call)
+    elif call.status == REQUEST_STATUS_CHOICES.BOARDED:
+        index_call(car.riding, car.drop_off_stops, call.destination_floor, call)
+    set_stop_range(car)
+
+def assign_call(car: Car, call: Call, systems_max_floor: int):
+    """
+    gives a new call to the car the way a request is created, returns the status of the call
+    """
+    call.status = assign_elevator_to_pickup(car, call.pick_up_floor, systems_max_floor)
+    add_call(car, call)
+    return call.status
+
+def set_destination(car: Car, call: Call, destination_floor: int):
+    """
+    a user of the car entered the floor they want to go to
+    """
+    if call.destination_floor is None:
+        unindex_call(car.undecided, None, call.pick_up_floor, call)
+    else:
+        unindex_call(car.riding, car.drop_off_stops, call.destination_floor, call)
+    call.destination_floor = destination_floor
+    if call.status == REQUEST_STATUS_CHOICES.BOARDED:
+        index_call(car.riding, car.drop_off_stops, destination_floor, call)
+    set_stop_range(car)
+
+def board_calls_at(car: Car, floor: int, calls_changed: list):
+    for call in car.waiting.pop(floor, ()):
+        call.status = REQUEST_STATUS_CHOICES.BOARDED
+        car.active_request_count -= 1
+        car.boarded_request_count += 1
+        # a destination entered before boarding joins the route plan once the user is inside
+        if call.destination_floor is not None:
+            index_call(car.riding, car.drop_off_stops, call.destination_floor, call)
+        calls_changed.append(call)
+    remove_stop(car.pick_up_stops, floor)
+
+def move_car(car: Car, parking_stop: int = None):
+    """
+    moves the car to its next floor the same way ElevatorViewSet.perform_move_elevator does,
+    updating the status of the calls it serves. a car without calls moves to parking_stop when given.
+    returns the list of calls whose status changed and a reason when the car could not move
+    """
+    if car.door_status == DOOR_STATUS_CHOICES.OPEN:
+        return [], 'Cannot move the elevator please close the door first'
+    if car.is_under_maintainance:
+        return [], 'Cannot move elevator as it is undermaintainance'
+
+    requests_with_no_destinations = car.undecided.get(car.current_floor)
+    if requests_with_no_destinations:
+        return [], f"Some users have not choosen their destination floor please choose. thier ids are ({','.join(str(call.id) for call in requests_with_no_destinations)})"
+
+    if not car.request_count:
+        car.next_floor = None
+        car.elevator_status = ELEVATOR_STATUS_CHOICES.IDLE
+        if parking_stop is None or parking_stop == car.current_floor:
+            return [], 'There are no request for this elevator'
+        car.current_floor = parking_stop
+        return [], None
+
+    previous_floor = car.current_floor
+    elevator_status = car.elevator_status
+    calls_changed = []
+    next_floor = get_next_floor_from_plan(car)
+    if next_floor is None:
+        #  everyone left is at the current floor, board them and wait here
+        board_calls_at(car, car.current_floor, calls_changed)
+        car.elevator_status = ELEVATOR_STATUS_CHOICES.IDLE
+    else:
+        car.elevator_status = (
+            ELEVATOR_STATUS_CHOICES.GOING_UP if next_floor > car.current_floor
+            else ELEVATOR_STATUS_CHOICES.GOING_DOWN
+        )
+        car.current_floor = next_floor
+        board_calls_at(car, previous_floor, calls_changed)
+        board_calls_at(car, car.current_floor, calls_changed)
+        # only boarded users ride, so only they get off
+        for call in car.riding.pop(car.current_floor, ()):
+            car.boarded_request_count -= 1
+            call.status = REQUEST_STATUS_CHOICES.FULFILLED
+            calls_changed.append(call)
+        remove_stop(car.drop_off_stops, car.current_floor)
+
+    set_stop_range(car)
+    next_floor = get_next_floor_from_plan(car, elevator_status)
+    car.next_floor = None if next_floor == car.current_floor else next_floor
+    # a call may flip from boarded to fulfilled, keep each one once
+    return list({id(call): call for call in calls_changed}.values()), None
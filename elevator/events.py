@@ -0,0 +1,102 @@
+import asyncio
+import json
+import threading
+
+from django.db import transaction
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class EventBroker:
+    """
+    fans events of a system out to the streams subscribed to it in this process.
+    publishing is thread safe, a stream which can not keep up loses its oldest events.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def subscribe(self, system_id: int):
+        """
+        returns a queue receiving the events of the system, must be called from the loop reading it
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.setdefault(system_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, system_id: int, queue):
+        with self.lock:
+            subscribers = self.subscribers.get(system_id, set())
+            subscribers.difference_update({subscriber for subscriber in subscribers if subscriber[1] is queue})
+            if not subscribers:
+                self.subscribers.pop(system_id, None)
+
+    def publish(self, system_id: int, event: dict):
+        with self.lock:
+            subscribers = list(self.subscribers.get(system_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self.put, queue, event)
+            except RuntimeError:
+                # the loop of this stream is already closed
+                self.unsubscribe(system_id, queue)
+
+    @staticmethod
+    def put(queue, event: dict):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+broker = EventBroker()
+
+
+def publish_on_commit(system_id: int, *events):
+    """
+    publishes the events once the surrounding transaction commits, right away outside of one
+    """
+    if events:
+        transaction.on_commit(lambda: [broker.publish(system_id, event) for event in events])
+
+
+def elevator_event(elevator):
+    return {
+        'type': 'elevator',
+        'id': elevator.id,
+        'floor': elevator.current_floor,
+        'next': elevator.next_floor,
+        'status': elevator.elevator_status,
+        'door': elevator.door_status,
+        'maintainance': elevator.is_under_maintainance,
+    }
+
+
+def stop_event(elevator, previous_floor: int):
+    """
+    an elevator reached a floor, requests picked up at either floor are boarded
+    and requests going to the floor are fulfilled
+    """
+    return {
+        'type': 'stop',
+        'elevator': elevator.id,
+        'floor': elevator.current_floor,
+        'boarding_floors': sorted({previous_floor, elevator.current_floor}),
+        'arrival_floor': elevator.current_floor,
+    }
+
+
+def request_event(request):
+    return {
+        'type': 'request',
+        'id': request.id,
+        'elevator': request.elevator_id,
+        'status': request.status,
+        'pick_up_floor': request.pick_up_floor,
+        'destination_floor': request.destination_floor,
+    }
+
+
+def format_server_sent_event(event: dict):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from elevator.models import REQUEST_STATUS_CHOICES
+from elevator.simulation import percentile
+
+# share of the calls a client makes per route, moves enter the destinations of users boarding first
+ROUTE_MIX = {'request-elevator': 40, 'next-floor': 30, 'move-elevator': 20, 'open-close-doors': 10}
+
+
+class RouteStats:
+    """
+    latencies in seconds and response status counts of one route, status 0 is a failed connection
+    """
+    __slots__ = ('latencies', 'statuses')
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+
+    def observe(self, latency: float, status: int):
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def as_dict(self, elapsed: float):
+        count = len(self.latencies)
+        errors = sum(count for status, count in self.statuses.items() if not 200 <= status < 300)
+        return {
+            'requests': count,
+            'throughput': round(count / elapsed, 3),
+            'p50_ms': round(percentile(self.latencies, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(self.latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(self.latencies, 0.99) * 1000, 3),
+            'max_ms': round(max(self.latencies, default=0) * 1000, 3),
+            'error_rate': round(errors / max(1, count), 4),
+            'conflict_rate': round(self.statuses.get(409, 0) / max(1, count), 4),
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+        }
+
+
+class LoadTest:
+    """
+    drives a running server with concurrent asyncio clients calling the elevator apis over HTTP
+    and records the latency and status of every call per route
+    """
+
+    def __init__(self, url: str, clients: int = 50, duration: float = 30, elevators: int = 8, floors: int = 30, seed: int = None):
+        address = urlsplit(url)
+        if address.scheme != 'http':
+            raise ValueError('Only http urls are supported')
+        self.host = address.hostname
+        self.port = address.port or 80
+        self.prefix = address.path.rstrip('/')
+        self.clients = clients
+        self.duration = duration
+        self.elevators_count = elevators
+        self.floors = floors
+        self.rng = random.Random(seed)
+        self.routes = {}
+        self.system_id = None
+        #  elevator id -> floor it was at after its last move, for the elevators requests were given to
+        self.elevator_floors = {}
+        #  elevator id -> {request id: pick up floor} of requests without a destination
+        self.waiting = {}
+
+    async def send(self, method: str, path: str, payload=None):
+        """
+        returns the status and decoded json body of one call, a new connection per call
+        """
+        body = json.dumps(payload).encode() if payload is not None else b''
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(
+                f'{method} {self.prefix}{path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+                f'Content-Type: application/json\r\nAccept: application/json\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        head, _, content = response.partition(b'\r\n\r\n')
+        status = int(head.split(b' ', 2)[1])
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+    async def call(self, route: str, method: str, path: str, payload=None):
+        """
+        sends a call and records it against the route, returns the status and body
+        """
+        started = time.perf_counter()
+        try:
+            status, data = await self.send(method, path, payload)
+        except (OSError, IndexError, ValueError):
+            status, data = 0, None
+        self.routes.setdefault(route, RouteStats()).observe(time.perf_counter() - started, status)
+        return status, data
+
+    async def setup(self):
+        """
+        creates the elevator system the clients use
+        """
+        status, data = await self.send(
+            'POST', '/api/elevatorsystem/',
+            {'name': 'load test', 'elevators_count': self.elevators_count, 'max_floors': self.floors},
+        )
+        if status not in (200, 201):
+            raise RuntimeError(f'Could not create the elevator system ({status}): {data}')
+        self.system_id = data['id']
+
+    async def request_elevator(self, rng):
+        pickup_floor = rng.randrange(self.floors)
+        status, data = await self.call(
+            'request-elevator', 'POST', '/api/elevator/request-elevator/', {'pick_up_floor': pickup_floor, 'system': self.system_id}
+        )
+        if status in (200, 201):
+            # clients learn the elevators from the requests they are given, they all start at the ground floor
+            self.elevator_floors.setdefault(data['elevator'], 0)
+            if data['status'] == REQUEST_STATUS_CHOICES.BOARDED:
+                self.elevator_floors[data['elevator']] = pickup_floor
+            self.waiting.setdefault(data['elevator'], {})[data['id']] = pickup_floor
+
+    async def move_elevator(self, rng, elevator_id: int):
+        current_floor = self.elevator_floors[elevator_id]
+        boarding = [request_id for request_id, floor in self.waiting[elevator_id].items() if floor == current_floor]
+        if boarding:
+            for request_id in boarding:
+                del self.waiting[elevator_id][request_id]
+            await self.call('enter-destinations', 'PATCH', f'/api/elevator/{elevator_id}/enter-destinations', {
+                'destinations': {
+                    request_id: rng.choice([floor for floor in range(self.floors) if floor != current_floor])
+                    for request_id in boarding
+                }
+            })
+        status, data = await self.call('move-elevator', 'PATCH', f'/api/elevator/{elevator_id}/move-elevator', {})
+        if status == 200:
+            self.elevator_floors[elevator_id] = data['current_floor']
+
+    async def client(self, seed: int, deadline: float):
+        rng = random.Random(seed)
+        routes, weights = list(ROUTE_MIX), list(ROUTE_MIX.values())
+        while time.perf_counter() < deadline:
+            route = rng.choices(routes, weights)[0] if self.elevator_floors else 'request-elevator'
+            elevator_id = rng.choice(list(self.elevator_floors or [None]))
+            if route == 'request-elevator':
+                await self.request_elevator(rng)
+            elif route == 'next-floor':
+                await self.call(route, 'GET', f'/api/elevator/{elevator_id}/next-floor')
+            elif route == 'move-elevator':
+                await self.move_elevator(rng, elevator_id)
+            else:
+                # open and close again so the door does not keep the elevator from moving
+                for _ in range(2):
+                    await self.call(route, 'PATCH', f'/api/elevator/{elevator_id}/open-close-doors', {})
+
+    async def run(self):
+        """
+        runs the clients for the duration, returns the report
+        """
+        await self.setup()
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            self.client(self.rng.getrandbits(32), started + self.duration) for _ in range(self.clients)
+        ])
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed: float):
+        requests = sum(len(stats.latencies) for stats in self.routes.values())
+        statuses = {}
+        for stats in self.routes.values():
+            for status, count in stats.statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+        return {
+            'clients': self.clients,
+            'elevators': self.elevators_count,
+            'floors': self.floors,
+            'duration_seconds': round(elapsed, 3),
+            'requests': requests,
+            'throughput': round(requests / elapsed, 3),
+            'error_rate': round(sum(count for status, count in statuses.items() if not 200 <= status < 300) / max(1, requests), 4),
+            'conflict_rate': round(statuses.get(409, 0) / max(1, requests), 4),
+            'routes': {route: stats.as_dict(elapsed) for route, stats in sorted(self.routes.items())},
+        }
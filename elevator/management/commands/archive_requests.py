@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from elevator.utils import archive_fulfilled_requests_batch
+
+
+class Command(BaseCommand):
+    """
+    Moves fulfilled requests out of the Request table into RequestHistory so the table dispatch and moves
+    work on only holds passengers in flight. Meant to be run periodically (cron, a scheduler), each batch is
+    its own short transaction so it can run next to live traffic.
+    """
+    help = 'Archives fulfilled requests to the request history table in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-batches', type=int, default=None, help='stop after this many batches, all by default')
+        parser.add_argument('--sleep', type=float, default=0, help='seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        archived = 0
+        batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            moved = archive_fulfilled_requests_batch(options['batch_size'])
+            if not moved:
+                break
+            archived += moved
+            batches += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(f'{archived} requests archived in {batches} batches')
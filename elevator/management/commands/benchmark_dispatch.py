@@ -0,0 +1,84 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from elevator.dispatch import assign_calls_by_cost, cost_matrix_available
+from elevator.models import ELEVATOR_STATUS_CHOICES, Elevator
+from elevator.simulation import percentile
+from elevator.utils import choose_elevator_for_pickup
+
+
+class Command(BaseCommand):
+    """
+    Times the dispatchers on a batch of calls against a random in memory fleet, nothing touches the database.
+    """
+    help = 'Benchmarks the cost matrix dispatcher against the rule based one for a batch of calls'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--elevators', type=int, default=64)
+        parser.add_argument('--calls', type=int, default=500)
+        parser.add_argument('--floors', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--max-ms', type=float, help='fail when the median cost matrix batch takes longer')
+
+    def handle(self, *args, **options):
+        if not cost_matrix_available():
+            raise CommandError('cost_matrix dispatch needs numpy to be installed')
+
+        rng = random.Random(options['seed'])
+        timings = {'cost_matrix': [], 'rules': []}
+        for _ in range(options['repeat']):
+            calls = [rng.randrange(options['floors']) for _ in range(options['calls'])]
+            timings['cost_matrix'].append(self.time_batch(
+                lambda elevators: assign_calls_by_cost(elevators, calls), self.create_fleet(rng, options)
+            ))
+            timings['rules'].append(self.time_batch(
+                lambda elevators: [self.choose_by_rules(elevators, floor) for floor in calls], self.create_fleet(rng, options)
+            ))
+
+        for dispatcher, batch_timings in timings.items():
+            self.stdout.write(
+                f"{dispatcher:<12} {options['elevators']} cars x {options['calls']} calls  "
+                f"median {percentile(batch_timings, 0.5):.2f}ms  p95 {percentile(batch_timings, 0.95):.2f}ms"
+            )
+        median = percentile(timings['cost_matrix'], 0.5)
+        if options['max_ms'] is not None and median > options['max_ms']:
+            raise CommandError(f"Cost matrix batch took {median:.2f}ms, above {options['max_ms']}ms")
+
+    def create_fleet(self, rng, options):
+        elevators = []
+        for elevator_id in range(options['elevators']):
+            current_floor = rng.randrange(options['floors'])
+            stops = rng.sample(range(options['floors']), rng.randint(0, 6))
+            # users of some stops already boarded, the rest still wait to be picked up
+            drop_off_stops = rng.sample(stops, rng.randint(0, len(stops)))
+            elevators.append(Elevator(
+                id=elevator_id + 1,
+                current_floor=current_floor,
+                elevator_status=rng.choice(list(ELEVATOR_STATUS_CHOICES)) if stops else ELEVATOR_STATUS_CHOICES.IDLE,
+                active_request_count=len(stops),
+                boarded_request_count=len(drop_off_stops),
+                pick_up_stops=sorted(set(stops) - set(drop_off_stops)),
+                drop_off_stops=sorted(drop_off_stops),
+                min_stop_floor=min(stops, default=None),
+                max_stop_floor=max(stops, default=None),
+            ))
+            elevators[-1].request_count = len(stops)
+        return elevators
+
+    @staticmethod
+    def choose_by_rules(elevators, pickup_floor):
+        elevator = choose_elevator_for_pickup(elevators, pickup_floor)
+        elevator.request_count += 1
+        return elevator
+
+    @staticmethod
+    def time_batch(dispatch, elevators):
+        """
+        returns milliseconds dispatch took for the fleet
+        """
+        started = time.perf_counter()
+        dispatch(elevators)
+        return (time.perf_counter() - started) * 1000
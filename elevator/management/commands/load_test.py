@@ -0,0 +1,95 @@
+import asyncio
+import json
+import logging
+
+from django.contrib.staticfiles.handlers import StaticFilesHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.testcases import LiveServerThread
+from django.test.utils import setup_databases, teardown_databases
+
+from elevator.loadtest import LoadTest
+
+
+class Command(BaseCommand):
+    """
+    Load tests the api over HTTP with concurrent clients and writes throughput, latency percentiles and
+    error / conflict rates per route as JSON. Without --url the api is served from this process on throwaway
+    databases created like the test runner's and dropped after the run, the configured databases are never written.
+    """
+    help = 'Drives the elevator apis with concurrent HTTP clients and reports latency per route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='base url of a running server, a local one on a throwaway database is started by default')
+        parser.add_argument('--port', type=int, default=0, help='port of the local server, a free one by default')
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=30, help='seconds to run the clients for')
+        parser.add_argument('--elevators', type=int, default=8)
+        parser.add_argument('--floors', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='file to write the JSON report to, printed by default')
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['duration'] <= 0:
+            raise CommandError('A load test needs at least 1 client and a positive duration')
+        if options['floors'] < 2 or options['elevators'] < 1:
+            raise CommandError('A load test needs at least 2 floors and 1 elevator')
+
+        server = None
+        old_config = None
+        url = options['url']
+        try:
+            if url is None:
+                old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+                server = self.start_server(options['port'])
+                url = f"http://127.0.0.1:{server.port}"
+            load_test = LoadTest(
+                url, clients=options['clients'], duration=options['duration'],
+                elevators=options['elevators'], floors=options['floors'], seed=options['seed'],
+            )
+            report = asyncio.run(load_test.run())
+        except (ValueError, RuntimeError, OSError) as error:
+            raise CommandError(str(error))
+        finally:
+            if server is not None:
+                self.stop_server(server)
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+
+        report['url'] = url
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+            self.stdout.write(f"{report['requests']} calls, {report['throughput']} per second, report written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def start_server(self, port: int):
+        """
+        serves the api from a thread like LiveServerTestCase does, on the databases set up for the run
+        """
+        # an in memory sqlite database only exists on the connection which created it
+        connections_override = {
+            connection.alias: connection for connection in connections.all()
+            if connection.vendor == 'sqlite' and connection.is_in_memory_db()
+        }
+        for connection in connections_override.values():
+            connection.inc_thread_sharing()
+        # the report counts the server errors, a traceback for each would drown the output
+        logging.getLogger('django.request').disabled = True
+        server = LiveServerThread('127.0.0.1', StaticFilesHandler, connections_override, port)
+        server.daemon = True
+        server.start()
+        server.is_ready.wait()
+        if server.error:
+            self.stop_server(server)
+            raise CommandError(f'The server did not start on port {port}: {server.error}')
+        return server
+
+    @staticmethod
+    def stop_server(server):
+        server.terminate()
+        logging.getLogger('django.request').disabled = False
+        for connection in server.connections_override.values():
+            connection.dec_thread_sharing()
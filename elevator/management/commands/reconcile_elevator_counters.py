@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from elevator.cache import invalidate_elevator_cache
+from elevator.models import Elevator
+from elevator.utils import reconcile_request_counters
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the pending request counters kept on the elevators from the requests table.
+    Only needed when requests were changed outside of the api, e.g. by hand in the admin or the shell.
+    """
+    help = 'Rebuilds the active / boarded request counts and stop floors of the elevators from their requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--system', type=int, help='only reconcile the elevators of this system')
+
+    def handle(self, *args, **options):
+        elevators = Elevator.objects.all()
+        if options['system'] is not None:
+            elevators = elevators.filter(system_id=options['system'])
+
+        with transaction.atomic():
+            elevators_corrected = reconcile_request_counters(elevators)
+            invalidate_elevator_cache(*[elevator.id for elevator in elevators_corrected])
+
+        for elevator in elevators_corrected:
+            self.stdout.write(
+                f'elevator {elevator.id}: active {elevator.active_request_count}, boarded {elevator.boarded_request_count}, '
+                f'stops {elevator.min_stop_floor}..{elevator.max_stop_floor}'
+            )
+        self.stdout.write(f'{len(elevators_corrected)} elevators corrected')
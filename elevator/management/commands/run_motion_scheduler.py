@@ -0,0 +1,29 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from elevator.scheduler import MotionScheduler
+
+
+class Command(BaseCommand):
+    """
+    Moves the elevators without anyone calling move-elevator. Run a single instance of it next to the api,
+    elevators are locked while a tick moves them so api calls changing them at the same time are retried.
+    """
+    help = 'Moves every elevator with pending requests by one stop per tick'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=None, help='seconds between ticks, ELEVATOR_SCHEDULER_TICK_SECONDS (1) by default')
+        parser.add_argument('--system', type=int, action='append', help='only move the elevators of this system, can be repeated')
+        parser.add_argument('--ticks', type=int, default=None, help='stop after this many ticks, runs until interrupted by default')
+
+    def handle(self, *args, **options):
+        if options['tick'] is not None and options['tick'] <= 0:
+            raise CommandError('--tick must be positive')
+
+        scheduler = MotionScheduler(options['tick'], options['system'])
+        self.stdout.write(f'moving elevators every {scheduler.tick_seconds} seconds')
+        try:
+            asyncio.run(scheduler.run(options['ticks']))
+        except KeyboardInterrupt:
+            pass
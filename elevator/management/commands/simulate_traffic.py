@@ -0,0 +1,82 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from elevator.dispatch import cost_matrix_available
+from elevator.simulation import TRAFFIC_PATTERNS, TrafficSimulator, generate_traffic
+from system.models import DISPATCH_POLICY_CHOICES, PARKING_POLICY_CHOICES
+
+
+class Command(BaseCommand):
+    """
+    Simulates traffic through the dispatch and move logic and reports wait time, ride time and query counts.
+    Everything runs in a transaction which is rolled back at the end unless --keep is passed.
+    """
+    help = 'Runs a traffic simulation against a fresh elevator system and reports service and performance metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pattern', choices=TRAFFIC_PATTERNS, default='inter-floor')
+        parser.add_argument('--trace', help='JSONL trace file, required for the trace pattern')
+        parser.add_argument('--elevators', type=int, default=4)
+        parser.add_argument('--floors', type=int, default=20)
+        parser.add_argument('--duration', type=int, default=600, help='seconds of simulated arrivals')
+        parser.add_argument('--rate', type=float, default=30, help='new passengers per minute')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--max-time', type=int, default=None, help='simulated seconds after which the run stops')
+        parser.add_argument('--floor-travel-time', type=int, default=2)
+        parser.add_argument('--door-time', type=int, default=6)
+        parser.add_argument('--dispatch', choices=DISPATCH_POLICY_CHOICES, default=DISPATCH_POLICY_CHOICES.RULES)
+        parser.add_argument('--parking', choices=PARKING_POLICY_CHOICES, default=PARKING_POLICY_CHOICES.STAY)
+        parser.add_argument('--json', action='store_true', help='print the report as JSON')
+        parser.add_argument('--keep', action='store_true', help='keep the simulated system in the database')
+        parser.add_argument('--max-average-wait', type=float, help='fail when the average wait is higher')
+        parser.add_argument('--max-queries-per-operation', type=float, help='fail when an operation averages more queries')
+
+    def handle(self, *args, **options):
+        if options['pattern'] == 'trace' and not options['trace']:
+            raise CommandError('--trace is required for the trace pattern')
+        if options['floors'] < 2 or options['elevators'] < 1:
+            raise CommandError('A simulation needs at least 2 floors and 1 elevator')
+        if options['dispatch'] == DISPATCH_POLICY_CHOICES.COST_MATRIX and not cost_matrix_available():
+            raise CommandError('cost_matrix dispatch needs numpy to be installed')
+
+        passengers = generate_traffic(
+            options['pattern'], options['floors'], options['duration'], options['rate'],
+            seed=options['seed'], trace_path=options['trace'],
+        )
+        max_time = options['max_time'] or options['duration'] * 10
+        with transaction.atomic():
+            simulator = TrafficSimulator(
+                options['elevators'], options['floors'],
+                floor_travel_time=options['floor_travel_time'], door_time=options['door_time'],
+                dispatch_policy=options['dispatch'], parking_policy=options['parking'],
+            )
+            report = simulator.run(passengers, max_time)
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report.as_dict(), indent=2))
+        else:
+            self.write_report(report)
+        self.check_thresholds(report, options)
+
+    def write_report(self, report):
+        self.stdout.write(f"passengers served      {report.served}/{report.passengers}")
+        self.stdout.write(f"wait time avg / p95    {report.average_wait:.1f}s / {report.p95_wait}s")
+        self.stdout.write(f"ride time avg / p95    {report.average_ride:.1f}s / {report.p95_ride}s")
+        self.stdout.write(f"stops per car          {report.stops_per_car:.1f}")
+        self.stdout.write(f"queries per request    {report.queries_per_request:.2f}")
+        self.stdout.write(f"queries per move       {report.queries_per_move:.2f}")
+        self.stdout.write(f"operations per second  {report.operations_per_second:.0f} ({report.operations} in {report.wall_clock_seconds:.2f}s)")
+
+    def check_thresholds(self, report, options):
+        if options['max_average_wait'] is not None and report.average_wait > options['max_average_wait']:
+            raise CommandError(f'Average wait {report.average_wait:.1f}s is above {options["max_average_wait"]}s')
+        if options['max_queries_per_operation'] is not None and max(
+            report.queries_per_request, report.queries_per_move
+        ) > options['max_queries_per_operation']:
+            raise CommandError(f'Operations average more than {options["max_queries_per_operation"]} queries')
+        if report.served < report.passengers:
+            raise CommandError(f'Only {report.served} of {report.passengers} passengers were served')
@@ -0,0 +1,163 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+DISPATCH_TIERS = {1: 'same_floor', 2: 'idle_nearest', 3: 'approaching', 4: 'fallback', 5: 'cost_matrix', 6: 'coalesced'}
+
+
+class Histogram:
+    """
+    cumulative histogram with fixed buckets so its memory does not grow with traffic
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # last slot counts the observations above the highest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str):
+        lines = []
+        cumulative = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bucket}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    in process store of api and dispatch metrics.
+    label sets are bounded by the number of viewset actions, status classes and dispatch tiers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.latency = {}
+        self.query_counts = {}
+        self.db_time = {}
+        self.responses = {}
+        self.dispatch_tiers = {}
+
+    def observe_request(self, viewset: str, action: str, duration: float, queries: int, db_time: float, status_code: int):
+        key = (viewset, action)
+        response_key = (viewset, action, f'{status_code // 100}xx')
+        with self.lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.query_counts[key] = Histogram(QUERY_COUNT_BUCKETS)
+                self.db_time[key] = 0
+            self.latency[key].observe(duration)
+            self.query_counts[key].observe(queries)
+            self.db_time[key] += db_time
+            self.responses[response_key] = self.responses.get(response_key, 0) + 1
+
+    def record_dispatch_tier(self, tier: int, count: int = 1):
+        name = DISPATCH_TIERS.get(tier, 'fallback')
+        with self.lock:
+            self.dispatch_tiers[name] = self.dispatch_tiers.get(name, 0) + count
+
+    def render(self):
+        """
+        returns all metrics in the prometheus text exposition format
+        """
+        with self.lock:
+            lines = [
+                '# HELP elevator_api_request_duration_seconds Time spent handling an api action.',
+                '# TYPE elevator_api_request_duration_seconds histogram',
+            ]
+            for (viewset, action), histogram in sorted(self.latency.items()):
+                lines.extend(histogram.render('elevator_api_request_duration_seconds', f'viewset="{viewset}",action="{action}"'))
+            lines.extend([
+                '# HELP elevator_api_db_queries SQL statements executed per api action.',
+                '# TYPE elevator_api_db_queries histogram',
+            ])
+            for (viewset, action), histogram in sorted(self.query_counts.items()):
+                lines.extend(histogram.render('elevator_api_db_queries', f'viewset="{viewset}",action="{action}"'))
+            lines.extend([
+                '# HELP elevator_api_db_duration_seconds_total Time spent in the database per api action.',
+                '# TYPE elevator_api_db_duration_seconds_total counter',
+            ])
+            for (viewset, action), db_time in sorted(self.db_time.items()):
+                lines.append(f'elevator_api_db_duration_seconds_total{{viewset="{viewset}",action="{action}"}} {db_time}')
+            lines.extend([
+                '# HELP elevator_api_responses_total Responses per api action and status class.',
+                '# TYPE elevator_api_responses_total counter',
+            ])
+            for (viewset, action, status), count in sorted(self.responses.items()):
+                lines.append(f'elevator_api_responses_total{{viewset="{viewset}",action="{action}",status="{status}"}} {count}')
+            lines.extend([
+                '# HELP elevator_dispatch_tier_total Elevator assignments per dispatch tier that won.',
+                '# TYPE elevator_dispatch_tier_total counter',
+            ])
+            for tier, count in sorted(self.dispatch_tiers.items()):
+                lines.append(f'elevator_dispatch_tier_total{{tier="{tier}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def metrics_enabled():
+    return getattr(settings, 'ELEVATOR_METRICS_ENABLED', True)
+
+
+class QueryCounter:
+    """
+    database execute wrapper counting statements and the time spent running them
+    """
+    __slots__ = ('queries', 'duration')
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.queries += 1
+
+
+class InstrumentedViewSetMixin:
+    """
+    records latency, query count and db time of every action of a viewset
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not metrics_enabled():
+            return super().dispatch(request, *args, **kwargs)
+
+        query_counter = QueryCounter()
+        started = time.perf_counter()
+        # every alias is counted, read only actions may be routed to the read database
+        with ExitStack() as stack:
+            for alias_connection in connections.all():
+                stack.enter_context(alias_connection.execute_wrapper(query_counter))
+            response = super().dispatch(request, *args, **kwargs)
+        registry.observe_request(
+            type(self).__name__, getattr(self, 'action', None) or request.method.lower(),
+            time.perf_counter() - started, query_counter.queries, query_counter.duration, response.status_code,
+        )
+        return response
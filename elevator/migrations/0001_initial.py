@@ -19,8 +19,8 @@ class Migration(migrations.Migration):
                 ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
                 ('current_floor', models.PositiveIntegerField(default=0)),
                 ('is_under_maintainance', models.BooleanField(default=False)),
-                ('door_status', models.CharField(choices=[('Open', 'Open'), ('closed', 'closed')], default='Closed')),
-                ('elevator_status', models.CharField(choices=[('Going_up', 'Going_up'), ('Going_down', 'Going_down'), ('Halt', 'Halt')], default='Halt')),
+                ('door_status', models.CharField(choices=[('Open', 'Open'), ('closed', 'closed')], default='Closed', max_length=20)),
+                ('elevator_status', models.CharField(choices=[('Going_up', 'Going_up'), ('Going_down', 'Going_down'), ('Halt', 'Halt')], default='Halt', max_length=20)),
                 ('system', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='system.system')),
             ],
         ),
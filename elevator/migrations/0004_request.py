@@ -17,7 +17,7 @@ class Migration(migrations.Migration):
                 ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
                 ('pick_up_floor', models.BigIntegerField()),
                 ('destination_floor', models.BigIntegerField()),
-                ('status', models.CharField(choices=[('Active', 'Active'), ('Fulfilled', 'Fulfilled')], default='Active')),
+                ('status', models.CharField(choices=[('Active', 'Active'), ('Fulfilled', 'Fulfilled')], default='Active', max_length=20)),
                 ('elevator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='elevator.elevator')),
             ],
         ),
@@ -13,7 +13,7 @@ class Migration(migrations.Migration):
         migrations.AlterField(
             model_name='elevator',
             name='elevator_status',
-            field=models.CharField(choices=[('Going_up', 'Going_up'), ('Going_down', 'Going_down'), ('Idle', 'Idle')], default='Idle'),
+            field=models.CharField(choices=[('Going_up', 'Going_up'), ('Going_down', 'Going_down'), ('Idle', 'Idle')], default='Idle', max_length=20),
         ),
         migrations.AlterField(
             model_name='elevator',
@@ -13,6 +13,6 @@ class Migration(migrations.Migration):
         migrations.AlterField(
             model_name='elevator',
             name='door_status',
-            field=models.CharField(choices=[('Open', 'Open'), ('Closed', 'Closed')], default='Closed'),
+            field=models.CharField(choices=[('Open', 'Open'), ('Closed', 'Closed')], default='Closed', max_length=20),
         ),
     ]
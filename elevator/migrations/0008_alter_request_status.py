@@ -13,6 +13,6 @@ class Migration(migrations.Migration):
         migrations.AlterField(
             model_name='request',
             name='status',
-            field=models.CharField(choices=[('Active', 'Active'), ('Boarded', 'Boarded'), ('Fulfilled', 'Fulfilled')], default='Active'),
+            field=models.CharField(choices=[('Active', 'Active'), ('Boarded', 'Boarded'), ('Fulfilled', 'Fulfilled')], default='Active', max_length=20),
         ),
     ]
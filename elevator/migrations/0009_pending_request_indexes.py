@@ -0,0 +1,25 @@
+# Generated by Django 4.2.3 on 2026-10-18 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevator', '0008_alter_request_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='elevator',
+            index=models.Index(fields=['system', 'is_under_maintainance', 'current_floor'], name='elevator_system_dispatch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['elevator', 'status', 'pick_up_floor', 'destination_floor'], name='request_pending_pickup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['elevator', 'status', 'destination_floor'], name='request_pending_dest_idx'),
+        ),
+    ]
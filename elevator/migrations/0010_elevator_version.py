@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevator', '0009_pending_request_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='elevator',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+def fill_request_counters(apps, schema_editor):
+    Elevator = apps.get_model('elevator', 'Elevator')
+    Request = apps.get_model('elevator', 'Request')
+    elevators = {elevator.id: elevator for elevator in Elevator.objects.all()}
+    # requests without an elevator are not counted anywhere
+    for request in Request.objects.filter(status__in=['Active', 'Boarded'], elevator__isnull=False):
+        elevator = elevators[request.elevator_id]
+        if request.status == 'Active':
+            elevator.active_request_count += 1
+            stop_floor = request.pick_up_floor
+        else:
+            elevator.boarded_request_count += 1
+            stop_floor = request.destination_floor
+        if stop_floor is not None:
+            elevator.min_stop_floor = stop_floor if elevator.min_stop_floor is None else min(elevator.min_stop_floor, stop_floor)
+            elevator.max_stop_floor = stop_floor if elevator.max_stop_floor is None else max(elevator.max_stop_floor, stop_floor)
+    Elevator.objects.bulk_update(
+        elevators.values(), ['active_request_count', 'boarded_request_count', 'min_stop_floor', 'max_stop_floor']
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevator', '0010_elevator_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='elevator',
+            name='active_request_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='elevator',
+            name='boarded_request_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='elevator',
+            name='max_stop_floor',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='elevator',
+            name='min_stop_floor',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(fill_request_counters, migrations.RunPython.noop),
+    ]
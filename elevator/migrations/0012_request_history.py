@@ -0,0 +1,30 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0001_initial'),
+        ('elevator', '0011_elevator_request_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('request_id', models.BigIntegerField(unique=True)),
+                ('pick_up_floor', models.BigIntegerField()),
+                ('destination_floor', models.BigIntegerField(null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('elevator', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='elevator.elevator')),
+                ('system', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='system.system')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['system', 'archived_at'], name='request_history_system_idx')],
+            },
+        ),
+    ]
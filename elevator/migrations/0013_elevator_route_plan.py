@@ -0,0 +1,47 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:32
+
+from django.db import migrations, models
+
+
+def fill_route_plans(apps, schema_editor):
+    Elevator = apps.get_model('elevator', 'Elevator')
+    Request = apps.get_model('elevator', 'Request')
+    elevators = {elevator.id: elevator for elevator in Elevator.objects.all()}
+    pick_up_stops = {elevator_id: set() for elevator_id in elevators}
+    drop_off_stops = {elevator_id: set() for elevator_id in elevators}
+    # only boarded users are dropped off, the same plan set_request_counters_in_memory builds
+    for request in Request.objects.filter(status__in=['Active', 'Boarded'], elevator__isnull=False):
+        if request.status == 'Active':
+            pick_up_stops[request.elevator_id].add(request.pick_up_floor)
+        elif request.destination_floor is not None:
+            drop_off_stops[request.elevator_id].add(request.destination_floor)
+    for elevator_id, elevator in elevators.items():
+        elevator.pick_up_stops = sorted(pick_up_stops[elevator_id])
+        elevator.drop_off_stops = sorted(drop_off_stops[elevator_id])
+        stops = elevator.pick_up_stops + elevator.drop_off_stops
+        elevator.min_stop_floor = min(stops, default=None)
+        elevator.max_stop_floor = max(stops, default=None)
+    Elevator.objects.bulk_update(
+        elevators.values(), ['pick_up_stops', 'drop_off_stops', 'min_stop_floor', 'max_stop_floor']
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevator', '0012_request_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='elevator',
+            name='drop_off_stops',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='elevator',
+            name='pick_up_stops',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(fill_route_plans, migrations.RunPython.noop),
+    ]
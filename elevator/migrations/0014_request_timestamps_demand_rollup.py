@@ -0,0 +1,64 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0002_system_dispatch_policy'),
+        ('elevator', '0013_elevator_route_plan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='boarded_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='fulfilled_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='boarded_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='fulfilled_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.CreateModel(
+            name='DemandRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('floor', models.BigIntegerField()),
+                ('direction', models.CharField(choices=[('Up', 'Up'), ('Down', 'Down'), ('Unknown', 'Unknown')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('requests_count', models.PositiveIntegerField(default=0)),
+                ('trips_count', models.PositiveIntegerField(default=0)),
+                ('wait_seconds', models.FloatField(default=0)),
+                ('ride_seconds', models.FloatField(default=0)),
+                ('system', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='system.system')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='demandrollup',
+            constraint=models.UniqueConstraint(fields=('system', 'bucket', 'floor', 'direction'), name='demand_rollup_bucket_uniq'),
+        ),
+    ]
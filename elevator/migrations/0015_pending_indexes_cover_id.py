@@ -0,0 +1,29 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevator', '0014_request_timestamps_demand_rollup'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='elevator',
+            name='elevator_system_dispatch_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='request',
+            name='request_pending_pickup_idx',
+        ),
+        migrations.AddIndex(
+            model_name='elevator',
+            index=models.Index(fields=['system', 'is_under_maintainance', 'current_floor', 'id'], name='elevator_system_dispatch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['elevator', 'status', 'pick_up_floor', 'destination_floor', 'id'], name='request_pending_pickup_idx'),
+        ),
+    ]
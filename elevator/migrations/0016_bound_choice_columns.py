@@ -0,0 +1,30 @@
+# Generated by Django 4.2.3 on 2026-10-18 22:20
+
+from django.db import migrations
+
+CHOICE_COLUMNS = [('Elevator', 'door_status'), ('Elevator', 'elevator_status'), ('Request', 'status')]
+
+
+def bound_choice_columns(apps, schema_editor):
+    # the earlier migrations created these columns without a max_length, which only postgres accepts.
+    # they were given max_length=20 so the tables can be created on sqlite, databases migrated before
+    # that still have unbounded columns and are brought in line here
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name, field_name in CHOICE_COLUMNS:
+        model = apps.get_model('elevator', model_name)
+        schema_editor.execute(
+            f'ALTER TABLE {schema_editor.quote_name(model._meta.db_table)} '
+            f'ALTER COLUMN {schema_editor.quote_name(model._meta.get_field(field_name).column)} TYPE varchar(20)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevator', '0015_pending_indexes_cover_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(bound_choice_columns, migrations.RunPython.noop),
+    ]
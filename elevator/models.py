@@ -1,14 +1,17 @@
 from collections import namedtuple
 from django.db import models
+from django.utils import timezone
 from system.models import System
 
 RequestStatusChoices = namedtuple('RequestStatusChoices', ['ACTIVE', 'BOARDED', 'FULFILLED'])
 DoorStatusChoices = namedtuple('DoorStatusChoices', ['OPEN', 'CLOSED'])
 ElevatorStatusChoices = namedtuple('ElevatorStatusChoices', ['GOING_UP', 'GOING_DOWN', 'IDLE'])
+TripDirectionChoices = namedtuple('TripDirectionChoices', ['UP', 'DOWN', 'UNKNOWN'])
 
 DOOR_STATUS_CHOICES = DoorStatusChoices(OPEN='Open', CLOSED='Closed')
 ELEVATOR_STATUS_CHOICES = ElevatorStatusChoices(GOING_UP='Going_up', GOING_DOWN='Going_down', IDLE='Idle')
 REQUEST_STATUS_CHOICES = RequestStatusChoices(ACTIVE='Active', BOARDED='Boarded', FULFILLED='Fulfilled')
+TRIP_DIRECTION_CHOICES = TripDirectionChoices(UP='Up', DOWN='Down', UNKNOWN='Unknown')
 
 
 class Elevator(models.Model):
@@ -27,8 +30,26 @@ class Elevator(models.Model):
     current_floor = models.PositiveIntegerField(default=0)
     next_floor = models.PositiveIntegerField(null=True)
     is_under_maintainance = models.BooleanField(default=False)
-    door_status = models.CharField(choices=door_status_choices, default=DOOR_STATUS_CHOICES.CLOSED)
-    elevator_status = models.CharField(choices=elevator_status_choices, default=ELEVATOR_STATUS_CHOICES.IDLE)
+    door_status = models.CharField(max_length=20, choices=door_status_choices, default=DOOR_STATUS_CHOICES.CLOSED)
+    elevator_status = models.CharField(max_length=20, choices=elevator_status_choices, default=ELEVATOR_STATUS_CHOICES.IDLE)
+    # bumped on every write so concurrent calls can detect they read a stale elevator
+    version = models.PositiveIntegerField(default=0)
+    # maintained with every request change so dispatch does not have to count requests,
+    # rebuilt from the requests by the reconcile_elevator_counters command
+    active_request_count = models.PositiveIntegerField(default=0)
+    boarded_request_count = models.PositiveIntegerField(default=0)
+    min_stop_floor = models.BigIntegerField(null=True)
+    max_stop_floor = models.BigIntegerField(null=True)
+    # route plan, sorted distinct floors with users waiting to be picked up and floors users want to go to
+    pick_up_stops = models.JSONField(default=list)
+    drop_off_stops = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [
+            # dispatch only looks at available elevators of one system, the trailing id lets postgres
+            # answer id lookups from the index alone as sqlite does with its rowid
+            models.Index(fields=['system', 'is_under_maintainance', 'current_floor', 'id'], name='elevator_system_dispatch_idx'),
+        ]
 
 
 class Request(models.Model):
@@ -41,5 +62,66 @@ class Request(models.Model):
     pick_up_floor = models.BigIntegerField()
     destination_floor = models.BigIntegerField(null=True)
     elevator = models.ForeignKey(Elevator, on_delete=models.CASCADE, null=True) 
-    status = models.CharField(choices=STATUS_CHOICES, default=REQUEST_STATUS_CHOICES.ACTIVE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=REQUEST_STATUS_CHOICES.ACTIVE)
+    created_at = models.DateTimeField(default=timezone.now)
+    boarded_at = models.DateTimeField(null=True)
+    fulfilled_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # hot queries filter by elevator and pending status and then by a floor range. full rather than partial
+            # indexes on the pending statuses: status is the second key so pending lookups never read the fulfilled
+            # entries on any backend, archive_requests keeps the fulfilled rows few, and sqlite can not match a
+            # partial index predicate against the bound status parameters of these queries
+            models.Index(
+                fields=['elevator', 'status', 'pick_up_floor', 'destination_floor', 'id'], name='request_pending_pickup_idx'
+            ),
+            models.Index(fields=['elevator', 'status', 'destination_floor'], name='request_pending_dest_idx'),
+        ]
+
+
+class RequestHistory(models.Model):
+    """
+    Fulfilled request moved out of the Request table by the archive_requests command
+    """
+    request_id = models.BigIntegerField(unique=True)
+    pick_up_floor = models.BigIntegerField()
+    destination_floor = models.BigIntegerField(null=True)
+    # history outlives the elevators and systems it was served by
+    elevator = models.ForeignKey(Elevator, on_delete=models.SET_NULL, null=True)
+    system = models.ForeignKey(System, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(null=True)
+    boarded_at = models.DateTimeField(null=True)
+    fulfilled_at = models.DateTimeField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['system', 'archived_at'], name='request_history_system_idx'),
+        ]
+
+
+class DemandRollup(models.Model):
+    """
+    Requests and trips of a system per pick up floor, direction and 5 minute bucket of the time the requests
+    were made, counted in the transaction creating / fulfilling the requests so reports never read Request.
+    a request is counted under Unknown when made as its destination is not known yet, its trip under
+    Up / Down when it is fulfilled
+    """
+    DIRECTION_CHOICES = [
+        (getattr(TRIP_DIRECTION_CHOICES, attr), attr.capitalize()) for attr in TRIP_DIRECTION_CHOICES._fields
+    ]
+    system = models.ForeignKey(System, on_delete=models.CASCADE)
+    floor = models.BigIntegerField()
+    direction = models.CharField(choices=DIRECTION_CHOICES, max_length=10)
+    bucket = models.DateTimeField()
+    requests_count = models.PositiveIntegerField(default=0)
+    trips_count = models.PositiveIntegerField(default=0)
+    # sums over the trips, seconds from request to boarding and from boarding to the destination
+    wait_seconds = models.FloatField(default=0)
+    ride_seconds = models.FloatField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['system', 'bucket', 'floor', 'direction'], name='demand_rollup_bucket_uniq'),
+        ]
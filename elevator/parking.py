@@ -0,0 +1,129 @@
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from elevator.models import DemandRollup, Elevator
+from system.models import PARKING_POLICY_CHOICES
+
+# a call weighs less than a thousandth after ten half lives, older buckets are not read
+DEMAND_HALF_LIVES = 10
+
+
+def get_parking_half_life_seconds():
+    return getattr(settings, 'ELEVATOR_PARKING_HALF_LIFE_SECONDS', 900)
+
+
+def get_parking_hop_floors():
+    return getattr(settings, 'ELEVATOR_PARKING_HOP_FLOORS', 3)
+
+
+def get_demand_weights(system_ids, now=None):
+    """
+    returns the weight of every floor with calls per system, read from the demand rollups so the api processes
+    and the scheduler see the same demand. the calls of a bucket weigh half as much after each half life from its start
+    """
+    now = timezone.now() if now is None else now
+    half_life = get_parking_half_life_seconds()
+    weights_by_system = {system_id: {} for system_id in system_ids}
+    for system_id, floor, bucket, requests_count in DemandRollup.objects.filter(
+        system_id__in=list(weights_by_system), requests_count__gt=0,
+        bucket__gt=now - timedelta(seconds=half_life * DEMAND_HALF_LIVES),
+    ).values_list('system_id', 'floor', 'bucket', 'requests_count'):
+        weights = weights_by_system[system_id]
+        weights[floor] = weights.get(floor, 0) + requests_count * 0.5 ** (max(0, (now - bucket).total_seconds()) / half_life)
+    return weights_by_system
+
+
+def get_parking_floors(weights: dict, count: int):
+    """
+    returns up to count floors, sorted, minimizing the weighted distance from the calls of the histogram to
+    their nearest floor (k-median on a line, each floor serves a run of neighbouring floors).
+    fewer floors come back when there are fewer floors with demand than elevators
+    """
+    floors = sorted(floor for floor, weight in weights.items() if weight > 0)
+    count = min(count, len(floors))
+    if not count:
+        return []
+    # prefix sums of weight and weight * floor so the cost of a run of floors served from its median is O(log n)
+    prefix_weight, prefix_moment = [0], [0]
+    for floor in floors:
+        prefix_weight.append(prefix_weight[-1] + weights[floor])
+        prefix_moment.append(prefix_moment[-1] + weights[floor] * floor)
+
+    def serve(start, end):
+        """
+        returns the cost and the median of floors[start:end]
+        """
+        half = (prefix_weight[start] + prefix_weight[end]) / 2
+        median = min(bisect_left(prefix_weight, half, start + 1, end + 1) - 1, end - 1)
+        floor = floors[median]
+        below = floor * (prefix_weight[median + 1] - prefix_weight[start]) - (prefix_moment[median + 1] - prefix_moment[start])
+        above = (prefix_moment[end] - prefix_moment[median + 1]) - floor * (prefix_weight[end] - prefix_weight[median + 1])
+        return below + above, floor
+
+    # best[j][end] is the cost of serving floors[:end] from j + 1 parking floors, split[j][end] where its last run starts
+    best = [[serve(0, end)[0] for end in range(len(floors) + 1)]]
+    split = [[0] * (len(floors) + 1)]
+    for j in range(1, count):
+        best.append([0] * (len(floors) + 1))
+        split.append([0] * (len(floors) + 1))
+        for end in range(j + 1, len(floors) + 1):
+            best[j][end], split[j][end] = min(
+                (best[j - 1][start] + serve(start, end)[0], start) for start in range(j, end)
+            )
+    parking_floors = []
+    end = len(floors)
+    for j in range(count - 1, -1, -1):
+        start = split[j][end]
+        parking_floors.append(serve(start, end)[1])
+        end = start
+    return sorted(parking_floors)
+
+
+def assign_parking_floors(weights: dict, idle_floors: dict):
+    """
+    returns the parking floor of the idle elevators which got one by elevator id, idle_floors has the current floor
+    of every idle elevator of the system. each parking floor, busiest first, takes the nearest idle elevator
+    """
+    idle_floors = dict(idle_floors)
+    parking_floors = {}
+    for parking_floor in sorted(get_parking_floors(weights, len(idle_floors)), key=lambda floor: (-weights[floor], floor)):
+        nearest = min(idle_floors, key=lambda elevator_id: (abs(idle_floors[elevator_id] - parking_floor), elevator_id))
+        parking_floors[nearest] = parking_floor
+        del idle_floors[nearest]
+    return parking_floors
+
+
+def get_parking_stops(elevators):
+    """
+    returns the floor each idle elevator of a system parking predictively moves to next by elevator id,
+    elevators at their parking floor or without one are left out.
+    a parking elevator moves a few floors at a time so it stays close to where it really is for dispatch
+    """
+    idle_elevators = {
+        elevator.id: elevator for elevator in elevators
+        if not elevator.active_request_count and not elevator.boarded_request_count and not elevator.is_under_maintainance
+    }
+    if not idle_elevators:
+        return {}
+    idle_floors_by_system = {}
+    for elevator_id, system_id, current_floor in Elevator.objects.filter(
+        system_id__in={elevator.system_id for elevator in idle_elevators.values()},
+        system__parking_policy=PARKING_POLICY_CHOICES.PREDICTIVE,
+        is_under_maintainance=False, active_request_count=0, boarded_request_count=0,
+    ).values_list('id', 'system_id', 'current_floor'):
+        elevator = idle_elevators.get(elevator_id)
+        idle_floors_by_system.setdefault(system_id, {})[elevator_id] = current_floor if elevator is None else elevator.current_floor
+    if not idle_floors_by_system:
+        return {}
+
+    hop = get_parking_hop_floors()
+    parking_stops = {}
+    for system_id, weights in get_demand_weights(idle_floors_by_system).items():
+        for elevator_id, parking_floor in assign_parking_floors(weights, idle_floors_by_system[system_id]).items():
+            elevator = idle_elevators.get(elevator_id)
+            if elevator is not None and parking_floor != elevator.current_floor:
+                parking_stops[elevator_id] = elevator.current_floor + max(-hop, min(hop, parking_floor - elevator.current_floor))
+    return parking_stops
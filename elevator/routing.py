@@ -0,0 +1,85 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+READ_YOUR_WRITES_COOKIE = 'elevator_wrote'
+WRITTEN = 'written'
+
+#  database alias the reads of the running action go to, None for default
+read_database = ContextVar('read_database', default=None)
+
+
+def get_read_database():
+    """
+    returns the alias read only actions are served from, None when reads are not split off the primary
+    """
+    return getattr(settings, 'ELEVATOR_READ_DATABASE', None)
+
+
+def get_read_your_writes_seconds():
+    return getattr(settings, 'ELEVATOR_READ_YOUR_WRITES_SECONDS', 5)
+
+
+def mark_elevators_written(*elevator_ids):
+    """
+    keeps the reads of the elevators on the primary until the read database caught up with their last change
+    """
+    if get_read_database() and elevator_ids:
+        cache.set_many(
+            {f'elevator:{elevator_id}:{WRITTEN}': True for elevator_id in elevator_ids}, get_read_your_writes_seconds()
+        )
+
+
+def elevator_recently_written(elevator_id: int):
+    return cache.get(f'elevator:{elevator_id}:{WRITTEN}', False)
+
+
+class ReadReplicaRouter:
+    """
+    sends the reads of actions tagged read only to the read database, all writes to default
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the read database is a copy of default
+        return True
+
+
+class ReadReplicaViewSetMixin:
+    """
+    serves the actions listed in read_actions from the read database, a client which changed something
+    is served from the primary for ELEVATOR_READ_YOUR_WRITES_SECONDS so it reads its own writes
+    """
+    read_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        token = read_database.set(self.get_read_database(request, kwargs))
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        finally:
+            read_database.reset(token)
+        if get_read_database() and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(READ_YOUR_WRITES_COOKIE, '1', max_age=get_read_your_writes_seconds())
+        return response
+
+    def get_read_database(self, request, kwargs):
+        alias = get_read_database()
+        if alias is None or self.action_map.get(request.method.lower()) not in self.read_actions:
+            return None
+        if READ_YOUR_WRITES_COOKIE in request.COOKIES or self.written_recently(kwargs):
+            return None
+        return alias
+
+    def written_recently(self, kwargs):
+        """
+        whether what the action reads was changed too recently for the read database to have it
+        """
+        return False
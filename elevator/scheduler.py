@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from elevator.analytics import record_requests_fulfilled
+from elevator.cache import invalidate_elevator_cache
+from elevator.dispatch import get_dispatch_timings
+from elevator.engine import move_car
+from elevator.events import elevator_event, publish_on_commit, request_event, stop_event
+from elevator.models import DOOR_STATUS_CHOICES, ELEVATOR_STATUS_CHOICES, REQUEST_STATUS_CHOICES, Elevator, Request
+from elevator.parking import get_parking_stops
+from elevator.utils import (
+    PENDING_REQUEST_FIELDS, REQUEST_STATUS_FIELDS, apply_calls_to_requests, apply_car_to_elevator, car_from_elevator
+)
+from system.models import PARKING_POLICY_CHOICES
+
+
+class MotionScheduler:
+    """
+    moves the elevators of all systems on its own, every tick each elevator with work to do which is not
+    under maintainance, has its door closed and is not still travelling or dwelling at its last stop moves one stop,
+    idle elevators of systems parking predictively move towards their parking floor.
+    all changes of a tick are written in one transaction with a fixed number of queries.
+    """
+
+    def __init__(self, tick_seconds: float = None, system_ids=None):
+        self.tick_seconds = tick_seconds or getattr(settings, 'ELEVATOR_SCHEDULER_TICK_SECONDS', 1)
+        self.system_ids = system_ids
+        self.floor_seconds, self.stop_seconds = get_dispatch_timings()
+        #  elevator id -> monotonic time it is done travelling to and dwelling at its last stop
+        self.busy_until = {}
+
+    def get_movable_elevators(self):
+        elevators = Elevator.objects.filter(
+            Q(active_request_count__gt=0) | Q(boarded_request_count__gt=0) | ~Q(elevator_status=ELEVATOR_STATUS_CHOICES.IDLE)
+            | Q(system__parking_policy=PARKING_POLICY_CHOICES.PREDICTIVE),
+            is_under_maintainance=False,
+            door_status=DOOR_STATUS_CHOICES.CLOSED,
+        ).exclude(id__in=list(self.busy_until))
+        if self.system_ids:
+            elevators = elevators.filter(system_id__in=self.system_ids)
+        # an elevator locked by an api call is moved on a later tick
+        return list(elevators.select_for_update(skip_locked=True, of=('self',)).order_by('id'))
+
+    @transaction.atomic
+    def tick(self, now: float = None):
+        """
+        moves every elevator which can move by one stop, returns the ids of the elevators which changed
+        """
+        now = time.monotonic() if now is None else now
+        self.busy_until = {elevator_id: busy_until for elevator_id, busy_until in self.busy_until.items() if busy_until > now}
+        elevators = self.get_movable_elevators()
+        if not elevators:
+            return []
+
+        pending_requests_by_elevator = {elevator.id: {} for elevator in elevators}
+        for pending_request in Request.objects.filter(
+            elevator__in=elevators, status__in=[REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED]
+        ):
+            pending_requests_by_elevator[pending_request.elevator_id][pending_request.id] = pending_request
+
+        parking_stops = get_parking_stops(elevators)
+        elevators_changed = []
+        requests_changed = []
+        events = {}
+        for elevator in elevators:
+            pending_requests = pending_requests_by_elevator[elevator.id]
+            car = car_from_elevator(elevator, pending_requests.values())
+            previous_floor = car.current_floor
+            previous_status = car.elevator_status
+            changed, reason = move_car(car, parking_stops.get(elevator.id))
+            if reason and car.elevator_status == previous_status:
+                # waiting for destinations or nothing to do, nothing to write
+                continue
+            apply_car_to_elevator(car, elevator)
+            elevator.version += 1
+            elevators_changed.append(elevator)
+            requests_changed.extend(apply_calls_to_requests(changed, pending_requests))
+            events.setdefault(elevator.system_id, []).append(elevator_event(elevator))
+            if not reason:
+                events[elevator.system_id].append(stop_event(elevator, previous_floor))
+                self.busy_until[elevator.id] = now + abs(elevator.current_floor - previous_floor) * self.floor_seconds
+                if elevator.id not in parking_stops:
+                    # a parking elevator does not open its doors on the way
+                    self.busy_until[elevator.id] += self.stop_seconds
+
+        if not elevators_changed:
+            return []
+        system_ids = {elevator.id: elevator.system_id for elevator in elevators_changed}
+        Request.objects.bulk_update(requests_changed, REQUEST_STATUS_FIELDS)
+        Elevator.objects.bulk_update(
+            elevators_changed, ['current_floor', 'next_floor', 'elevator_status', 'version', *PENDING_REQUEST_FIELDS]
+        )
+        record_requests_fulfilled(
+            [changed_request for changed_request in requests_changed if changed_request.status == REQUEST_STATUS_CHOICES.FULFILLED],
+            system_ids
+        )
+        invalidate_elevator_cache(*[elevator.id for elevator in elevators_changed])
+        for changed_request in requests_changed:
+            events[system_ids[changed_request.elevator_id]].append(request_event(changed_request))
+        for system_id, system_events in events.items():
+            publish_on_commit(system_id, *system_events)
+        return [elevator.id for elevator in elevators_changed]
+
+    async def run(self, max_ticks: int = None):
+        """
+        ticks at the configured rate until cancelled or max_ticks ticks ran, a slow tick delays the next one
+        """
+        loop = asyncio.get_running_loop()
+        ticks = 0
+        while max_ticks is None or ticks < max_ticks:
+            started = loop.time()
+            await sync_to_async(self.tick)()
+            ticks += 1
+            await asyncio.sleep(max(0, self.tick_seconds - (loop.time() - started)))
@@ -1,15 +1,41 @@
 from rest_framework import serializers
-from .models import REQUEST_STATUS_CHOICES, Request, Elevator
+from .models import REQUEST_STATUS_CHOICES, Request, RequestHistory, Elevator
 from rest_framework.exceptions import ValidationError
+from system.models import System
 
 
 class RequestSerializer(serializers.ModelSerializer):
     """
     serializes data for creating elevator request
+    system is optional and limits the elevators considered for this request
     """
+    system = serializers.PrimaryKeyRelatedField(queryset=System.objects.all(), write_only=True, required=False)
+
     class Meta:
         model = Request
         fields = '__all__'
+        read_only_fields = ('created_at', 'boarded_at', 'fulfilled_at')
+
+
+class RequestHistorySerializer(serializers.ModelSerializer):
+    """
+    serializes an archived request
+    """
+
+    class Meta:
+        model = RequestHistory
+        fields = '__all__'
+
+
+class BulkRequestSerializer(serializers.Serializer):
+    """
+    serializes a burst of elevator requests for a system
+    """
+    system = serializers.PrimaryKeyRelatedField(queryset=System.objects.all())
+    pick_up_floors = serializers.ListField(child=serializers.IntegerField(min_value=0), allow_empty=False)
+
+    class Meta:
+        fields = ('system', 'pick_up_floors')
 
 
 class MoveElevatorSerializer(serializers.ModelSerializer):
@@ -20,6 +46,7 @@ class MoveElevatorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Elevator
         fields = '__all__'
+        read_only_fields = ('version',)
 
 
 class DoorStatusSerializer(MoveElevatorSerializer):
@@ -70,4 +97,19 @@ class  AddDestianationFloorSerialzer(serializers.Serializer):
         if instance.pick_up_floor == data['destination_floor']:
             raise ValidationError('Current floor and destination floor cannot be the same.')
 
-        return data
\ No newline at end of file
+        return data
+
+
+class EnterDestinationsSerializer(serializers.Serializer):
+    """
+    serializes the destination floors of the users boarding an elevator at its current floor, keyed by request id
+    """
+    destinations = serializers.DictField(child=serializers.IntegerField(min_value=0), allow_empty=False)
+
+    class Meta:
+        fields = ('destinations', )
+
+    def validate_destinations(self, destinations):
+        if not all(request_id.isdigit() for request_id in destinations):
+            raise ValidationError('destinations must be keyed by request id')
+        return {int(request_id): destination_floor for request_id, destination_floor in destinations.items()}
@@ -0,0 +1,265 @@
+import json
+import random
+import time
+from dataclasses import dataclass, field
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+
+from elevator.models import REQUEST_STATUS_CHOICES, Elevator, Request
+from elevator.serializers import MoveElevatorSerializer, RequestSerializer
+from elevator.views import ElevatorViewSet, RequestViewSet
+from system.models import DISPATCH_POLICY_CHOICES, PARKING_POLICY_CHOICES, System
+
+TRAFFIC_PATTERNS = ('up-peak', 'down-peak', 'inter-floor', 'trace')
+
+
+@dataclass
+class Passenger:
+    """
+    a simulated user, times are in simulated seconds
+    """
+    arrival_time: int
+    pick_up_floor: int
+    destination_floor: int
+    request_id: int = None
+    elevator_id: int = None
+    destination_entered: bool = False
+    boarded_at: int = None
+    fulfilled_at: int = None
+
+
+@dataclass
+class SimulationReport:
+    """
+    summary of a simulation run
+    """
+    passengers: int = 0
+    served: int = 0
+    average_wait: float = 0
+    p95_wait: float = 0
+    average_ride: float = 0
+    p95_ride: float = 0
+    stops_per_car: float = 0
+    queries_per_request: float = 0
+    queries_per_move: float = 0
+    operations: int = 0
+    wall_clock_seconds: float = 0
+    operations_per_second: float = 0
+    simulated_seconds: int = 0
+    stops: dict = field(default_factory=dict)
+
+    def as_dict(self):
+        return {key: round(value, 3) if isinstance(value, float) else value for key, value in self.__dict__.items()}
+
+
+def percentile(values, fraction: float):
+    """
+    returns the nearest rank percentile of values, 0 for no values
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def generate_traffic(pattern: str, floors: int, duration: int, rate: float, seed: int = None, trace_path: str = None):
+    """
+    returns passengers sorted by arrival time for a traffic pattern
+    rate is the average number of new passengers per minute, trace is a JSONL file of
+    {"time": seconds, "pick_up_floor": int, "destination_floor": int} lines
+    """
+    if pattern == 'trace':
+        with open(trace_path) as trace:
+            passengers = [
+                Passenger(int(item['time']), int(item['pick_up_floor']), int(item['destination_floor']))
+                for item in map(json.loads, filter(str.strip, trace))
+            ]
+        return sorted(passengers, key=lambda passenger: passenger.arrival_time)
+
+    rng = random.Random(seed)
+    passengers = []
+    arrival_time = 0.0
+    while True:
+        arrival_time += rng.expovariate(rate / 60)
+        if arrival_time >= duration:
+            break
+        lobby_trip = rng.random() < 0.85
+        if pattern == 'up-peak' and lobby_trip:
+            pick_up_floor, destination_floor = 0, rng.randint(1, floors - 1)
+        elif pattern == 'down-peak' and lobby_trip:
+            pick_up_floor, destination_floor = rng.randint(1, floors - 1), 0
+        else:
+            pick_up_floor, destination_floor = rng.sample(range(floors), 2)
+        passengers.append(Passenger(int(arrival_time), pick_up_floor, destination_floor))
+    return passengers
+
+
+class TrafficSimulator:
+    """
+    drives the request and move logic of the viewsets through simulated time.
+    an elevator takes floor_travel_time seconds per floor and stays door_time seconds at each stop.
+    """
+
+    def __init__(
+        self, elevators_count: int, floors: int, floor_travel_time: int = 2, door_time: int = 6,
+        dispatch_policy: str = DISPATCH_POLICY_CHOICES.RULES, parking_policy: str = PARKING_POLICY_CHOICES.STAY,
+    ):
+        self.floor_travel_time = floor_travel_time
+        self.door_time = door_time
+        self.system = System.objects.create(
+            name='simulation', elevators_count=elevators_count, max_floors=floors,
+            dispatch_policy=dispatch_policy, parking_policy=parking_policy,
+        )
+        Elevator.objects.bulk_create([Elevator(system=self.system) for _ in range(elevators_count)])
+        self.elevator_ids = list(Elevator.objects.filter(system=self.system).order_by('id').values_list('id', flat=True))
+        self.request_viewset = RequestViewSet()
+        self.elevator_viewset = ElevatorViewSet()
+        self.query_counts = {'request': [], 'move': []}
+        self.stops = {elevator_id: 0 for elevator_id in self.elevator_ids}
+
+    def measure(self, operation: str, func, *args):
+        """
+        runs func counting the queries it makes against operation
+        """
+        with CaptureQueriesContext(connection) as queries:
+            result = func(*args)
+        self.query_counts[operation].append(len(queries))
+        return result
+
+    def request_elevator(self, passenger: Passenger):
+        """
+        creates the request of a passenger the way POST request-elevator does
+        """
+        def create():
+            serializer = RequestSerializer(data={'pick_up_floor': passenger.pick_up_floor, 'system': self.system.id})
+            serializer.is_valid(raise_exception=True)
+            self.request_viewset.perform_create(serializer)
+            return serializer.instance
+
+        request = self.measure('request', create)
+        passenger.request_id = request.id
+        passenger.elevator_id = request.elevator_id
+        # an elevator already waiting at the pick up floor boards the passenger right away
+        if request.status == REQUEST_STATUS_CHOICES.BOARDED:
+            passenger.boarded_at = passenger.arrival_time
+
+    def move_elevator(self, elevator_id: int):
+        """
+        moves an elevator the way PATCH move-elevator does, returns the floors before and after the move
+        """
+        def move():
+            elevator = Elevator.objects.get(id=elevator_id)
+            previous_floor = elevator.current_floor
+            try:
+                self.elevator_viewset.perform_move_elevator(MoveElevatorSerializer(elevator))
+            except ValidationError:
+                return previous_floor, None
+            return previous_floor, elevator.current_floor
+
+        return self.measure('move', move)
+
+    def enter_destinations(self, elevator_id: int, passengers, current_floor: int):
+        """
+        passengers waiting at the floor the elevator is at choose their destination the way PATCH enter-destinations does
+        """
+        entering = [
+            passenger for passenger in passengers
+            if not passenger.destination_entered and passenger.pick_up_floor == current_floor
+        ]
+        if not entering:
+            return
+        self.elevator_viewset.perform_enter_destinations(
+            Elevator.objects.get(id=elevator_id),
+            {passenger.request_id: passenger.destination_floor for passenger in entering},
+        )
+        for passenger in entering:
+            passenger.destination_entered = True
+
+    def observe(self, passengers, previous_floor: int, current_floor: int, departure_time: int, arrival_time: int):
+        """
+        records boarding and fulfilment times of passengers after a move
+        """
+        statuses = dict(
+            Request.objects.filter(id__in=[passenger.request_id for passenger in passengers]).values_list('id', 'status')
+        )
+        for passenger in passengers:
+            status = statuses[passenger.request_id]
+            if status != REQUEST_STATUS_CHOICES.ACTIVE and passenger.boarded_at is None:
+                passenger.boarded_at = departure_time if passenger.pick_up_floor == previous_floor else arrival_time
+            if status == REQUEST_STATUS_CHOICES.FULFILLED:
+                passenger.fulfilled_at = arrival_time
+
+    def run(self, passengers, max_time: int):
+        """
+        runs the simulation until every passenger is served or max_time simulated seconds have passed
+        """
+        waiting_to_arrive = list(reversed(passengers))
+        in_flight = {elevator_id: [] for elevator_id in self.elevator_ids}
+        busy_until = {elevator_id: 0 for elevator_id in self.elevator_ids}
+        floors = {elevator_id: 0 for elevator_id in self.elevator_ids}
+        parking = self.system.parking_policy == PARKING_POLICY_CHOICES.PREDICTIVE
+        to_park = set()
+        started = time.perf_counter()
+        now = 0
+        while now <= max_time and (waiting_to_arrive or any(in_flight.values())):
+            while waiting_to_arrive and waiting_to_arrive[-1].arrival_time <= now:
+                passenger = waiting_to_arrive.pop()
+                self.request_elevator(passenger)
+                in_flight[passenger.elevator_id].append(passenger)
+
+            for elevator_id in self.elevator_ids:
+                if busy_until[elevator_id] > now:
+                    continue
+                if not in_flight[elevator_id]:
+                    if elevator_id in to_park:
+                        # an elevator which served its last passenger moves on until it is at its parking floor
+                        previous_floor, current_floor = self.move_elevator(elevator_id)
+                        if current_floor is None:
+                            to_park.discard(elevator_id)
+                        else:
+                            floors[elevator_id] = current_floor
+                            busy_until[elevator_id] = now + abs(current_floor - previous_floor) * self.floor_travel_time
+                    continue
+                self.enter_destinations(elevator_id, in_flight[elevator_id], floors[elevator_id])
+                previous_floor, current_floor = self.move_elevator(elevator_id)
+                if current_floor is None:
+                    busy_until[elevator_id] = now + 1
+                    continue
+                arrival_time = now + abs(current_floor - previous_floor) * self.floor_travel_time
+                self.observe(in_flight[elevator_id], previous_floor, current_floor, now, arrival_time)
+                in_flight[elevator_id] = [passenger for passenger in in_flight[elevator_id] if passenger.fulfilled_at is None]
+                if parking and not in_flight[elevator_id]:
+                    to_park.add(elevator_id)
+                floors[elevator_id] = current_floor
+                busy_until[elevator_id] = arrival_time + self.door_time
+                self.stops[elevator_id] += 1
+            now += 1
+
+        return self.report(passengers, time.perf_counter() - started, now)
+
+    def report(self, passengers, wall_clock_seconds: float, simulated_seconds: int):
+        """
+        returns the SimulationReport of the served passengers
+        """
+        served = [passenger for passenger in passengers if passenger.fulfilled_at is not None]
+        waits = [passenger.boarded_at - passenger.arrival_time for passenger in served]
+        rides = [passenger.fulfilled_at - passenger.boarded_at for passenger in served]
+        operations = len(self.query_counts['request']) + len(self.query_counts['move'])
+        return SimulationReport(
+            passengers=len(passengers),
+            served=len(served),
+            average_wait=sum(waits) / len(waits) if waits else 0,
+            p95_wait=percentile(waits, 0.95),
+            average_ride=sum(rides) / len(rides) if rides else 0,
+            p95_ride=percentile(rides, 0.95),
+            stops_per_car=sum(self.stops.values()) / len(self.stops),
+            queries_per_request=sum(self.query_counts['request']) / max(1, len(self.query_counts['request'])),
+            queries_per_move=sum(self.query_counts['move']) / max(1, len(self.query_counts['move'])),
+            operations=operations,
+            wall_clock_seconds=wall_clock_seconds,
+            operations_per_second=operations / wall_clock_seconds if wall_clock_seconds else 0,
+            simulated_seconds=simulated_seconds,
+            stops={str(elevator_id): stops for elevator_id, stops in self.stops.items()},
+        )
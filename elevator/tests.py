@@ -1,3 +1,1111 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from elevator.analytics import get_demand_bucket
+from elevator.dispatch import assign_calls_by_cost, cost_matrix_available, uses_cost_matrix
+from elevator.events import broker
+from elevator.engine import Call, Car, add_call, assign_call, choose_elevator, move_car, set_destination
+from elevator.metrics import Histogram, registry
+from elevator.parking import get_demand_weights, get_parking_floors
+from elevator.scheduler import MotionScheduler
+from elevator.routing import READ_YOUR_WRITES_COOKIE
+from elevator.models import (
+    DOOR_STATUS_CHOICES, ELEVATOR_STATUS_CHOICES, REQUEST_STATUS_CHOICES, TRIP_DIRECTION_CHOICES, DemandRollup, Elevator, Request,
+    RequestHistory
+)
+from elevator.serializers import DoorStatusSerializer, MoveElevatorSerializer
+from elevator.utils import (
+    ELEVATOR_UPDATE_ATTEMPTS, ElevatorUpdateConflict, get_all_requests_for_elevator, get_floors_above_below_to_board_and_deboard, get_most_suitable_elevator,
+    get_next_floor_for_elevator, reconcile_request_counters, save_elevator_fields
+)
+from elevator.views import ElevatorViewSet
+from system.models import PARKING_POLICY_CHOICES, System
+
+
+def choose_elevator_by_branching(elevators, request_counts, pickup_floor):
+    """
+    reference implementation of the tiered dispatch policy written as plain python branching
+    """
+    def count(elevator):
+        return request_counts.get(elevator.id, 0)
+
+    def distance(elevator):
+        return abs(elevator.current_floor - pickup_floor)
+
+    at_current_floor = sorted(
+        [elevator for elevator in elevators if elevator.current_floor == pickup_floor],
+        key=lambda elevator: (count(elevator), elevator.id)
+    )
+    if at_current_floor:
+        return at_current_floor[0].id
+
+    idle = sorted(
+        [elevator for elevator in elevators if elevator.elevator_status == ELEVATOR_STATUS_CHOICES.IDLE],
+        key=lambda elevator: (distance(elevator), elevator.id)
+    )
+    if idle:
+        return idle[0].id
+
+    below_and_comming_up = sorted(
+        [
+            elevator for elevator in elevators
+            if elevator.current_floor < pickup_floor and elevator.elevator_status == ELEVATOR_STATUS_CHOICES.GOING_UP
+        ],
+        key=lambda elevator: (distance(elevator), count(elevator), elevator.id)
+    )
+    above_and_comming_down = sorted(
+        [
+            elevator for elevator in elevators
+            if elevator.current_floor > pickup_floor and elevator.elevator_status == ELEVATOR_STATUS_CHOICES.GOING_DOWN
+        ],
+        key=lambda elevator: (distance(elevator), count(elevator), elevator.id)
+    )
+    if below_and_comming_up and above_and_comming_down:
+        below, above = below_and_comming_up[0], above_and_comming_down[0]
+        return below.id if count(below) <= count(above) else above.id
+    if above_and_comming_down:
+        return above_and_comming_down[0].id
+    if below_and_comming_up:
+        return below_and_comming_up[0].id
+
+    return sorted(elevators, key=lambda elevator: (count(elevator), distance(elevator), elevator.id))[0].id
+
+
+class MostSuitableElevatorTestCase(TestCase):
+
+    def setUp(self):
+        self.system = System.objects.create(name='system 1', elevators_count=6, max_floors=20)
+
+    def create_random_fleet(self, rng):
+        Elevator.objects.all().delete()
+        statuses = list(ELEVATOR_STATUS_CHOICES)
+        for _ in range(6):
+            elevator = Elevator.objects.create(
+                system=self.system,
+                current_floor=rng.randint(0, 10),
+                elevator_status=rng.choice(statuses),
+                is_under_maintainance=rng.random() < 0.15,
+            )
+            for _ in range(rng.randint(0, 4)):
+                Request.objects.create(
+                    pick_up_floor=rng.randint(0, 10),
+                    elevator=elevator,
+                    status=rng.choice(list(REQUEST_STATUS_CHOICES)),
+                )
+        reconcile_request_counters()
+
+    def get_request_counts(self):
+        request_counts = {}
+        for request in Request.objects.filter(status__in=[REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED]):
+            request_counts[request.elevator_id] = request_counts.get(request.elevator_id, 0) + 1
+        return request_counts
+
+    def test_choice_matches_branching_policy(self):
+        rng = random.Random(7)
+        for _ in range(60):
+            self.create_random_fleet(rng)
+            elevators = list(Elevator.objects.filter(is_under_maintainance=False))
+            if not elevators:
+                continue
+            request_counts = self.get_request_counts()
+            for pickup_floor in range(0, 11):
+                self.assertEqual(
+                    get_most_suitable_elevator(pickup_floor, system_id=self.system.id),
+                    choose_elevator_by_branching(elevators, request_counts, pickup_floor),
+                )
+
+    def test_ranking_is_a_single_query(self):
+        Elevator.objects.create(system=self.system, current_floor=4, elevator_status=ELEVATOR_STATUS_CHOICES.GOING_UP)
+        Elevator.objects.create(system=self.system, current_floor=9, elevator_status=ELEVATOR_STATUS_CHOICES.GOING_DOWN)
+        with self.assertNumQueries(1):
+            get_most_suitable_elevator(6, system_id=self.system.id)
+
+    def test_scoped_to_requesting_system(self):
+        other_system = System.objects.create(name='system 2', elevators_count=1, max_floors=20)
+        Elevator.objects.create(system=other_system, current_floor=3)
+        elevator = Elevator.objects.create(system=self.system, current_floor=8)
+        self.assertEqual(get_most_suitable_elevator(3, system_id=self.system.id), elevator.id)
+
+    def test_no_available_elevator(self):
+        Elevator.objects.create(system=self.system, is_under_maintainance=True)
+        with self.assertRaises(ValidationError):
+            get_most_suitable_elevator(3, system_id=self.system.id)
+
+
+@skipIf(not cost_matrix_available(), 'numpy is not installed')
+class CostMatrixDispatchTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        response = self.client.post(
+            '/api/elevatorsystem/',
+            {'name': 'system', 'elevators_count': 3, 'max_floors': 30, 'dispatch_policy': 'cost_matrix'}, format='json'
+        )
+        self.system_id = response.data['id']
+        self.elevators = list(Elevator.objects.filter(system_id=self.system_id).order_by('id'))
+        for elevator, (floor, status, stops) in zip(self.elevators, [
+            (4, ELEVATOR_STATUS_CHOICES.GOING_UP, (10, 20)),
+            (12, ELEVATOR_STATUS_CHOICES.GOING_DOWN, (2, 12)),
+            (25, ELEVATOR_STATUS_CHOICES.IDLE, (None, None)),
+        ]):
+            elevator.current_floor, elevator.elevator_status = floor, status
+            elevator.min_stop_floor, elevator.max_stop_floor = stops
+            elevator.active_request_count = 0 if stops[0] is None else 2
+            elevator.save()
+
+    def test_estimated_time_to_arrival_follows_the_route(self):
+        # on the way up, on the way down, and the elevator going down turning around at floor 2 beats
+        # the one going up which has to reach floor 20 first
+        chosen = assign_calls_by_cost(self.elevators, [6, 11, 3])
+        self.assertEqual([elevator.id for elevator in chosen], [self.elevators[0].id, self.elevators[1].id, self.elevators[1].id])
+        self.assertEqual(assign_calls_by_cost(self.elevators, [26])[0].id, self.elevators[2].id)
+
+    def test_stops_on_the_way_delay_the_arrival(self):
+        first, second = self.elevators[:2]
+        first.pick_up_stops, first.drop_off_stops = [5, 6], [10, 20]
+        second.drop_off_stops = [2]
+        # 3 floors and 2 stops up to floor 7 take longer than 5 floors without a stop down to it
+        self.assertEqual(assign_calls_by_cost(self.elevators, [7])[0].id, second.id)
+        # a stop at the pick up floor itself costs nothing more
+        self.assertEqual(assign_calls_by_cost(self.elevators, [5])[0].id, first.id)
+
+    def test_system_requests_use_the_cost_matrix(self):
+        response = self.client.post('/api/elevator/request-elevator/', {'pick_up_floor': 6, 'system': self.system_id}, format='json')
+        self.assertEqual(response.data['elevator'], self.elevators[0].id)
+        response = self.client.post(
+            '/api/elevator/request-elevator/bulk/', {'system': self.system_id, 'pick_up_floors': [11, 27]}, format='json'
+        )
+        self.assertEqual([item['elevator'] for item in response.data], [self.elevators[1].id, self.elevators[2].id])
+        self.assertIn('elevator_dispatch_tier_total{tier="cost_matrix"}', registry.render())
+
+    def test_simulation_serves_everyone(self):
+        out = StringIO()
+        call_command('simulate_traffic', '--json', '--duration', '120', '--dispatch', 'cost_matrix', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['served'], report['passengers'])
+
+    def test_policy_needs_numpy(self):
+        with mock.patch('system.serializers.cost_matrix_available', return_value=False):
+            response = self.client.post(
+                '/api/elevatorsystem/',
+                {'name': 'system', 'elevators_count': 1, 'max_floors': 30, 'dispatch_policy': 'cost_matrix'}, format='json'
+            )
+        self.assertEqual(response.status_code, 400)
+
+    def test_policy_without_numpy_fails_loudly(self):
+        system = System.objects.get(id=self.system_id)
+        with mock.patch('elevator.dispatch.cost_matrix_available', return_value=False):
+            with self.assertRaises(ImproperlyConfigured):
+                uses_cost_matrix(system)
+
+
+@skipUnless(os.environ.get('ELEVATOR_SLOW_TESTS'), 'builds a million row table, set ELEVATOR_SLOW_TESTS=1 to run it')
+class PendingRequestIndexTestCase(TestCase):
+    """
+    checks the query plans of the hot request queries on a million row request table
+    """
+    ROWS = 1_000_000
+    ELEVATORS = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.system = System.objects.create(name='system 1', elevators_count=cls.ELEVATORS, max_floors=60)
+        Elevator.objects.bulk_create([Elevator(system=cls.system) for _ in range(cls.ELEVATORS)])
+        first_elevator_id = Elevator.objects.order_by('id').values_list('id', flat=True).first()
+        cls.elevator_id = first_elevator_id
+        # one in twenty requests is still in flight, the rest are fulfilled history
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+                INSERT INTO {Request._meta.db_table} (pick_up_floor, destination_floor, elevator_id, status, created_at)
+                SELECT n %% 60, (n + 7) %% 60, %s + n %% %s,
+                    CASE n %% 20 WHEN 0 THEN %s WHEN 1 THEN %s ELSE %s END, CURRENT_TIMESTAMP
+                FROM seq
+                """,
+                [
+                    cls.ROWS, first_elevator_id, cls.ELEVATORS,
+                    REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED, REQUEST_STATUS_CHOICES.FULFILLED,
+                ],
+            )
+            cursor.execute('ANALYZE')
+
+    def assertPlanUsesIndex(self, queryset, index_name, index_only=False):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        if index_only and connection.vendor == 'sqlite':
+            self.assertIn('COVERING INDEX', plan)
+        elif index_only and connection.vendor == 'postgresql':
+            self.assertIn('Index Only Scan', plan)
+
+    def test_request_count_is_index_only(self):
+        queryset = Request.objects.filter(
+            elevator_id=self.elevator_id,
+            status__in=[REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED],
+        ).values('elevator_id').annotate(request_count=Count('id')).values('request_count')
+        # both pending indexes start with (elevator, status) so either one covers the count
+        self.assertPlanUsesIndex(queryset, 'request_pending_', index_only=True)
+
+    def test_nearest_pickup_floor_uses_index(self):
+        queryset = get_all_requests_for_elevator(self.elevator_id).filter(
+            pick_up_floor__gt=10, status=REQUEST_STATUS_CHOICES.ACTIVE
+        ).order_by('pick_up_floor').values_list('pick_up_floor', flat=True)
+        self.assertPlanUsesIndex(queryset, 'request_pending_pickup_idx', index_only=True)
+
+    def test_nearest_destination_floor_uses_index(self):
+        queryset = get_all_requests_for_elevator(self.elevator_id).filter(
+            destination_floor__lt=10, status=REQUEST_STATUS_CHOICES.BOARDED
+        ).order_by('-destination_floor').values_list('destination_floor', flat=True)
+        self.assertPlanUsesIndex(queryset, 'request_pending_dest_idx', index_only=True)
+
+    def test_dispatch_uses_system_index(self):
+        if connection.vendor == 'postgresql':
+            # the fifty elevators fit in a page, postgres would rather read it than any index
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        queryset = Elevator.objects.filter(system_id=self.system.id, is_under_maintainance=False).values_list('id', flat=True)
+        self.assertPlanUsesIndex(queryset, 'elevator_system_dispatch_idx', index_only=True)
+
+
+class BulkRequestTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_system(self):
+        response = self.client.post(
+            '/api/elevatorsystem/', {'name': 'system', 'elevators_count': 4, 'max_floors': 20}, format='json'
+        )
+        system_id = response.data['id']
+        elevators = list(Elevator.objects.filter(system_id=system_id).order_by('id'))
+        for elevator, floor in zip(elevators, [0, 5, 12, 19]):
+            elevator.current_floor = floor
+            elevator.save()
+        return system_id, [elevator.id for elevator in elevators]
+
+    def test_bulk_matches_sequential_requests(self):
+        pick_up_floors = [3, 3, 7, 19, 0, 11, 5, 15, 2, 8]
+        system_id, elevator_ids = self.create_system()
+        for pickup_floor in pick_up_floors:
+            self.client.post('/api/elevator/request-elevator/', {'pick_up_floor': pickup_floor, 'system': system_id}, format='json')
+        sequential = list(
+            Request.objects.filter(elevator_id__in=elevator_ids).order_by('id').values_list('elevator_id', 'status')
+        )
+        sequential = [(elevator_ids.index(elevator_id), status) for elevator_id, status in sequential]
+
+        system_id, elevator_ids = self.create_system()
+        response = self.client.post(
+            '/api/elevator/request-elevator/bulk/', {'system': system_id, 'pick_up_floors': pick_up_floors}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        bulk = [(elevator_ids.index(item['elevator']), item['status']) for item in response.data]
+        self.assertEqual(bulk, sequential)
+
+    def test_burst_costs_a_fixed_number_of_queries(self):
+        system_id, _ = self.create_system()
+        # system lookup, fleet, request insert, elevator update, demand rollup and the transaction savepoint pair
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                '/api/elevator/request-elevator/bulk/', {'system': system_id, 'pick_up_floors': list(range(20)) * 5}, format='json'
+            )
+        self.assertEqual(len(response.data), 100)
+
+    def press(self, system_id, pickup_floor):
+        return self.client.post('/api/elevator/request-elevator/', {'pick_up_floor': pickup_floor, 'system': system_id}, format='json').data
+
+    def test_crowd_at_a_floor_shares_one_elevator(self):
+        system_id, elevator_ids = self.create_system()
+        first = self.press(system_id, 9)
+        # waiting lookup, conditional save, request insert, demand rollup, system lookup and the savepoint pair
+        with self.assertNumQueries(7):
+            second = self.press(system_id, 9)
+        self.assertEqual((second['elevator'], second['status']), (first['elevator'], REQUEST_STATUS_CHOICES.ACTIVE))
+        self.assertNotEqual(second['id'], first['id'])
+        response = self.client.post('/api/elevator/request-elevator/bulk/', {'system': system_id, 'pick_up_floors': [9, 2, 2]}, format='json')
+        self.assertEqual(response.data[0]['elevator'], first['elevator'])
+        self.assertEqual(response.data[1]['elevator'], response.data[2]['elevator'])
+        elevator = Elevator.objects.get(id=first['elevator'])
+        self.assertEqual((elevator.active_request_count, elevator.pick_up_stops), (3, [9]))
+        self.assertEqual(reconcile_request_counters(), [])
+
+        with override_settings(ELEVATOR_COALESCE_HALL_CALLS=False):
+            self.assertNotEqual(self.press(system_id, 9)['elevator'], first['elevator'])
+
+    def test_maintainance_reassigns_requests_to_the_fleet(self):
+        system_id, elevator_ids = self.create_system()
+        waiting = Request.objects.create(pick_up_floor=9, elevator_id=elevator_ids[1])
+        riding = Request.objects.create(
+            pick_up_floor=2, destination_floor=15, elevator_id=elevator_ids[1], status=REQUEST_STATUS_CHOICES.BOARDED
+        )
+        arrived = Request.objects.create(
+            pick_up_floor=1, destination_floor=5, elevator_id=elevator_ids[1], status=REQUEST_STATUS_CHOICES.BOARDED
+        )
+        reconcile_request_counters()
+        response = self.client.patch(f'/api/elevator/{elevator_ids[1]}/under-maintainance', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_under_maintainance'])
+        self.assertEqual(response.data['fulfilled_requests'], [arrived.id])
+        reassigned = {item['id']: item for item in response.data['reassigned_requests']}
+        self.assertEqual(list(reassigned), [waiting.id, riding.id])
+        # the rider gets off at floor 5 and waits there for another elevator keeping the destination
+        self.assertEqual(
+            (reassigned[riding.id]['pick_up_floor'], reassigned[riding.id]['destination_floor'], reassigned[riding.id]['status']),
+            (5, 15, REQUEST_STATUS_CHOICES.ACTIVE)
+        )
+        self.assertFalse(Request.objects.filter(elevator_id=elevator_ids[1]).exclude(status=REQUEST_STATUS_CHOICES.FULFILLED).exists())
+        self.assertEqual(reconcile_request_counters(), [])
+
+    def test_reassigned_rider_is_picked_up_before_getting_off(self):
+        system = System.objects.create(name='system', elevators_count=2, max_floors=20)
+        broken = Elevator.objects.create(system=system, current_floor=5, elevator_status=ELEVATOR_STATUS_CHOICES.GOING_UP)
+        receiving = Elevator.objects.create(system=system, current_floor=20)
+        riding = Request.objects.create(
+            pick_up_floor=0, destination_floor=15, elevator=broken, status=REQUEST_STATUS_CHOICES.BOARDED
+        )
+        reconcile_request_counters()
+        self.client.patch(f'/api/elevator/{broken.id}/under-maintainance', {}, format='json')
+        receiving.refresh_from_db()
+        self.assertEqual((receiving.pick_up_stops, receiving.drop_off_stops), ([5], []))
+
+        response = self.client.patch(f'/api/elevator/{receiving.id}/move-elevator', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        riding.refresh_from_db()
+        self.assertEqual((response.data['current_floor'], riding.status), (5, REQUEST_STATUS_CHOICES.BOARDED))
+        self.assertEqual(response.data['drop_off_stops'], [15])
+        response = self.client.patch(f'/api/elevator/{receiving.id}/move-elevator', {}, format='json')
+        riding.refresh_from_db()
+        self.assertEqual((response.data['current_floor'], riding.status), (15, REQUEST_STATUS_CHOICES.FULFILLED))
+        self.assertEqual((response.data['active_request_count'], response.data['boarded_request_count']), (0, 0))
+        self.assertEqual(reconcile_request_counters(), [])
+
+    def test_maintainance_of_the_last_elevator_fulfills_requests(self):
+        system = System.objects.create(name='system', elevators_count=1, max_floors=20)
+        elevator = Elevator.objects.create(system=system, current_floor=3)
+        waiting = Request.objects.create(pick_up_floor=9, elevator=elevator)
+        riding = Request.objects.create(
+            pick_up_floor=1, destination_floor=7, elevator=elevator, status=REQUEST_STATUS_CHOICES.BOARDED
+        )
+        response = self.client.patch(f'/api/elevator/{elevator.id}/under-maintainance', {}, format='json')
+        self.assertEqual((response.data['reassigned_requests'], response.data['fulfilled_requests']), ([], [waiting.id, riding.id]))
+        # the fulfilled rider keeps where they really got on
+        riding.refresh_from_db()
+        self.assertEqual(riding.pick_up_floor, 1)
+
+
+class MoveElevatorTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.system = System.objects.create(name='system 1', elevators_count=1, max_floors=30)
+        self.elevator = Elevator.objects.create(
+            system=self.system, current_floor=5, elevator_status=ELEVATOR_STATUS_CHOICES.GOING_UP
+        )
+
+    def create_request(self, pick_up_floor, destination_floor=None, status=REQUEST_STATUS_CHOICES.ACTIVE):
+        request = Request.objects.create(
+            pick_up_floor=pick_up_floor, destination_floor=destination_floor, elevator=self.elevator, status=status,
+            boarded_at=timezone.now() if status == REQUEST_STATUS_CHOICES.BOARDED else None,
+        )
+        reconcile_request_counters()
+        return request
+
+    def move(self):
+        return self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator', {}, format='json')
+
+    def test_next_floor_resolution(self):
+        self.create_request(9)
+        self.create_request(2)
+        self.create_request(1, 7, REQUEST_STATUS_CHOICES.BOARDED)
+        self.create_request(0, 3, REQUEST_STATUS_CHOICES.BOARDED)
+        all_requests = get_all_requests_for_elevator(self.elevator.id)
+        self.assertEqual(get_floors_above_below_to_board_and_deboard(all_requests, 5), (9, 7, 2, 3))
+        self.assertEqual(get_next_floor_for_elevator(all_requests, ELEVATOR_STATUS_CHOICES.GOING_UP, 5), 7)
+        self.assertEqual(get_next_floor_for_elevator(all_requests, ELEVATOR_STATUS_CHOICES.GOING_DOWN, 5), 3)
+        self.assertEqual(get_next_floor_for_elevator(all_requests, ELEVATOR_STATUS_CHOICES.IDLE, 5), 7)
+
+    def test_ground_floor_is_a_next_floor(self):
+        self.create_request(0)
+        response = self.client.get(f'/api/elevator/{self.elevator.id}/next-floor')
+        self.assertEqual(response.data, {'next_floor': 0})
+
+    def test_move_boards_and_fulfils(self):
+        boarded = self.create_request(1, 8, REQUEST_STATUS_CHOICES.BOARDED)
+        waiting = self.create_request(8)
+        response = self.move()
+        self.assertEqual(response.data['current_floor'], 8)
+        boarded.refresh_from_db()
+        waiting.refresh_from_db()
+        self.assertEqual(boarded.status, REQUEST_STATUS_CHOICES.FULFILLED)
+        self.assertEqual(waiting.status, REQUEST_STATUS_CHOICES.BOARDED)
+
+    def test_route_plan_gives_the_next_floor(self):
+        self.create_request(9)
+        self.create_request(1, 7, REQUEST_STATUS_CHOICES.BOARDED)
+        self.create_request(0, 3, REQUEST_STATUS_CHOICES.BOARDED)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/elevator/{self.elevator.id}/next-floor')
+        self.assertEqual(response.data, {'next_floor': 7})
+        self.move()
+        self.elevator.refresh_from_db()
+        self.assertEqual((self.elevator.pick_up_stops, self.elevator.drop_off_stops), ([9], [3]))
+        self.assertEqual((self.elevator.current_floor, self.elevator.next_floor), (7, 9))
+        self.assertEqual(reconcile_request_counters(), [])
+
+    def test_move_through_several_stops(self):
+        for floor in (8, 12, 3):
+            self.create_request(5, floor, REQUEST_STATUS_CHOICES.BOARDED)
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator?stops=2', {}, format='json')
+        self.assertEqual((response.data['visited_floors'], response.data['reason']), ([8, 12], None))
+        events = [call.args[1] for call in publish.call_args_list]
+        self.assertEqual(
+            [(event['type'], event.get('status')) for event in events if event['type'] == 'request'],
+            [('request', REQUEST_STATUS_CHOICES.FULFILLED)] * 2
+        )
+        # elevator lookup, pending requests, bulk status update, demand rollup, conditional save and the savepoint pair
+        with self.assertNumQueries(7):
+            response = self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator?until=idle', {}, format='json')
+        self.assertEqual(response.data['visited_floors'], [3])
+        self.assertEqual(response.data['elevator_status'], ELEVATOR_STATUS_CHOICES.IDLE)
+        self.assertFalse(get_all_requests_for_elevator(self.elevator.id).exists())
+        self.assertEqual(reconcile_request_counters(), [])
+        response = self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator?until=idle', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator?stops=0', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def enter_destinations(self, destinations):
+        return self.client.patch(
+            f'/api/elevator/{self.elevator.id}/enter-destinations', {'destinations': destinations}, format='json'
+        )
+
+    def test_enter_destinations_of_everyone_boarding(self):
+        boarding = [self.create_request(5, status=REQUEST_STATUS_CHOICES.BOARDED) for _ in range(3)]
+        waiting = self.create_request(9)
+        self.assertEqual(self.move().status_code, 400)
+        response = self.enter_destinations({boarding[0].id: 8, waiting.id: 12})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.enter_destinations({boarding[0].id: 5}).status_code, 400)
+        self.assertEqual(self.enter_destinations({'first': 5}).status_code, 400)
+        # elevator lookup, requests, bulk update, conditional save and the savepoint pair
+        with self.assertNumQueries(6):
+            response = self.enter_destinations({boarding[0].id: 8, boarding[1].id: 2, boarding[2].id: 8})
+        self.assertEqual([item['destination_floor'] for item in response.data], [8, 2, 8])
+        self.elevator.refresh_from_db()
+        self.assertEqual(self.elevator.drop_off_stops, [2, 8])
+        self.assertEqual(reconcile_request_counters(), [])
+        # a changed destination leaves the route plan
+        self.enter_destinations({boarding[1].id: 3})
+        self.elevator.refresh_from_db()
+        self.assertEqual(self.elevator.drop_off_stops, [3, 8])
+        self.assertEqual(reconcile_request_counters(), [])
+        self.assertEqual(self.move().data['current_floor'], 8)
+
+    def set_destination(self, request, destination_floor):
+        return self.client.put(f'/api/elevator/request-elevator/{request.id}/', {'destination_floor': destination_floor}, format='json')
+
+    def test_changed_destination_leaves_the_route_plan(self):
+        riding, sharing = [self.create_request(5, status=REQUEST_STATUS_CHOICES.BOARDED) for _ in range(2)]
+        waiting = self.create_request(7)
+        self.set_destination(riding, 10)
+        self.set_destination(sharing, 10)
+        # somebody else still gets off at 10
+        self.set_destination(riding, 3)
+        self.elevator.refresh_from_db()
+        self.assertEqual(self.elevator.drop_off_stops, [3, 10])
+        self.set_destination(sharing, 3)
+        self.elevator.refresh_from_db()
+        self.assertEqual(self.elevator.drop_off_stops, [3])
+        self.assertEqual(reconcile_request_counters(), [])
+        self.assertEqual(self.move().data['current_floor'], 7)
+        self.set_destination(waiting, 2)
+        self.assertEqual(self.move().data['current_floor'], 3)
+
+    def test_move_costs_a_fixed_number_of_queries(self):
+        for floor in range(6, 26):
+            self.create_request(floor)
+            self.create_request(floor - 5, floor, REQUEST_STATUS_CHOICES.BOARDED)
+        # elevator lookup, pending requests, status bulk update, demand rollup, conditional save and the savepoint pair
+        with self.assertNumQueries(7):
+            response = self.move()
+        self.assertEqual(response.data['current_floor'], 6)
+
+
+class ParkingTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.system = System.objects.create(
+            name='system 1', elevators_count=2, max_floors=30, parking_policy=PARKING_POLICY_CHOICES.PREDICTIVE
+        )
+        self.lobby_elevator = Elevator.objects.create(system=self.system, current_floor=0)
+        self.top_elevator = Elevator.objects.create(system=self.system, current_floor=29)
+
+    def move(self, elevator):
+        return self.client.patch(f'/api/elevator/{elevator.id}/move-elevator', {}, format='json')
+
+    def test_parking_floors_cover_the_demand(self):
+        weights = {0: 85, 5: 3, 10: 4, 15: 4, 19: 4}
+        self.assertEqual(get_parking_floors(weights, 1), [0])
+        # a second elevator at the lobby would not shorten any wait
+        self.assertEqual(get_parking_floors(weights, 2), [0, 15])
+        self.assertEqual(get_parking_floors({3: 1, 20: 1}, 4), [3, 20])
+        self.assertEqual(get_parking_floors({}, 2), [])
+
+    def add_demand(self, floor, requests_count, bucket=None):
+        DemandRollup.objects.create(
+            system=self.system, floor=floor, direction=TRIP_DIRECTION_CHOICES.UNKNOWN,
+            bucket=bucket or get_demand_bucket(timezone.now()), requests_count=requests_count,
+        )
+
+    def test_demand_decays(self):
+        bucket = get_demand_bucket(timezone.now())
+        self.add_demand(4, 2, bucket)
+        self.add_demand(9, 1, bucket)
+        # older than ten half lives
+        self.add_demand(12, 50, bucket - timezone.timedelta(hours=3))
+        weights = get_demand_weights([self.system.id], now=bucket + timezone.timedelta(seconds=900))
+        self.assertEqual(weights, {self.system.id: {4: 1, 9: 0.5}})
+
+    def test_idle_elevators_move_towards_the_demand(self):
+        for _ in range(3):
+            self.client.post('/api/elevator/request-elevator/', {'pick_up_floor': 6, 'system': self.system.id}, format='json')
+        Request.objects.update(status=REQUEST_STATUS_CHOICES.FULFILLED)
+        reconcile_request_counters()
+        response = self.move(self.lobby_elevator)
+        self.assertEqual((response.status_code, response.data['current_floor']), (200, 3))
+        self.assertEqual(self.move(self.lobby_elevator).data['current_floor'], 6)
+        self.assertEqual(self.move(self.lobby_elevator).status_code, 400)
+        # the elevator nearest to the demand took the parking floor, the other one stays
+        self.assertEqual(self.move(self.top_elevator).status_code, 400)
+
+        self.system.parking_policy = PARKING_POLICY_CHOICES.STAY
+        self.system.save()
+        self.add_demand(29, 10)
+        self.assertEqual(self.move(self.lobby_elevator).status_code, 400)
+
+    def test_system_step_and_scheduler_park(self):
+        self.add_demand(6, 3)
+        response = self.client.post(f'/api/elevatorsystem/{self.system.id}/step/', format='json')
+        self.assertEqual([elevator['current_floor'] for elevator in response.data['elevators']], [3, 29])
+        self.assertEqual(list(response.data['skipped']), [self.top_elevator.id])
+        # the scheduler process sees the calls made through the api processes, they are read from the database
+        scheduler = MotionScheduler(system_ids=[self.system.id])
+        self.assertEqual(scheduler.tick(now=0), [self.lobby_elevator.id])
+        self.lobby_elevator.refresh_from_db()
+        self.assertEqual(self.lobby_elevator.current_floor, 6)
+        # 3 floors of travel, a parking elevator does not stop
+        self.assertEqual(scheduler.busy_until, {self.lobby_elevator.id: 6})
+        self.assertEqual(scheduler.tick(now=6), [])
+
+
+class EngineTestCase(SimpleTestCase):
+    """
+    the engine runs without the database, SimpleTestCase fails any query
+    """
+
+    def test_choice_matches_branching_policy(self):
+        rng = random.Random(11)
+        statuses = list(ELEVATOR_STATUS_CHOICES)
+        for _ in range(200):
+            cars = [Car(car_id, rng.randint(0, 10), rng.choice(statuses)) for car_id in range(1, 7)]
+            for car in cars:
+                for call_id in range(rng.randint(0, 4)):
+                    add_call(car, Call(call_id, rng.randint(0, 10), status=rng.choice([REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED])))
+            request_counts = {car.id: car.request_count for car in cars}
+            for pickup_floor in range(0, 11):
+                self.assertEqual(choose_elevator(cars, pickup_floor)[0].id, choose_elevator_by_branching(cars, request_counts, pickup_floor))
+
+    def test_move_serves_calls_by_floor(self):
+        car = Car(1, 5, ELEVATOR_STATUS_CHOICES.GOING_UP)
+        waiting = Call(1, 9)
+        riding = Call(2, 1, 7, REQUEST_STATUS_CHOICES.BOARDED)
+        for call in (waiting, riding, Call(3, 0, 3, REQUEST_STATUS_CHOICES.BOARDED)):
+            add_call(car, call)
+        self.assertEqual(move_car(car), ([riding], None))
+        self.assertEqual((car.current_floor, car.next_floor, riding.status), (7, 9, REQUEST_STATUS_CHOICES.FULFILLED))
+        self.assertEqual((car.pick_up_stops, car.drop_off_stops, car.min_stop_floor, car.max_stop_floor), ([9], [3], 3, 9))
+        self.assertEqual(move_car(car), ([waiting], None))
+        self.assertEqual((car.active_request_count, car.boarded_request_count), (0, 2))
+        _, reason = move_car(car)
+        self.assertIn('(1)', reason)
+        set_destination(car, waiting, 2)
+        floors = []
+        while not move_car(car)[1]:
+            floors.append(car.current_floor)
+        self.assertEqual(floors, [3, 2])
+        self.assertEqual((car.request_count, car.pick_up_stops, car.drop_off_stops, car.elevator_status), (0, [], [], ELEVATOR_STATUS_CHOICES.IDLE))
+
+    def test_assigned_call_at_the_car_floor_is_boarded(self):
+        car = Car(1, 4)
+        self.assertEqual(assign_call(car, Call(1, 4), 10), REQUEST_STATUS_CHOICES.BOARDED)
+        self.assertEqual(assign_call(car, Call(2, 8), 10), REQUEST_STATUS_CHOICES.ACTIVE)
+        self.assertEqual((car.elevator_status, car.pick_up_stops, car.boarded_request_count), (ELEVATOR_STATUS_CHOICES.GOING_UP, [8], 1))
+
+
+class MotionSchedulerTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.system = System.objects.create(name='system 1', elevators_count=3, max_floors=20)
+        self.elevator = Elevator.objects.create(system=self.system, current_floor=0)
+        self.open_elevator = Elevator.objects.create(system=self.system, current_floor=0, door_status=DOOR_STATUS_CHOICES.OPEN)
+        self.fixed_elevator = Elevator.objects.create(system=self.system, current_floor=0, is_under_maintainance=True)
+        self.riding = Request.objects.create(pick_up_floor=0, destination_floor=3, elevator=self.elevator, status=REQUEST_STATUS_CHOICES.BOARDED)
+        self.waiting = Request.objects.create(pick_up_floor=5, destination_floor=8, elevator=self.elevator)
+        for elevator in (self.open_elevator, self.fixed_elevator):
+            Request.objects.create(pick_up_floor=0, destination_floor=4, elevator=elevator, status=REQUEST_STATUS_CHOICES.BOARDED)
+        reconcile_request_counters()
+
+    def test_tick_moves_elevators_which_can_move(self):
+        scheduler = MotionScheduler(tick_seconds=1)
+        # elevators, pending requests, bulk request update, bulk elevator update, demand rollup and the savepoint pair
+        with self.assertNumQueries(7):
+            self.assertEqual(scheduler.tick(now=0), [self.elevator.id])
+        self.elevator.refresh_from_db()
+        self.riding.refresh_from_db()
+        self.assertEqual((self.elevator.current_floor, self.elevator.version), (3, 2))
+        self.assertEqual(self.riding.status, REQUEST_STATUS_CHOICES.FULFILLED)
+        self.assertEqual(Elevator.objects.get(id=self.open_elevator.id).current_floor, 0)
+        self.assertEqual(reconcile_request_counters(), [])
+
+    def test_elevator_dwells_after_a_stop(self):
+        scheduler = MotionScheduler(tick_seconds=1)
+        scheduler.tick(now=0)
+        # 3 floors of travel and the stop
+        self.assertEqual(scheduler.tick(now=11), [])
+        self.assertEqual(scheduler.tick(now=12), [self.elevator.id])
+        self.waiting.refresh_from_db()
+        self.assertEqual(self.waiting.status, REQUEST_STATUS_CHOICES.BOARDED)
+        scheduler.tick(now=30)
+        scheduler.tick(now=60)
+        self.elevator.refresh_from_db()
+        self.assertEqual((self.elevator.current_floor, self.elevator.elevator_status), (8, ELEVATOR_STATUS_CHOICES.IDLE))
+        self.assertEqual(scheduler.tick(now=90), [])
+
+
+class ElevatorRequestCountersTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.system = System.objects.create(name='system 1', elevators_count=2, max_floors=20)
+        self.elevator = Elevator.objects.create(system=self.system, current_floor=2)
+
+    def request_elevator(self, pick_up_floor):
+        return self.client.post(
+            '/api/elevator/request-elevator/', {'pick_up_floor': pick_up_floor, 'system': self.system.id}, format='json'
+        ).data['id']
+
+    def assert_counters(self, active, boarded, min_stop_floor, max_stop_floor):
+        self.elevator.refresh_from_db()
+        self.assertEqual(
+            (self.elevator.active_request_count, self.elevator.boarded_request_count,
+             self.elevator.min_stop_floor, self.elevator.max_stop_floor),
+            (active, boarded, min_stop_floor, max_stop_floor),
+        )
+        self.assertEqual(reconcile_request_counters(), [])
+
+    def test_counters_follow_requests_through_the_api(self):
+        at_floor = self.request_elevator(2)
+        self.request_elevator(9)
+        self.assert_counters(1, 1, 9, 9)
+        self.client.put(f'/api/elevator/request-elevator/{at_floor}/', {'destination_floor': 0}, format='json')
+        self.assert_counters(1, 1, 0, 9)
+        self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator', {}, format='json')
+        self.assert_counters(0, 2, 0, 0)
+        self.client.patch(f'/api/elevator/{self.elevator.id}/under-maintainance', {}, format='json')
+        self.assert_counters(0, 0, None, None)
+
+    def test_deleted_request_leaves_the_counters(self):
+        waiting = self.request_elevator(9)
+        self.request_elevator(4)
+        response = self.client.delete(f'/api/elevator/request-elevator/{waiting}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_counters(1, 0, 4, 4)
+        self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator', {}, format='json')
+        self.client.delete(f'/api/elevator/request-elevator/{Request.objects.get().id}/')
+        self.assert_counters(0, 0, None, None)
+        response = self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_reconcile_command_rebuilds_counters(self):
+        Request.objects.create(pick_up_floor=4, elevator=self.elevator)
+        Request.objects.create(pick_up_floor=1, destination_floor=12, elevator=self.elevator, status=REQUEST_STATUS_CHOICES.BOARDED)
+        out = StringIO()
+        call_command('reconcile_elevator_counters', '--system', str(self.system.id), stdout=out)
+        self.assertIn('1 elevators corrected', out.getvalue())
+        self.assert_counters(1, 1, 4, 12)
+
+
+class DemandRollupTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.system = System.objects.create(name='system 1', elevators_count=1, max_floors=20)
+        self.elevator = Elevator.objects.create(system=self.system)
+
+    def request_elevator(self, pickup_floor):
+        return self.client.post(
+            '/api/elevator/request-elevator/', {'pick_up_floor': pickup_floor, 'system': self.system.id}, format='json'
+        ).data['id']
+
+    def demand(self, **params):
+        return self.client.get(f'/api/elevatorsystem/{self.system.id}/demand/', params)
+
+    def test_trips_are_rolled_up_as_requests_are_served(self):
+        riding = self.request_elevator(0)
+        self.client.put(f'/api/elevator/request-elevator/{riding}/', {'destination_floor': 5}, format='json')
+        waiting = self.request_elevator(3)
+        self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator', {}, format='json')
+        self.client.put(f'/api/elevator/request-elevator/{waiting}/', {'destination_floor': 1}, format='json')
+        for _ in range(2):
+            self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator', {}, format='json')
+        served = Request.objects.get(id=waiting)
+        self.assertEqual(served.status, REQUEST_STATUS_CHOICES.FULFILLED)
+        self.assertTrue(served.created_at <= served.boarded_at <= served.fulfilled_at)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.demand(group_by='floor')
+        self.assertFalse([query for query in queries if Request._meta.db_table in query['sql']])
+        floors = {row['floor']: (row['requests'], row['trips']) for row in response.data['demand']}
+        self.assertEqual(floors, {0: (1, 1), 3: (1, 1)})
+        directions = {(row['floor'], row['direction']) for row in self.demand().data['demand'] if row['trips']}
+        self.assertEqual(directions, {(0, TRIP_DIRECTION_CHOICES.UP), (3, TRIP_DIRECTION_CHOICES.DOWN)})
+        self.assertEqual(self.demand(floor=3, hour=(timezone.now().hour + 1) % 24).data['demand'], [])
+
+    def test_invalid_parameters(self):
+        for params in [{'after': 'yesterday'}, {'floor': '-1'}, {'hour': '24'}, {'group_by': 'elevator'}]:
+            self.assertEqual(self.demand(**params).status_code, 400)
+
+
+class ArchiveRequestsTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.system = System.objects.create(name='system 1', elevators_count=1, max_floors=20)
+        self.other_system = System.objects.create(name='system 2', elevators_count=1, max_floors=20)
+        self.elevator = Elevator.objects.create(system=self.system)
+        other_elevator = Elevator.objects.create(system=self.other_system)
+        for floor in range(5):
+            Request.objects.create(pick_up_floor=floor, destination_floor=9, elevator=self.elevator, status=REQUEST_STATUS_CHOICES.FULFILLED)
+        Request.objects.create(pick_up_floor=3, destination_floor=0, elevator=other_elevator, status=REQUEST_STATUS_CHOICES.FULFILLED)
+        self.in_flight = Request.objects.create(pick_up_floor=4, elevator=self.elevator)
+
+    def test_fulfilled_requests_move_in_batches(self):
+        out = StringIO()
+        call_command('archive_requests', '--batch-size', '2', stdout=out)
+        self.assertIn('6 requests archived in 3 batches', out.getvalue())
+        self.assertEqual(list(Request.objects.values_list('id', flat=True)), [self.in_flight.id])
+        self.assertEqual(RequestHistory.objects.filter(system=self.system, elevator=self.elevator).count(), 5)
+
+    def test_max_batches_bounds_a_run(self):
+        call_command('archive_requests', '--batch-size', '2', '--max-batches', '1', stdout=StringIO())
+        self.assertEqual(RequestHistory.objects.count(), 2)
+
+    def test_history_api(self):
+        call_command('archive_requests', stdout=StringIO())
+        response = self.client.get('/api/elevator/request-history/', {'system': self.system.id, 'page_size': 3})
+        self.assertEqual([item['pick_up_floor'] for item in response.data['results']], [4, 3, 2])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['pick_up_floor'] for item in response.data['results']], [1, 0])
+        self.assertIsNone(response.data['next'])
+
+
+class RequestListingTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.system = System.objects.create(name='system 1', elevators_count=2, max_floors=20)
+        other_system = System.objects.create(name='system 2', elevators_count=1, max_floors=20)
+        self.elevator = Elevator.objects.create(system=self.system)
+        other_elevator = Elevator.objects.create(system=other_system)
+        self.requests = [
+            Request.objects.create(pick_up_floor=floor, elevator=self.elevator, status=status)
+            for floor, status in zip(range(10), [REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED] * 5)
+        ]
+        Request.objects.create(pick_up_floor=5, elevator=other_elevator)
+
+    def test_filters_and_cursor(self):
+        params = {'system': self.system.id, 'status': 'Active', 'min_floor': 2, 'page_size': 2}
+        response = self.client.get('/api/elevator/request-elevator/', params)
+        self.assertEqual([item['pick_up_floor'] for item in response.data['results']], [2, 4])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['pick_up_floor'] for item in response.data['results']], [6, 8])
+
+    def test_sparse_fields_skip_model_instances(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/elevator/request-elevator/', {'elevator': self.elevator.id, 'fields': 'status'})
+        self.assertEqual(response.data['results'][:2], [{'status': 'Active'}, {'status': 'Boarded'}])
+        response = self.client.get(f'/api/elevator/{self.elevator.id}/get-active-requests', {'fields': 'id,elevator'})
+        self.assertEqual(response.data[0], {'id': self.requests[0].id, 'elevator': self.elevator.id})
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/elevator/request-elevator/', {'fields': 'id,secret'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/elevator/request-elevator/', {'status': 'Lost'}).status_code, 400)
+
+
+class SimulateTrafficTestCase(TestCase):
+
+    def run_simulation(self, *args):
+        out = StringIO()
+        call_command('simulate_traffic', '--json', '--duration', '120', '--rate', '20', *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_every_pattern_serves_all_passengers(self):
+        for pattern in ['up-peak', 'down-peak', 'inter-floor']:
+            report = self.run_simulation('--pattern', pattern, '--max-queries-per-operation', '9')
+            self.assertEqual(report['served'], report['passengers'])
+            self.assertGreater(report['passengers'], 0)
+
+    def test_trace_replay(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as trace:
+            for arrival_time, pick_up_floor, destination_floor in [(0, 0, 5), (3, 7, 1), (4, 2, 9)]:
+                trace.write(json.dumps({
+                    'time': arrival_time, 'pick_up_floor': pick_up_floor, 'destination_floor': destination_floor
+                }) + '\n')
+            trace.flush()
+            report = self.run_simulation('--pattern', 'trace', '--trace', trace.name)
+        self.assertEqual(report['served'], 3)
+        self.assertFalse(System.objects.exists())
+
+
+class LoadTestTestCase(LiveServerTestCase):
+
+    def test_report_per_route(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command(
+                'load_test', '--url', self.live_server_url, '--clients', '2', '--duration', '1', '--elevators', '2',
+                '--output', output.name, stdout=StringIO()
+            )
+            report = json.load(output)
+        self.assertEqual(report['requests'], sum(route['requests'] for route in report['routes'].values()))
+        request_elevator = report['routes']['request-elevator']
+        self.assertGreater(request_elevator['statuses']['201'], 0)
+        self.assertLessEqual(request_elevator['p50_ms'], request_elevator['p99_ms'])
+        self.assertTrue(Request.objects.exists())
+
+    def test_local_server_runs_on_a_throwaway_database(self):
+        command = 'elevator.management.commands.load_test'
+        with mock.patch(f'{command}.setup_databases', return_value='old config') as setup_databases, \
+                mock.patch(f'{command}.teardown_databases') as teardown_databases, \
+                mock.patch(f'{command}.LoadTest.run', side_effect=OSError('connection refused')):
+            with self.assertRaises(CommandError):
+                call_command('load_test', '--clients', '1', '--duration', '1', stdout=StringIO())
+        setup_databases.assert_called_once()
+        # dropped even though the run failed
+        teardown_databases.assert_called_once_with('old config', verbosity=0)
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        registry.reset()
+
+    def test_actions_and_dispatch_tiers_are_exposed(self):
+        system = System.objects.create(name='system 1', elevators_count=1, max_floors=10)
+        elevator = Elevator.objects.create(system=system)
+        self.client.post('/api/elevator/request-elevator/', {'pick_up_floor': 4, 'system': system.id}, format='json')
+        self.client.get(f'/api/elevator/{elevator.id}/next-floor')
+
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('elevator_api_request_duration_seconds_count{viewset="RequestViewSet",action="create"} 1', body)
+        self.assertIn('elevator_api_db_queries_count{viewset="ElevatorViewSet",action="get_next_floor"} 1', body)
+        self.assertIn('elevator_api_responses_total{viewset="ElevatorViewSet",action="get_next_floor",status="2xx"} 1', body)
+        self.assertIn('elevator_dispatch_tier_total{tier="idle_nearest"} 1', body)
+
+    def test_retried_dispatch_counts_once(self):
+        system = System.objects.create(name='system 1', elevators_count=1, max_floors=10)
+        Elevator.objects.create(system=system)
+        self.client.post('/api/elevator/request-elevator/', {'pick_up_floor': 4, 'system': system.id}, format='json')
+        registry.reset()
+        conflicts = iter([ElevatorUpdateConflict()])
+
+        def save_after_a_conflict(*args, **kwargs):
+            conflict = next(conflicts, None)
+            if conflict is not None:
+                raise conflict
+            return save_elevator_fields(*args, **kwargs)
+
+        with mock.patch('elevator.views.save_elevator_fields', side_effect=save_after_a_conflict):
+            response = self.client.post('/api/elevator/request-elevator/', {'pick_up_floor': 4, 'system': system.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(registry.dispatch_tiers, {'coalesced': 1})
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram((1, 2, 4))
+        for value in (1, 3, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.render('queries', 'action="x"')[:4], [
+            'queries_bucket{action="x",le="1"} 1',
+            'queries_bucket{action="x",le="2"} 1',
+            'queries_bucket{action="x",le="4"} 3',
+            'queries_bucket{action="x",le="+Inf"} 4',
+        ])
+
+
+class ElevatorVersioningTestCase(TestCase):
+
+    def setUp(self):
+        self.system = System.objects.create(name='system 1', elevators_count=1, max_floors=10)
+        self.elevator = Elevator.objects.create(system=self.system)
+
+    def test_stale_write_is_rejected(self):
+        first_read = Elevator.objects.get(id=self.elevator.id)
+        second_read = Elevator.objects.get(id=self.elevator.id)
+        first_read.door_status = DOOR_STATUS_CHOICES.OPEN
+        save_elevator_fields(first_read, ['door_status'])
+        second_read.current_floor = 4
+        with self.assertRaises(ElevatorUpdateConflict):
+            save_elevator_fields(second_read, ['current_floor'])
+
+    def test_move_does_not_overwrite_a_door_toggle(self):
+        Request.objects.create(pick_up_floor=3, elevator=self.elevator)
+        stale = Elevator.objects.get(id=self.elevator.id)
+        ElevatorViewSet().perform_update_doors(DoorStatusSerializer(Elevator.objects.get(id=self.elevator.id)))
+        # the move was decided on a closed door, the retry sees the door is open now
+        with self.assertRaisesMessage(ValidationError, 'close the door'):
+            ElevatorViewSet().perform_move_elevator(MoveElevatorSerializer(stale))
+        self.elevator.refresh_from_db()
+        self.assertEqual(self.elevator.door_status, DOOR_STATUS_CHOICES.OPEN)
+        self.assertEqual(self.elevator.current_floor, 0)
+
+
+class ElevatorConcurrencyTestCase(TransactionTestCase):
+
+    ELEVATORS = 10
+    # every thread toggles every elevator once, so a toggle can only lose its race to the THREADS - 1 toggles of
+    # the other threads and the retry budget provably suffices
+    THREADS = ELEVATOR_UPDATE_ATTEMPTS
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('threads can not share an in memory SQLite database, set a TEST NAME file for it')
+
+    def test_concurrent_door_toggles_are_not_lost(self):
+        system = System.objects.create(name='system 1', elevators_count=self.ELEVATORS, max_floors=10)
+        elevators = [Elevator.objects.create(system=system) for _ in range(self.ELEVATORS)]
+        errors = []
+
+        def toggle():
+            try:
+                for elevator in elevators:
+                    ElevatorViewSet().perform_update_doors(DoorStatusSerializer(Elevator.objects.get(id=elevator.id)))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=toggle) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for elevator in elevators:
+            elevator.refresh_from_db()
+            self.assertEqual(elevator.version, self.THREADS)
+            self.assertEqual(
+                elevator.door_status,
+                DOOR_STATUS_CHOICES.CLOSED if self.THREADS % 2 == 0 else DOOR_STATUS_CHOICES.OPEN
+            )
+
+
+class ElevatorReadCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.system = System.objects.create(name='system 1', elevators_count=1, max_floors=10)
+        self.elevator = Elevator.objects.create(system=self.system)
+
+    def get_next_floor(self):
+        return self.client.get(f'/api/elevator/{self.elevator.id}/next-floor').data['next_floor']
+
+    def test_polls_hit_the_database_only_after_a_change(self):
+        self.client.post('/api/elevator/request-elevator/', {'pick_up_floor': 4, 'system': self.system.id}, format='json')
+        self.assertEqual(self.get_next_floor(), 4)
+        self.client.get(f'/api/elevator/{self.elevator.id}/get-active-requests')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_next_floor(), 4)
+            self.assertEqual(len(self.client.get(f'/api/elevator/{self.elevator.id}/get-active-requests').data), 1)
+
+        self.client.patch(f'/api/elevator/{self.elevator.id}/move-elevator', {}, format='json')
+        response = self.client.get(f'/api/elevator/{self.elevator.id}/get-active-requests')
+        self.assertEqual(response.data[0]['status'], REQUEST_STATUS_CHOICES.BOARDED)
+
+        request_id = response.data[0]['id']
+        self.client.put(f'/api/elevator/request-elevator/{request_id}/', {'destination_floor': 7}, format='json')
+        self.assertEqual(self.get_next_floor(), 7)
+
+    def test_maintainance_clears_cached_reads(self):
+        self.client.post('/api/elevator/request-elevator/', {'pick_up_floor': 4, 'system': self.system.id}, format='json')
+        self.assertEqual(self.get_next_floor(), 4)
+        self.client.patch(f'/api/elevator/{self.elevator.id}/under-maintainance', {}, format='json')
+        self.assertIn('no requests', self.get_next_floor())
+
+
+@skipIf('replica' not in settings.DATABASES, 'no replica database is configured')
+@override_settings(ELEVATOR_READ_DATABASE='replica')
+class ReadReplicaRoutingTestCase(TestCase):
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    def test_read_actions_use_the_replica(self):
+        client = APIClient()
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.assertEqual(client.get('/api/elevatorsystem/').status_code, 200)
+            self.assertEqual(client.get('/api/elevator/request-elevator/').status_code, 200)
+        self.assertEqual(len(replica_queries), 2)
+
+    def test_metrics_count_replica_queries(self):
+        registry.reset()
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            APIClient().get('/api/elevatorsystem/')
+        self.assertEqual(registry.query_counts[('ElevatorSystemViewSet', 'list')].sum, len(replica_queries))
+        self.assertEqual(len(replica_queries), 1)
+
+
+@skipIf('replica' not in settings.DATABASES, 'no replica database is configured')
+@override_settings(ELEVATOR_READ_DATABASE='replica')
+class ReadYourWritesTestCase(TestCase):
+    """
+    queries to the replica are not allowed here so a read routed there fails the test
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_reads_after_a_write_use_the_primary(self):
+        self.client.post('/api/elevatorsystem/', {'name': 'system', 'elevators_count': 1, 'max_floors': 10}, format='json')
+        elevator = Elevator.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/elevator/{elevator.id}/open-close-doors', {}, format='json')
+        self.assertIn(READ_YOUR_WRITES_COOKIE, response.cookies)
+        self.assertEqual(len(self.client.get('/api/elevatorsystem/').data), 1)
+        # another client reading the elevator which was just changed
+        self.assertEqual(APIClient().get(f'/api/elevator/{elevator.id}/get-active-requests').data, [])
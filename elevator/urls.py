@@ -1,13 +1,15 @@
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 from .views import (
-    ElevatorViewSet, RequestViewSet
+    ElevatorViewSet, RequestHistoryViewSet, RequestViewSet
 )
 
 router = SimpleRouter()
 router.register('', ElevatorViewSet)
 request_router = SimpleRouter()
 request_router.register('', RequestViewSet)
+history_router = SimpleRouter()
+history_router.register('', RequestHistoryViewSet)
 
 
 
@@ -18,5 +20,7 @@ urlpatterns = [
     path('<int:elevator_id>/open-close-doors', ElevatorViewSet.as_view({'patch': 'open_close_doors'}), name='open_close_doors'),
     path('<int:elevator_id>/under-maintainance', ElevatorViewSet.as_view({'patch': 'mark_under_maintainance'}), name='mark_under_maintainance'),
     path('<int:elevator_id>/next-floor', ElevatorViewSet.as_view({'get': 'get_next_floor'}), name='get_next_floor'),
+    path('<int:elevator_id>/enter-destinations', ElevatorViewSet.as_view({'patch': 'enter_destinations'}), name='enter_destinations'),
     path('request-elevator/', include(request_router.urls)),
+    path('request-history/', include(history_router.urls)),
 ]
@@ -1,74 +1,267 @@
-from rest_framework.exceptions import ValidationError
-from django.db.models.functions import Coalesce
-from django.db.models import Subquery, OuterRef, Count, IntegerField, F, Value, Q, Func
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.db.models.functions import RowNumber
+from django.db.models import IntegerField, F, Value, Q, Func, Case, When, Window, Min, Max
 
-from elevator.models import ELEVATOR_STATUS_CHOICES, REQUEST_STATUS_CHOICES, Elevator, Request
+from elevator import metrics
+from elevator.analytics import record_requests_fulfilled
+from elevator.dispatch import assign_calls_by_cost, uses_cost_matrix
+from elevator.engine import (
+    Call, Car, add_call, add_stop, assign_elevator_to_pickup, choose_elevator,
+    get_elevator_coming_to, get_next_floor, get_next_floor_from_plan, move_car, set_stop_range,
+)
+from elevator.models import ELEVATOR_STATUS_CHOICES, REQUEST_STATUS_CHOICES, Elevator, Request, RequestHistory
 
-def get_most_suitable_elevator(pickup_floor: int):
+ELEVATOR_UPDATE_ATTEMPTS = 5
+COALESCED_TIER = 6
+
+
+class ElevatorUpdateConflict(APIException):
+    """
+    raised when an elevator was changed by another call after it was read
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Elevator was updated by another request, please retry.'
+    default_code = 'conflict'
+
+
+def save_elevator_fields(elevator, fields, expressions=None):
+    """
+    writes only the given fields and expressions of the elevator if nobody changed it since it was read
+    and bumps its version, raises ElevatorUpdateConflict otherwise
+    """
+    updated = Elevator.objects.filter(id=elevator.id, version=elevator.version).update(
+        version=F('version') + 1, **{field: getattr(elevator, field) for field in fields}, **(expressions or {})
+    )
+    if not updated:
+        raise ElevatorUpdateConflict()
+    elevator.version += 1
+
+def change_request_counters(elevator, active: int = 0, boarded: int = 0, pick_up_floors=(), drop_off_floors=()):
+    """
+    applies a change of the pending requests to the in memory elevator and returns the update making
+    the same change in the database, counts are F() expressions and the route plan is written as a whole,
+    so callers have to hold the elevator (versioned save or row lock)
+    """
+    expressions = {}
+    if active:
+        elevator.active_request_count += active
+        expressions['active_request_count'] = F('active_request_count') + active
+    if boarded:
+        elevator.boarded_request_count += boarded
+        expressions['boarded_request_count'] = F('boarded_request_count') + boarded
+    pick_up_floors = [floor for floor in pick_up_floors if floor is not None]
+    drop_off_floors = [floor for floor in drop_off_floors if floor is not None]
+    if pick_up_floors or drop_off_floors:
+        for floor in pick_up_floors:
+            add_stop(elevator.pick_up_stops, floor)
+        for floor in drop_off_floors:
+            add_stop(elevator.drop_off_stops, floor)
+        set_stop_range(elevator)
+        expressions.update({field: getattr(elevator, field) for field in ROUTE_PLAN_FIELDS})
+    return expressions
+
+def set_request_counters_in_memory(elevator, pending_requests):
     """
-    returns most suitable elevator_id for an elevator request based on the business logic
+    sets the pending request counters and the route plan of an in memory elevator from its pending requests
     """
-    request_count_subquery = Request.objects.filter(
-        elevator_id=OuterRef('id'), 
-        status__in=[REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED]
-    ).annotate(request_count=Coalesce(Count('id'), Value(0))).values('request_count')[:1]
+    elevator.active_request_count = sum(1 for request in pending_requests if request.status == REQUEST_STATUS_CHOICES.ACTIVE)
+    elevator.boarded_request_count = sum(1 for request in pending_requests if request.status == REQUEST_STATUS_CHOICES.BOARDED)
+    elevator.pick_up_stops = sorted({
+        request.pick_up_floor for request in pending_requests if request.status == REQUEST_STATUS_CHOICES.ACTIVE
+    })
+    elevator.drop_off_stops = sorted({
+        request.destination_floor for request in pending_requests
+        if request.status == REQUEST_STATUS_CHOICES.BOARDED and request.destination_floor is not None
+    })
+    set_stop_range(elevator)
 
-    elevators_with_active_request_count = Elevator.objects.filter(is_under_maintainance=False).annotate(
-        request_count = Coalesce(
-        Subquery(request_count_subquery, output_field=IntegerField()), Value(0)
+def refresh_request_counters(elevator, changed_requests=()):
+    """
+    sets the pending request counters and the route plan of an in memory elevator from its pending requests,
+    changed_requests are taken as they are in memory in place of their stored copies
+    """
+    changed_requests = {changed_request.id: changed_request for changed_request in changed_requests}
+    set_request_counters_in_memory(elevator, [
+        changed_requests.get(pending_request.id, pending_request)
+        for pending_request in get_all_requests_for_elevator(elevator.id).only('status', 'pick_up_floor', 'destination_floor')
+    ])
+
+ROUTE_PLAN_FIELDS = ['pick_up_stops', 'drop_off_stops', 'min_stop_floor', 'max_stop_floor']
+PENDING_REQUEST_FIELDS = ['active_request_count', 'boarded_request_count', *ROUTE_PLAN_FIELDS]
+# the request fields a move changes
+REQUEST_STATUS_FIELDS = ['status', 'boarded_at', 'fulfilled_at']
+
+def reconcile_request_counters(elevators=None):
+    """
+    rebuilds the pending request counters and route plans of the elevators from the requests table
+    returns the elevators which were wrong
+    """
+    elevators = Elevator.objects.all() if elevators is None else elevators
+    elevators = list(elevators.select_for_update().order_by('id'))
+    pending_requests_by_elevator = {elevator.id: [] for elevator in elevators}
+    for pending_request in Request.objects.filter(
+        elevator__in=elevators, status__in=[REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED]
+    ).only('elevator_id', 'status', 'pick_up_floor', 'destination_floor'):
+        pending_requests_by_elevator[pending_request.elevator_id].append(pending_request)
+
+    elevators_corrected = []
+    for elevator in elevators:
+        stored = [getattr(elevator, field) for field in PENDING_REQUEST_FIELDS]
+        set_request_counters_in_memory(elevator, pending_requests_by_elevator[elevator.id])
+        if stored != [getattr(elevator, field) for field in PENDING_REQUEST_FIELDS]:
+            elevator.version += 1
+            elevators_corrected.append(elevator)
+    Elevator.objects.bulk_update(elevators_corrected, [*PENDING_REQUEST_FIELDS, 'version'])
+    return elevators_corrected
+
+def run_with_elevator_retry(func, elevator=None):
+    """
+    runs func in a transaction and runs it again when it hits an ElevatorUpdateConflict,
+    reloading the elevator first so the decision is made on fresh state.
+    returns what func returns
+    """
+    for attempt in range(ELEVATOR_UPDATE_ATTEMPTS):
+        if attempt and elevator is not None:
+            elevator.refresh_from_db()
+        try:
+            with transaction.atomic():
+                return func()
+        except ElevatorUpdateConflict:
+            if attempt == ELEVATOR_UPDATE_ATTEMPTS - 1:
+                raise
+
+def get_most_suitable_elevator(pickup_floor: int, system_id: int = None):
+    """
+    returns most suitable elevator_id for an elevator request and records the tier it won with
+    """
+    elevator_id, dispatch_tier = rank_most_suitable_elevator(pickup_floor, system_id)
+    metrics.registry.record_dispatch_tier(dispatch_tier)
+    return elevator_id
+
+def rank_most_suitable_elevator(pickup_floor: int, system_id: int = None):
+    """
+    returns most suitable elevator_id for an elevator request based on the business logic and the tier it won with
+
+    The whole tiered policy is ranked inside a single SQL statement:
+    1. elevators at the pickup floor, least requests first
+    2. idle elevators, nearest first
+    3. nearest elevator below going up and nearest elevator above going down,
+       the one with least requests wins (below on a tie)
+    4. any other elevator, least requests and then nearest first
+    """
+    ranked_elevators = get_elevators_ranked_for_pickup(pickup_floor, system_id)
+    best_elevator = ranked_elevators.values_list('id', 'dispatch_tier').first()
+    if best_elevator is None:
+        raise ValidationError('System is not initialized yet or all elevators are under maintainance')
+
+    return best_elevator
+
+def hall_call_coalescing_enabled():
+    return getattr(settings, 'ELEVATOR_COALESCE_HALL_CALLS', True)
+
+def get_elevator_waited_for(pickup_floor: int, system_id: int = None):
+    """
+    returns the elevator already coming for somebody waiting at the pickup floor annotated with systems_max_floor,
+    None when nobody is waiting there
+    """
+    elevators = Elevator.objects.filter(
+        is_under_maintainance=False, request__pick_up_floor=pickup_floor, request__status=REQUEST_STATUS_CHOICES.ACTIVE
+    )
+    if system_id is not None:
+        elevators = elevators.filter(system_id=system_id)
+    return elevators.annotate(systems_max_floor=F('system__max_floors')).order_by('id').first()
+
+def get_available_elevators(system_id: int = None):
+    """
+    returns queryset of elevators not under maintainance annotated with their pending request count
+    """
+    elevators = Elevator.objects.filter(is_under_maintainance=False)
+    if system_id is not None:
+        elevators = elevators.filter(system_id=system_id)
+
+    return elevators.annotate(
+        request_count=F('active_request_count') + F('boarded_request_count'),
+    )
+
+def get_elevators_ranked_for_pickup(pickup_floor: int, system_id: int = None):
+    """
+    returns queryset of available elevators ordered by how suitable they are for the pickup floor
+    """
+    elevators = get_available_elevators(system_id).annotate(
+        floor_difference=Func(F('current_floor') - pickup_floor, function='ABS', output_field=IntegerField()),
+        dispatch_tier=Case(
+            When(current_floor=pickup_floor, then=Value(1)),
+            When(elevator_status=ELEVATOR_STATUS_CHOICES.IDLE, then=Value(2)),
+            When(current_floor__lt=pickup_floor, elevator_status=ELEVATOR_STATUS_CHOICES.GOING_UP, then=Value(3)),
+            When(current_floor__gt=pickup_floor, elevator_status=ELEVATOR_STATUS_CHOICES.GOING_DOWN, then=Value(3)),
+            default=Value(4),
+            output_field=IntegerField(),
         ),
-        floor_difference=Func(F('current_floor') - pickup_floor, function='ABS')
+        # 0 for elevators below the pickup floor, 1 for elevators above it
+        dispatch_side=Case(
+            When(current_floor__lt=pickup_floor, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ),
+    )
+    # position of the elevator among the elevators on the same side and tier, nearest first
+    elevators = elevators.annotate(
+        side_rank=Window(
+            RowNumber(),
+            partition_by=[F('dispatch_tier'), F('dispatch_side')],
+            order_by=[F('floor_difference').asc(), F('request_count').asc(), F('id').asc()],
+        )
+    )
+
+    return elevators.order_by(
+        'dispatch_tier',
+        # only the nearest elevator below and the nearest one above compete in tier 3
+        Case(When(dispatch_tier=3, then=F('side_rank')), default=Value(1), output_field=IntegerField()),
+        Case(When(dispatch_tier=2, then=F('floor_difference')), default=F('request_count'), output_field=IntegerField()),
+        Case(When(dispatch_tier=3, then=F('dispatch_side')), default=F('floor_difference'), output_field=IntegerField()),
+        'id',
     )
 
-    if not elevators_with_active_request_count:
+def choose_elevator_for_pickup(elevators, pickup_floor: int):
+    """
+    returns the most suitable elevator out of in memory elevators having request_count set,
+    following the same tiers as get_most_suitable_elevator
+    """
+    if not elevators:
         raise ValidationError('System is not initialized yet or all elevators are under maintainance')
 
-    # assign elevator with minimal requests active 
-    elevator_id = None
-    #  check if any elevator is at the same floor and status is halt
-    elevators_at_current_floor = elevators_with_active_request_count.filter(current_floor=pickup_floor).order_by('request_count')
-    if elevators_at_current_floor:
-        elevator_id = elevators_at_current_floor.first().id
-    
-    #  check if some elevator is having no request
-    if not elevator_id:
-        elevators_with_no_request = elevators_with_active_request_count.filter(elevator_status=ELEVATOR_STATUS_CHOICES.IDLE).order_by('floor_difference')
-        elevator_id = elevators_with_no_request.first().id if elevators_with_no_request else None
-    
-    #  check if there is some elevator on floor above and comming down or floor below and going up
-    #  take the nearest one.
-    if not elevator_id:
-        elevators_below_and_comming_up = elevators_with_active_request_count.filter(
-            current_floor__lt=pickup_floor,
-            elevator_status__in=[ELEVATOR_STATUS_CHOICES.GOING_UP, ELEVATOR_STATUS_CHOICES.IDLE],
-        ).order_by('floor_difference', 'request_count')
-        
-        elevators_above_and_comming_down = elevators_with_active_request_count.filter(
-            elevator_status__in=[ELEVATOR_STATUS_CHOICES.GOING_DOWN, ELEVATOR_STATUS_CHOICES.IDLE],
-            current_floor__gt=pickup_floor,
-        ).order_by('floor_difference', 'request_count')
-        # when there are elevators below and above
-        if elevators_below_and_comming_up and elevators_above_and_comming_down:
-            #  if both are at same distance from pickup floor take the one with least request
-            if elevators_below_and_comming_up.first().floor_difference == elevators_above_and_comming_down.first().floor_difference:
-                elevator_id = (
-                    elevators_below_and_comming_up.first().id if elevators_below_and_comming_up.first().request_count <= elevators_above_and_comming_down.first().request_count
-                    else elevators_above_and_comming_down.first().id
-                )
-            else:
-                elevator_id = (
-                    elevators_below_and_comming_up.first().id if elevators_below_and_comming_up.first().request_count <= elevators_above_and_comming_down.first().request_count 
-                    else elevators_above_and_comming_down.first().id
-                )
-        elif not (elevator_id or elevators_below_and_comming_up):
-            #  when only elevators above current floor are present
-            elevator_id = elevators_above_and_comming_down.first().id
+    elevator, tier = choose_elevator(elevators, pickup_floor)
+    metrics.registry.record_dispatch_tier(tier)
+    return elevator
 
+def choose_elevators_for_pickups(system, elevators, pick_up_floors):
+    """
+    yields the elevator for each pick up floor, with the rules each choice sees the calls assigned before it.
+    a floor somebody already waits at gets the elevator coming for them instead of being dispatched again
+    """
+    coalesce = hall_call_coalescing_enabled()
+    if uses_cost_matrix(system):
+        if not coalesce:
+            yield from assign_calls_by_cost(elevators, pick_up_floors)
+            return
+        chosen = {pickup_floor: get_elevator_coming_to(elevators, pickup_floor) for pickup_floor in pick_up_floors}
+        floors_to_dispatch = [pickup_floor for pickup_floor, elevator in chosen.items() if elevator is None]
+        if floors_to_dispatch:
+            chosen.update(zip(floors_to_dispatch, assign_calls_by_cost(elevators, floors_to_dispatch)))
+        metrics.registry.record_dispatch_tier(COALESCED_TIER, len(pick_up_floors) - len(floors_to_dispatch))
+        yield from (chosen[pickup_floor] for pickup_floor in pick_up_floors)
+        return
+    for pickup_floor in pick_up_floors:
+        elevator = get_elevator_coming_to(elevators, pickup_floor) if coalesce else None
+        if elevator is None:
+            yield choose_elevator_for_pickup(elevators, pickup_floor)
         else:
-            #  when only below elevators are present
-            elevator_id = elevators_below_and_comming_up.first().id
-    
-    return elevator_id
+            metrics.registry.record_dispatch_tier(COALESCED_TIER)
+            yield elevator
 
 def get_all_requests_for_elevator(elevator_id: int):
     """
@@ -76,125 +269,178 @@ def get_all_requests_for_elevator(elevator_id: int):
     """
     return Request.objects.filter(elevator_id=elevator_id, status__in=[REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED])
 
+def get_nearest_floor_aggregates(current_floor: int):
+    """
+    returns the filtered Min/Max aggregates resolving the 4 nearest floors to board and deboard
+    """
+    return {
+        'nearest_floor_above_to_board': Min(
+            'pick_up_floor', filter=Q(pick_up_floor__gt=current_floor, status=REQUEST_STATUS_CHOICES.ACTIVE)
+        ),
+        'nearest_floor_above_to_deboard': Min(
+            'destination_floor', filter=Q(destination_floor__gt=current_floor, status=REQUEST_STATUS_CHOICES.BOARDED)
+        ),
+        'nearest_floor_down_to_board': Max(
+            'pick_up_floor', filter=Q(pick_up_floor__lt=current_floor, status=REQUEST_STATUS_CHOICES.ACTIVE)
+        ),
+        'nearest_floor_down_to_deboard': Max(
+            'destination_floor', filter=Q(destination_floor__lt=current_floor, status=REQUEST_STATUS_CHOICES.BOARDED)
+        ),
+    }
+
+def unpack_nearest_floors(floors: dict):
+    """
+    returns the 4 nearest floors out of an aggregate result made with get_nearest_floor_aggregates
+    """
+    return (
+        floors['nearest_floor_above_to_board'], floors['nearest_floor_above_to_deboard'],
+        floors['nearest_floor_down_to_board'], floors['nearest_floor_down_to_deboard'],
+    )
+
 def get_floors_above_below_to_board_and_deboard(all_requests_pending, current_floor: int):
     """
-    returns 4 objects 
+    returns 4 floors, None when there is no such floor, using a single query
     1. nearest_floor_above_to_board -> nearest floor above to pickup user
     2. nearest_floor_above_to_deboard -> nearest floor above to deoard user
     3. nearest_floor_down_to_board ->  nearest floor down to pickup user
     4. nearest_floor_down_to_deboard -> nearest floor above to deoard user
     """
-    nearest_floor_above_to_board = all_requests_pending.filter(pick_up_floor__gt=current_floor, status=REQUEST_STATUS_CHOICES.ACTIVE).order_by('pick_up_floor').first()
-    nearest_floor_above_to_deboard = all_requests_pending.filter(destination_floor__gt=current_floor, status=REQUEST_STATUS_CHOICES.BOARDED).order_by('destination_floor').first()
+    return unpack_nearest_floors(all_requests_pending.aggregate(**get_nearest_floor_aggregates(current_floor)))
 
-    nearest_floor_down_to_board = all_requests_pending.filter(pick_up_floor__lt=current_floor, status=REQUEST_STATUS_CHOICES.ACTIVE).order_by('-pick_up_floor').first()
-    nearest_floor_down_to_deboard = all_requests_pending.filter(destination_floor__lt=current_floor, status=REQUEST_STATUS_CHOICES.BOARDED).order_by('-destination_floor').first()
+def get_next_floor_for_elevator(all_requests, elevator_status, current_floor):
+    """
+    returns next floor the elevator will e going to, None when there are no requests
+    """
+    all_requests_pending = all_requests.filter(status__in=[REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED])
+    return get_next_floor(
+        *get_floors_above_below_to_board_and_deboard(all_requests_pending, current_floor), elevator_status, current_floor
+    )
 
-    return nearest_floor_above_to_board, nearest_floor_above_to_deboard, nearest_floor_down_to_board, nearest_floor_down_to_deboard
+def car_from_elevator(elevator, pending_requests):
+    """
+    returns an engine Car of the elevator with its pending requests as calls
+    """
+    car = Car(
+        elevator.id, elevator.current_floor, elevator.elevator_status, elevator.next_floor,
+        elevator.door_status, elevator.is_under_maintainance,
+    )
+    for pending_request in pending_requests:
+        add_call(car, Call(pending_request.id, pending_request.pick_up_floor, pending_request.destination_floor, pending_request.status))
+    return car
 
-def get_next_floor(nearest_floor_above_to_board, nearest_floor_above_to_deboard, nearest_floor_down_to_board, nearest_floor_down_to_deboard, elevator_status: str, current_floor: int):
+def apply_car_to_elevator(car: Car, elevator):
     """
-    returns the next floor the elevator will be going to
+    copies the position, status and pending request counters of the car back onto the elevator
     """
-    next_floor = None
-    if elevator_status == ELEVATOR_STATUS_CHOICES.IDLE and not(nearest_floor_above_to_deboard or nearest_floor_down_to_deboard):
-        # when elevator was at rest and someone boarded  it can be above or below or both
-        if nearest_floor_above_to_board and nearest_floor_down_to_board:
-            next_floor = (
-                nearest_floor_above_to_board.pick_up_floor 
-                if abs(nearest_floor_above_to_board.pick_up_floor - current_floor) <= abs(nearest_floor_down_to_board.pick_up_floor - current_floor)
-                else nearest_floor_down_to_board.pick_up_floor
-            )
-        else:
-            next_floor = (
-                nearest_floor_above_to_board.pick_up_floor 
-                if nearest_floor_above_to_board
-                else nearest_floor_down_to_board.pick_up_floor
-            )
-    elif elevator_status == ELEVATOR_STATUS_CHOICES.IDLE and (nearest_floor_above_to_deboard or nearest_floor_down_to_deboard):
-        # when elevator was idle and someone boarded at current floor and has to go up or down.
-        if nearest_floor_above_to_deboard and nearest_floor_down_to_deboard:
-            next_floor = (
-                nearest_floor_above_to_deboard.destination_floor 
-                if abs(nearest_floor_above_to_deboard.destination_floor - current_floor) <= abs(nearest_floor_down_to_deboard.destination_floor - current_floor)
-                else nearest_floor_down_to_deboard.destination_floor
-            )
-        else:
-            next_floor = (
-                nearest_floor_above_to_deboard.destination_floor 
-                if nearest_floor_above_to_deboard
-                else nearest_floor_down_to_deboard.destination_floor
-            )
-    elif elevator_status == ELEVATOR_STATUS_CHOICES.GOING_UP:
-        # check which is someone is there to board/de board up if both then choose the nearset floor
-        if not (nearest_floor_above_to_board or nearest_floor_above_to_deboard):
-            if nearest_floor_down_to_board and nearest_floor_down_to_deboard:
-                next_floor = (
-                    nearest_floor_down_to_board.pick_up_floor 
-                    if abs(nearest_floor_down_to_board.pick_up_floor - current_floor) <= abs(nearest_floor_down_to_deboard.destination_floor - current_floor)
-                    else nearest_floor_down_to_deboard.destination_floor
-                )
-            else:
-                next_floor = nearest_floor_down_to_board.pick_up_floor if nearest_floor_down_to_board else nearest_floor_down_to_deboard.destination_floor
-        # if there are requests to board and deboard above then will reach the first closest floor.
-        elif nearest_floor_above_to_board and nearest_floor_above_to_deboard:
-            next_floor = (
-                nearest_floor_above_to_board.pick_up_floor 
-                if abs(nearest_floor_above_to_board.pick_up_floor - current_floor) <= abs(nearest_floor_above_to_deboard.destination_floor - current_floor)
-                else nearest_floor_above_to_deboard.destination_floor
-            )
-        else:
-            next_floor = (
-                nearest_floor_above_to_board.pick_up_floor 
-                if nearest_floor_above_to_board else nearest_floor_above_to_deboard.destination_floor
-            )
-    else:
-        # case when list is going down we will take all requests which have to board or deboard till none are left in down side
-        if not (nearest_floor_down_to_board or nearest_floor_down_to_deboard):
-            if nearest_floor_above_to_board and nearest_floor_above_to_deboard:
-                next_floor = (
-                nearest_floor_above_to_board.pick_up_floor 
-                    if abs(nearest_floor_above_to_board.pick_up_floor - current_floor) <= abs(nearest_floor_above_to_deboard.destination_floor - current_floor)
-                    else nearest_floor_above_to_deboard.destination_floor
-                )
-            else:
-                next_floor = nearest_floor_above_to_board.pick_up_floor if nearest_floor_above_to_board else nearest_floor_above_to_deboard.destination_floor
-
-        elif nearest_floor_down_to_board and nearest_floor_down_to_deboard:
-            next_floor = (
-                nearest_floor_down_to_board.pick_up_floor 
-                if abs(nearest_floor_down_to_board.pick_up_floor - current_floor) <= abs(nearest_floor_down_to_deboard.destination_floor - current_floor)
-                else nearest_floor_down_to_deboard.destination_floor
-            )
-        else:
-            next_floor = (
-                nearest_floor_down_to_board.pick_up_floor 
-                if nearest_floor_down_to_board else nearest_floor_down_to_deboard.destination_floor
-            )
-    
-    return next_floor 
+    for field in ['current_floor', 'next_floor', 'elevator_status', *PENDING_REQUEST_FIELDS]:
+        value = getattr(car, field)
+        setattr(elevator, field, list(value) if isinstance(value, list) else value)
 
-def get_next_floor_for_elevator(all_requests, elevator_status, current_floor):
+def apply_calls_to_requests(calls, requests_by_id: dict):
     """
-    returns next floor the elevator will e going to
+    copies the status of the calls onto their requests stamping when they boarded or got fulfilled,
+    returns the requests
     """
-    all_requests_pending = all_requests.filter(status__in=[REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED])
-    if not all_requests_pending:
-        return None
-    nearest_floor_above_to_board, nearest_floor_above_to_deboard, nearest_floor_down_to_board, nearest_floor_down_to_deboard = (
-        get_floors_above_below_to_board_and_deboard(all_requests_pending, current_floor)
+    now = timezone.now()
+    changed = []
+    for call in calls:
+        changed_request = requests_by_id[call.id]
+        changed_request.status = call.status
+        if call.status == REQUEST_STATUS_CHOICES.BOARDED:
+            changed_request.boarded_at = now
+        elif call.status == REQUEST_STATUS_CHOICES.FULFILLED:
+            changed_request.boarded_at = changed_request.boarded_at or now
+            changed_request.fulfilled_at = now
+        changed.append(changed_request)
+    return changed
+
+def move_elevator_in_memory(elevator, pending_requests, parking_stop: int = None):
+    """
+    moves an in memory elevator to its next floor the same way ElevatorViewSet.perform_move_elevator does
+    and updates the status of its pending requests in place, an elevator without requests moves to parking_stop.
+    returns the list of requests whose status changed and a reason when the elevator could not move
+    """
+    car = car_from_elevator(elevator, pending_requests)
+    changed_calls, reason = move_car(car, parking_stop)
+    apply_car_to_elevator(car, elevator)
+    return apply_calls_to_requests(changed_calls, {pending_request.id: pending_request for pending_request in pending_requests}), reason
+
+def reassign_requests(elevator, system):
+    """
+    hands the pending requests of an elevator going under maintainance to the other elevators of its system
+    in one batch, boarded users get off at the current floor and call again from there keeping their destination.
+    requests nobody can take, or boarded at their destination, are fulfilled.
+    returns the reassigned requests, the fulfilled requests and the elevators given requests
+    """
+    pending_requests = list(get_all_requests_for_elevator(elevator.id).order_by('id'))
+    if not pending_requests:
+        return [], [], []
+    now = timezone.now()
+    arrived = [
+        pending_request for pending_request in pending_requests
+        if pending_request.status == REQUEST_STATUS_CHOICES.BOARDED and pending_request.destination_floor == elevator.current_floor
+    ]
+    elevators = list(get_available_elevators(system.id).exclude(id=elevator.id).select_for_update().order_by('id'))
+    fulfilled = [
+        pending_request for pending_request in pending_requests if not elevators or pending_request in arrived
+    ]
+    for pending_request in fulfilled:
+        pending_request.status = REQUEST_STATUS_CHOICES.FULFILLED
+        pending_request.fulfilled_at = now
+    reassigned = [pending_request for pending_request in pending_requests if pending_request.status != REQUEST_STATUS_CHOICES.FULFILLED]
+    # only riders handed to another elevator are picked up again where they got off, the others keep their origin
+    for pending_request in reassigned:
+        if pending_request.status == REQUEST_STATUS_CHOICES.BOARDED:
+            pending_request.pick_up_floor = elevator.current_floor
+
+    elevators_to_update = {}
+    pick_up_floors = [pending_request.pick_up_floor for pending_request in reassigned]
+    for pending_request, new_elevator in zip(reassigned, choose_elevators_for_pickups(system, elevators, pick_up_floors)):
+        elevators_to_update[new_elevator.id] = new_elevator
+        pending_request.elevator = new_elevator
+        pending_request.status = assign_elevator_to_pickup(new_elevator, pending_request.pick_up_floor, system.max_floors)
+        pending_request.boarded_at = now if pending_request.status == REQUEST_STATUS_CHOICES.BOARDED else None
+        new_elevator.request_count += 1
+        if pending_request.status == REQUEST_STATUS_CHOICES.BOARDED:
+            change_request_counters(new_elevator, boarded=1, drop_off_floors=[pending_request.destination_floor])
+        else:
+            # their destination joins the route plan when they board at the pick up floor
+            change_request_counters(new_elevator, active=1, pick_up_floors=[pending_request.pick_up_floor])
+
+    for new_elevator in elevators_to_update.values():
+        new_elevator.version += 1
+    Request.objects.bulk_update(pending_requests, ['elevator', 'pick_up_floor', *REQUEST_STATUS_FIELDS])
+    Elevator.objects.bulk_update(
+        elevators_to_update.values(), ['elevator_status', 'next_floor', 'version', *PENDING_REQUEST_FIELDS]
     )
-    #  if there are no requests then return next floor as null
-    if not(nearest_floor_above_to_board or nearest_floor_above_to_deboard or nearest_floor_down_to_board or nearest_floor_down_to_deboard):
-        return None
-    #  getting the next floor
-    return get_next_floor(nearest_floor_above_to_board, nearest_floor_above_to_deboard, nearest_floor_down_to_board, nearest_floor_down_to_deboard, elevator_status, current_floor)
+    record_requests_fulfilled(arrived, {elevator.id: system.id})
+    return reassigned, fulfilled, list(elevators_to_update.values())
 
-def remove_people_from_undermaintainance_elevator(elevator_id: int):
+def archive_fulfilled_requests_batch(batch_size: int):
     """
-    marks all elevator requests for this elevator as full filled 
-    user will have to again request an elevator
+    moves up to batch_size of the oldest fulfilled requests to the history table in one transaction
+    returns how many were moved
     """
-    all_request_active_or_boarded = get_all_requests_for_elevator(elevator_id)
-    all_request_active_or_boarded.update(status=REQUEST_STATUS_CHOICES.FULFILLED)
+    with transaction.atomic():
+        # rows another archiver already holds are skipped rather than waited for
+        fulfilled = list(
+            Request.objects.filter(status=REQUEST_STATUS_CHOICES.FULFILLED).order_by('id')
+            .select_for_update(skip_locked=True, of=('self',))
+            .values(
+                'id', 'pick_up_floor', 'destination_floor', 'elevator_id', 'elevator__system_id',
+                'created_at', 'boarded_at', 'fulfilled_at',
+            )[:batch_size]
+        )
+        if not fulfilled:
+            return 0
+        RequestHistory.objects.bulk_create([
+            RequestHistory(
+                request_id=request['id'], pick_up_floor=request['pick_up_floor'], destination_floor=request['destination_floor'],
+                elevator_id=request['elevator_id'], system_id=request['elevator__system_id'],
+                created_at=request['created_at'], boarded_at=request['boarded_at'], fulfilled_at=request['fulfilled_at'],
+            )
+            for request in fulfilled
+        ])
+        Request.objects.filter(id__in=[request['id'] for request in fulfilled]).delete()
+    return len(fulfilled)
 
@@ -1,20 +1,103 @@
-from elevator.serializers import AddDestianationFloorSerialzer, DoorStatusSerializer, MoveElevatorSerializer, RequestSerializer
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from elevator.analytics import record_requests_created, record_requests_fulfilled
+from elevator.cache import ACTIVE_REQUESTS, NEXT_FLOOR, get_or_set_elevator_cache, invalidate_elevator_cache
+from elevator.dispatch import COST_MATRIX_TIER, choose_elevators_by_cost, uses_cost_matrix
+from elevator.events import elevator_event, publish_on_commit, request_event, stop_event
+from elevator.metrics import InstrumentedViewSetMixin, registry
+from elevator.parking import get_parking_stops
+from elevator.routing import ReadReplicaViewSetMixin, elevator_recently_written
+from elevator.serializers import (
+    AddDestianationFloorSerialzer, BulkRequestSerializer, DoorStatusSerializer, EnterDestinationsSerializer, MoveElevatorSerializer,
+    RequestHistorySerializer, RequestSerializer
+)
 from rest_framework.response import Response
-from .models import DOOR_STATUS_CHOICES, ELEVATOR_STATUS_CHOICES, REQUEST_STATUS_CHOICES, Elevator, Request
-from rest_framework.exceptions import ValidationError,  MethodNotAllowed
-from django.db.models import F, Q
+from .models import DOOR_STATUS_CHOICES, ELEVATOR_STATUS_CHOICES, REQUEST_STATUS_CHOICES, Elevator, Request, RequestHistory
+from rest_framework.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
 from rest_framework import viewsets
+from rest_framework.pagination import CursorPagination
 from rest_framework.decorators import action
 
-from elevator.utils import get_all_requests_for_elevator, get_floors_above_below_to_board_and_deboard, get_most_suitable_elevator, get_next_floor, get_next_floor_for_elevator, remove_people_from_undermaintainance_elevator
+from elevator.engine import move_car
+from system.models import PARKING_POLICY_CHOICES
+from elevator.utils import (
+    COALESCED_TIER, PENDING_REQUEST_FIELDS, REQUEST_STATUS_FIELDS, apply_calls_to_requests, apply_car_to_elevator, assign_elevator_to_pickup,
+    car_from_elevator, change_request_counters, choose_elevators_for_pickups,
+    get_all_requests_for_elevator, get_available_elevators, get_elevator_waited_for,
+    get_next_floor_from_plan, hall_call_coalescing_enabled, move_elevator_in_memory, rank_most_suitable_elevator,
+    reassign_requests, refresh_request_counters, run_with_elevator_retry, save_elevator_fields, set_request_counters_in_memory
+)
 
-class ElevatorViewSet(viewsets.ModelViewSet):
+REQUEST_SPARSE_FIELDS = ('id', 'pick_up_floor', 'destination_floor', 'elevator', 'status')
+
+
+class RequestPagination(CursorPagination):
+    """
+    keyset pagination on id, a cursor keeps pages cheap however deep the table gets
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+def get_sparse_fields(request):
+    """
+    returns the request fields asked for with ?fields=id,status, None when all are wanted
+    """
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    fields = fields.split(',')
+    unknown_fields = set(fields) - set(REQUEST_SPARSE_FIELDS)
+    if unknown_fields:
+        raise ValidationError(f"Unknown fields {', '.join(sorted(unknown_fields))}, choose from {', '.join(REQUEST_SPARSE_FIELDS)}")
+    return fields
+
+
+def get_sparse_rows(queryset, fields):
+    """
+    returns the requests as dicts of only the given fields straight from values() rows,
+    id is always read as the pagination cursor is built from it
+    """
+    columns = ['elevator_id' if field == 'elevator' else field for field in fields]
+    return queryset.values(*{'id', *columns})
+
+
+def format_sparse_rows(rows, fields):
+    return [
+        {field: row['elevator_id' if field == 'elevator' else field] for field in fields}
+        for row in rows
+    ]
+
+
+class ElevatorViewSet(InstrumentedViewSetMixin, ReadReplicaViewSetMixin, viewsets.ModelViewSet):
     """
     Viewset for all operations on the Elevator.
     """
     queryset = Elevator.objects.all()
     lookup_field = 'id'
     lookup_url_kwarg = 'elevator_id'
+    read_actions = ('list', 'retrieve', 'get_next_floor', 'get_all_active_request')
+
+    def written_recently(self, kwargs):
+        elevator_id = kwargs.get(self.lookup_url_kwarg)
+        return elevator_id is not None and elevator_recently_written(elevator_id)
+
+    def get_queryset(self):
+        """
+        limits the elevators to a single system when system query param is passed
+        """
+        queryset = super().get_queryset()
+        system_id = self.request.query_params.get('system')
+        if system_id is not None:
+            if not system_id.isdigit():
+                raise ValidationError('system must be the id of an elevator system')
+            queryset = queryset.filter(system_id=system_id)
+        return queryset
 
     def get_serializer_class(self):
         """
@@ -24,6 +107,8 @@ class ElevatorViewSet(viewsets.ModelViewSet):
             return RequestSerializer
         elif self.action == 'open_close_doors':
             return DoorStatusSerializer
+        elif self.action == 'enter_destinations':
+            return EnterDestinationsSerializer
         else:
             return MoveElevatorSerializer
 
@@ -32,12 +117,37 @@ class ElevatorViewSet(viewsets.ModelViewSet):
     def move_elevator(self, request, elevator_id=None):
         """
         action to implement the logic of move elevator to next optimal floor
+        ?stops=N moves through up to N stops and ?until=idle until no request is left or someone
+        has to enter a destination, both in one call returning the floors visited
         """
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        self.perform_move_elevator(serializer)
-        return Response(serializer.data)
+        max_stops = self.get_max_stops()
+        if max_stops == 1:
+            self.perform_move_elevator(serializer)
+            return Response(serializer.data)
+
+        visited_floors, reason = self.perform_move_elevator_stops(serializer, max_stops)
+        return Response({**serializer.data, 'visited_floors': visited_floors, 'reason': reason})
+
+    def get_max_stops(self):
+        """
+        returns how many stops a move may go through, None for until idle
+        """
+        stops = self.request.query_params.get('stops')
+        until = self.request.query_params.get('until')
+        if stops is not None and until is not None:
+            raise ValidationError('Pass either stops or until, not both')
+        if until is not None:
+            if until != 'idle':
+                raise ValidationError('until only supports idle')
+            return None
+        if stops is None:
+            return 1
+        if not stops.isdigit() or int(stops) < 1:
+            raise ValidationError('stops must be a positive number')
+        return int(stops)
 
 
     @action(detail=True, methods=['get'])
@@ -45,9 +155,17 @@ class ElevatorViewSet(viewsets.ModelViewSet):
         """
         get action which returns the list of all requests in active/boarded state for current elevator
         """
-        instance = self.get_object()
-        serializer = RequestSerializer(get_all_requests_for_elevator(elevator_id=instance.id), many=True)
-        return Response(serializer.data)
+        fields = get_sparse_fields(request)
+        if fields is not None:
+            instance = self.get_object()
+            rows = get_sparse_rows(get_all_requests_for_elevator(elevator_id=instance.id).order_by('id'), fields)
+            return Response(format_sparse_rows(rows, fields))
+
+        def get_active_requests():
+            instance = self.get_object()
+            return list(RequestSerializer(get_all_requests_for_elevator(elevator_id=instance.id), many=True).data)
+
+        return Response(self.get_cached(ACTIVE_REQUESTS, get_active_requests))
 
 
     @action(detail=True, methods=['get'])
@@ -55,17 +173,22 @@ class ElevatorViewSet(viewsets.ModelViewSet):
         """
         get action which return the next floor this elevator will be going to
         """
+        def get_next_floor_data():
+            # a single read, the route plan is kept on the elevator
+            next_floor = get_next_floor_from_plan(self.get_object())
+            return {
+                "next_floor": 'Elevator has no requests either it is idle or under maintainance' if next_floor is None else next_floor
+            }
 
-        all_requests = get_all_requests_for_elevator(elevator_id=self.kwargs[self.lookup_url_kwarg])
-        instance = self.get_object()
-        next_floor = get_next_floor_for_elevator(
-            all_requests, instance.elevator_status, instance.current_floor
-        )
-        data = {
-            "next_floor": 'Elevator has no requests either it is idle or under maintainance' if not next_floor else next_floor
-        }
+        return Response(data=self.get_cached(NEXT_FLOOR, get_next_floor_data))
 
-        return Response(data=data)
+    def get_cached(self, kind, compute):
+        """
+        read through cache for the polled elevator reads, lookups scoped to a system skip it
+        """
+        if 'system' in self.request.query_params:
+            return compute()
+        return get_or_set_elevator_cache(self.kwargs[self.lookup_url_kwarg], kind, compute)
     
 
     @action(detail=True, methods=['patch'])
@@ -73,8 +196,12 @@ class ElevatorViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        self.perform_mark_under_maintainance(serializer)
-        return Response(serializer.data)
+        reassigned, fulfilled = self.perform_mark_under_maintainance(serializer)
+        return Response({
+            **serializer.data,
+            'reassigned_requests': RequestSerializer(reassigned, many=True).data,
+            'fulfilled_requests': [fulfilled_request.id for fulfilled_request in fulfilled],
+        })
 
     
     @action(detail=True, methods=['patch'])
@@ -89,79 +216,140 @@ class ElevatorViewSet(viewsets.ModelViewSet):
     def perform_move_elevator(self, serializer):
         """
         Updates the Elevators data for next_floor, current_floor, doors_status, and elevator status
+        the move is decided again from a fresh read when another call changed the elevator meanwhile
         """
-        instance = serializer.instance 
+        instance = serializer.instance
         previous_floor = instance.current_floor
+        error, requests_changed = run_with_elevator_retry(lambda: self.move_elevator_once(instance), instance)
+        invalidate_elevator_cache(instance.id)
+        publish_on_commit(
+            instance.system_id, elevator_event(instance),
+            *([] if error else [stop_event(instance, previous_floor)]),
+            *[request_event(changed_request) for changed_request in requests_changed]
+        )
+        if error:
+            raise ValidationError(error)
+
+    def perform_move_elevator_stops(self, serializer, max_stops):
+        """
+        moves the elevator through up to max_stops stops (all of them for None) in one transaction
+        returns the floors visited and why it stopped early
+        """
+        instance = serializer.instance
+        visited_floors, reason, stop_events, requests_changed = run_with_elevator_retry(
+            lambda: self.move_elevator_stops(instance, max_stops), instance
+        )
+        invalidate_elevator_cache(instance.id)
+        publish_on_commit(
+            instance.system_id, elevator_event(instance), *stop_events,
+            *[request_event(changed_request) for changed_request in requests_changed]
+        )
+        if not visited_floors:
+            raise ValidationError(reason)
+        return visited_floors, reason
+
+    def move_elevator_stops(self, instance, max_stops):
+        """
+        runs the moves on the pending requests in memory and writes the status changes in bulk at the end
+        """
+        self.check_can_move(instance)
+        pending_requests = {
+            pending_request.id: pending_request
+            for pending_request in get_all_requests_for_elevator(elevator_id=instance.id)
+        }
+        car = car_from_elevator(instance, pending_requests.values())
+        calls_changed = {}
+        visited_floors = []
+        stop_events = []
+        reason = None
+        while max_stops is None or len(visited_floors) < max_stops:
+            previous_floor = car.current_floor
+            changed, reason = move_car(car)
+            if reason:
+                break
+            calls_changed.update({call.id: call for call in changed})
+            visited_floors.append(car.current_floor)
+            stop_events.append(stop_event(car, previous_floor))
+
+        requests_changed = apply_calls_to_requests(calls_changed.values(), pending_requests)
+        Request.objects.bulk_update(requests_changed, REQUEST_STATUS_FIELDS)
+        record_requests_fulfilled(
+            [changed_request for changed_request in requests_changed if changed_request.status == REQUEST_STATUS_CHOICES.FULFILLED],
+            {instance.id: instance.system_id}
+        )
+        apply_car_to_elevator(car, instance)
+        save_elevator_fields(instance, ['current_floor', 'next_floor', 'elevator_status', *PENDING_REQUEST_FIELDS])
+        return visited_floors, reason, stop_events, requests_changed
+
+    def check_can_move(self, instance):
         if instance.door_status == DOOR_STATUS_CHOICES.OPEN:
             raise ValidationError('Cannot move the elevator please close the door first')  
         if instance.is_under_maintainance:
             raise ValidationError('Cannot move elevator as it is undermaintainance')
-        # all requests for current elevator
-        all_requests = get_all_requests_for_elevator(elevator_id=instance.id)
-        #  Please Note these people have to enter their destination else exception will be raised (code logic)
-        requests_with_no_destinations = all_requests.filter(
-            pick_up_floor=instance.current_floor,
-            destination_floor__isnull=True
-        ).values_list('id', flat=True)
-
-        if requests_with_no_destinations:
-            raise ValidationError(f"Some users have not choosen their destination floor please choose. thier ids are ({','.join(map(str, requests_with_no_destinations))})")
-    
-        #  current floor of the elevator will be next floor after moving (assumed reflects instantly)
-        # instance.current_floor = instance.next_floor
-        elevator_status = instance.elevator_status
-        all_requests_pending = all_requests.filter(status__in=[REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED])
+
+    def move_elevator_once(self, instance):
+        """
+        moves the elevator to its next floor through the engine,
+        returns the reason when there was nothing to move for and the requests whose status changed
+        """
+        self.check_can_move(instance)
         # If no request is pending for elevator mark status idle
-        if not all_requests_pending:
-            instance.next_floor = None
-            instance.elevator_status = ELEVATOR_STATUS_CHOICES.IDLE
-            instance.save()
-            raise ValidationError('There are no request for this elevator')
-        else:
-            # Getting the nearest floor to reach in case where elevator is already going up / Down  or Is Idle 
-            nearest_floor_above_to_board, nearest_floor_above_to_deboard, nearest_floor_down_to_board, nearest_floor_down_to_deboard = (
-                get_floors_above_below_to_board_and_deboard(all_requests_pending, instance.current_floor)
-            )
-            if not (nearest_floor_above_to_board or nearest_floor_above_to_deboard or nearest_floor_down_to_board or nearest_floor_down_to_deboard):
-                instance.current_floor = instance.next_floor
-                instance.next_floor = None
-                instance.elevator_status = ELEVATOR_STATUS_CHOICES.IDLE 
-            else:
-                instance.next_floor = get_next_floor(nearest_floor_above_to_board, nearest_floor_above_to_deboard, nearest_floor_down_to_board, nearest_floor_down_to_deboard, elevator_status, instance.current_floor)
-            
-            #  Marking elevator for up or down direction
-            instance.elevator_status = (
-                ELEVATOR_STATUS_CHOICES.GOING_UP if instance.next_floor > instance.current_floor
-                else ELEVATOR_STATUS_CHOICES.GOING_DOWN
-            )
-            instance.current_floor = instance.next_floor
-            # These request will be picked up at current floor
-            all_requests_boarded = all_requests.filter(Q(pick_up_floor=instance.current_floor) | Q(pick_up_floor = previous_floor))
-            all_requests_boarded.update(status=REQUEST_STATUS_CHOICES.BOARDED)
-            all_requests_fulfilled = all_requests.filter(destination_floor=instance.current_floor)
-            all_requests_fulfilled.update(status=REQUEST_STATUS_CHOICES.FULFILLED)
-            next_floor = get_next_floor_for_elevator(
-                all_requests, elevator_status, instance.current_floor
+        if not instance.active_request_count and not instance.boarded_request_count:
+            #  an idle elevator of a system parking predictively moves to where the next calls are expected
+            parking_stops = (
+                get_parking_stops([instance]) if instance.system.parking_policy == PARKING_POLICY_CHOICES.PREDICTIVE else {}
             )
-            instance.next_floor = None if next_floor == instance.current_floor else next_floor
-            instance.save()
-        
+            _, reason = move_elevator_in_memory(instance, [], parking_stops.get(instance.id))
+            save_elevator_fields(instance, ['current_floor', 'next_floor', 'elevator_status', *PENDING_REQUEST_FIELDS])
+            return reason, []
+
+        #  the same move as the multi stop moves and the system step, only the changed requests are written back
+        pending_requests = list(get_all_requests_for_elevator(elevator_id=instance.id).order_by('id'))
+        requests_changed, reason = move_elevator_in_memory(instance, pending_requests)
+        if reason:
+            #  Please Note users at the current floor have to enter their destination else the elevator will not move
+            raise ValidationError(reason)
+        Request.objects.bulk_update(requests_changed, REQUEST_STATUS_FIELDS)
+        record_requests_fulfilled(
+            [changed_request for changed_request in requests_changed if changed_request.status == REQUEST_STATUS_CHOICES.FULFILLED],
+            {instance.id: instance.system_id}
+        )
+        save_elevator_fields(instance, ['current_floor', 'next_floor', 'elevator_status', *PENDING_REQUEST_FIELDS])
+        return None, requests_changed
+
 
     def perform_mark_under_maintainance(self, serializer):
         """
         overwritting perform_update for specific action and its logic
-        removes all the requests active/ boarded from the elevator as fulfilled 
+        hands the requests active/ boarded of the elevator to the other elevators of the system in one batch,
         marks the elevator under maintaince and takes it to ground floor.
+        returns the reassigned and the fulfilled requests
         """
         instance = serializer.instance
-        instance.is_under_maintainance = True
-        instance.current_floor = 0
-        instance.next_floor = None
-        instance.elevator_status = ELEVATOR_STATUS_CHOICES.IDLE
-        instance.door_status = DOOR_STATUS_CHOICES.CLOSED
-        instance.save()
-        
-        remove_people_from_undermaintainance_elevator(instance.id)
+
+        def mark_under_maintainance():
+            result = reassign_requests(instance, instance.system)
+            instance.is_under_maintainance = True
+            instance.current_floor = 0
+            instance.next_floor = None
+            instance.elevator_status = ELEVATOR_STATUS_CHOICES.IDLE
+            instance.door_status = DOOR_STATUS_CHOICES.CLOSED
+            set_request_counters_in_memory(instance, [])
+            save_elevator_fields(
+                instance,
+                ['is_under_maintainance', 'current_floor', 'next_floor', 'elevator_status', 'door_status', *PENDING_REQUEST_FIELDS]
+            )
+            return result
+
+        reassigned, fulfilled, elevators = run_with_elevator_retry(mark_under_maintainance, instance)
+        invalidate_elevator_cache(instance.id, *[elevator.id for elevator in elevators])
+        publish_on_commit(
+            instance.system_id,
+            elevator_event(instance),
+            *[elevator_event(elevator) for elevator in elevators],
+            *[request_event(changed_request) for changed_request in [*reassigned, *fulfilled]]
+        )
+        return reassigned, fulfilled
     
 
     def perform_update_doors(self, serializer):
@@ -169,11 +357,57 @@ class ElevatorViewSet(viewsets.ModelViewSet):
         opens / closes  doors of the elevator
         """
         instance = serializer.instance
-        instance.door_status = DOOR_STATUS_CHOICES.OPEN if instance.door_status == DOOR_STATUS_CHOICES.CLOSED else DOOR_STATUS_CHOICES.CLOSED
-        instance.save()
 
+        def toggle_doors():
+            instance.door_status = DOOR_STATUS_CHOICES.OPEN if instance.door_status == DOOR_STATUS_CHOICES.CLOSED else DOOR_STATUS_CHOICES.CLOSED
+            save_elevator_fields(instance, ['door_status'])
+
+        run_with_elevator_retry(toggle_doors, instance)
+        invalidate_elevator_cache(instance.id)
+        publish_on_commit(instance.system_id, elevator_event(instance))
+
+    @action(detail=True, methods=['patch'])
+    def enter_destinations(self, request, elevator_id=None):
+        """
+        action to add the destination floors of everyone boarding at the current floor in one call,
+        payload is {"destinations": {request_id: destination_floor}}
+        """
+        instance = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        requests_updated = self.perform_enter_destinations(instance, serializer.validated_data['destinations'])
+        return Response(RequestSerializer(requests_updated, many=True).data)
+
+    def perform_enter_destinations(self, instance, destinations):
+        """
+        validates all destinations against the pending requests of the elevator and writes them together
+        """
+        def save_destinations():
+            pending_requests = list(get_all_requests_for_elevator(elevator_id=instance.id).order_by('id'))
+            requests_updated = [pending_request for pending_request in pending_requests if pending_request.id in destinations]
+            unknown_ids = sorted(set(destinations) - {request_updated.id for request_updated in requests_updated})
+            if unknown_ids:
+                raise ValidationError(f"Requests ({','.join(map(str, unknown_ids))}) are not pending on this elevator")
+            for request_updated in requests_updated:
+                if request_updated.pick_up_floor != instance.current_floor:
+                    raise ValidationError(f'Elevator has not arrived for request {request_updated.id} yet please wait.')
+                if request_updated.pick_up_floor == destinations[request_updated.id]:
+                    raise ValidationError(f'current floor and destination floor cant be same for request {request_updated.id}')
+                request_updated.destination_floor = destinations[request_updated.id]
+
+            Request.objects.bulk_update(requests_updated, ['destination_floor'])
+            # the destinations replace the previous ones in the route plan, a floor stays while somebody still gets off there
+            set_request_counters_in_memory(instance, pending_requests)
+            save_elevator_fields(instance, PENDING_REQUEST_FIELDS)
+            return requests_updated
 
-class RequestViewSet(viewsets.ModelViewSet):
+        requests_updated = run_with_elevator_retry(save_destinations, instance)
+        invalidate_elevator_cache(instance.id)
+        publish_on_commit(instance.system_id, *[request_event(request_updated) for request_updated in requests_updated])
+        return requests_updated
+
+
+class RequestViewSet(InstrumentedViewSetMixin, ReadReplicaViewSetMixin, viewsets.ModelViewSet):
     """
     Api to request an elevator for service by a user
     This api will assign an optimal Elevator to this request according to the business logic.
@@ -181,6 +415,41 @@ class RequestViewSet(viewsets.ModelViewSet):
     queryset = Request.objects.all()
     lookup_field = 'id'
     lookup_url_kwarg = 'request_id'
+    pagination_class = RequestPagination
+
+    def get_queryset(self):
+        """
+        the listing can be filtered by system, elevator, status and a range of pick up floors (min_floor / max_floor)
+        """
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        for param, lookup in (
+            ('system', 'elevator__system_id'), ('elevator', 'elevator_id'),
+            ('min_floor', 'pick_up_floor__gte'), ('max_floor', 'pick_up_floor__lte'),
+        ):
+            value = params.get(param)
+            if value is not None:
+                if not value.isdigit():
+                    raise ValidationError(f'{param} must be a positive number')
+                queryset = queryset.filter(**{lookup: value})
+        status = params.get('status')
+        if status is not None:
+            if status not in REQUEST_STATUS_CHOICES:
+                raise ValidationError(f"status must be one of {', '.join(REQUEST_STATUS_CHOICES)}")
+            queryset = queryset.filter(status=status)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        Api to list requests a page at a time, ?fields=id,status returns only those fields
+        """
+        fields = get_sparse_fields(request)
+        if fields is None:
+            return super().list(request, *args, **kwargs)
+        rows = self.paginate_queryset(get_sparse_rows(self.get_queryset(), fields))
+        return self.get_paginated_response(format_sparse_rows(rows, fields))
 
     def get_serializer_class(self):
         """
@@ -188,38 +457,129 @@ class RequestViewSet(viewsets.ModelViewSet):
         """
         if self.action == 'update':
             return AddDestianationFloorSerialzer
+        elif self.action == 'create_bulk':
+            return BulkRequestSerializer
         else:
             return RequestSerializer
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def create_bulk(self, request):
+        """
+        Api to create a burst of elevator requests for a system and assign optimal elevators in one pass
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        requests_created = self.perform_create_bulk(serializer)
+        return Response(RequestSerializer(requests_created, many=True).data)
+
+    @transaction.atomic
+    def perform_create_bulk(self, serializer):
+        """
+        assigns every pickup floor in order like perform_create would, keeping the fleet in memory
+        so each assignment sees the load added by the previous ones
+        """
+        system = serializer.validated_data['system']
+        pick_up_floors = serializer.validated_data['pick_up_floors']
+        elevators = list(get_available_elevators(system.id).select_for_update().order_by('id'))
+        requests_to_create = []
+        elevators_to_update = {}
+        now = timezone.now()
+        for pickup_floor, elevator in zip(pick_up_floors, choose_elevators_for_pickups(system, elevators, pick_up_floors)):
+            elevators_to_update[elevator.id] = elevator
+            status = assign_elevator_to_pickup(elevator, pickup_floor, system.max_floors)
+            elevator.request_count += 1
+            if status == REQUEST_STATUS_CHOICES.BOARDED:
+                change_request_counters(elevator, boarded=1)
+            else:
+                change_request_counters(elevator, active=1, pick_up_floors=[pickup_floor])
+            requests_to_create.append(Request(
+                pick_up_floor=pickup_floor, elevator=elevator, status=status, created_at=now,
+                boarded_at=now if status == REQUEST_STATUS_CHOICES.BOARDED else None,
+            ))
+
+        for elevator in elevators_to_update.values():
+            elevator.version += 1
+        Request.objects.bulk_create(requests_to_create)
+        Elevator.objects.bulk_update(
+            elevators_to_update.values(), ['elevator_status', 'next_floor', 'version', *PENDING_REQUEST_FIELDS]
+        )
+        record_requests_created(requests_to_create, {elevator_id: system.id for elevator_id in elevators_to_update})
+        invalidate_elevator_cache(*{request.elevator_id for request in requests_to_create})
+        publish_on_commit(
+            system.id,
+            *[elevator_event(elevator) for elevator in elevators_to_update.values()],
+            *[request_event(request) for request in requests_to_create]
+        )
+        return requests_to_create
+
     def perform_create(self, serializer):
         """
         Api to create a new elevator request and assign optimal elevator
+        dispatch runs again when the assigned elevator was changed by another call meanwhile
         """
         pickup_floor =  serializer.validated_data['pick_up_floor']
-        elevator_assigned_id = get_most_suitable_elevator(pickup_floor)
-        elevator_assigned_obj = Elevator.objects.filter(id=elevator_assigned_id).annotate(
-            systems_max_floor = F('system__max_floors')
-        ).first()
-        if elevator_assigned_obj.elevator_status == ELEVATOR_STATUS_CHOICES.IDLE:
-            elevator_assigned_obj.elevator_status= (
-                ELEVATOR_STATUS_CHOICES.GOING_UP if (
-                    pickup_floor >= elevator_assigned_obj.current_floor and
-                    pickup_floor < elevator_assigned_obj.systems_max_floor
-                )
-                else ELEVATOR_STATUS_CHOICES.GOING_DOWN
-            )
-            elevator_assigned_obj.next_floor = pickup_floor
-            elevator_assigned_obj.save()
-        
+        system = serializer.validated_data.pop('system', None)
+        dispatch_tier = run_with_elevator_retry(lambda: self.assign_elevator_and_save(serializer, pickup_floor, system))
+        # recorded once the assignment is saved, a retried dispatch counts once
+        registry.record_dispatch_tier(dispatch_tier)
+        invalidate_elevator_cache(serializer.instance.elevator_id)
+        publish_on_commit(
+            serializer.instance.elevator.system_id, elevator_event(serializer.instance.elevator), request_event(serializer.instance)
+        )
+
+        return Response(serializer.data)
+
+    def assign_elevator_and_save(self, serializer, pickup_floor, system):
+        """
+        assigns the most suitable elevator to the request and saves both, returns the dispatch tier which won
+        """
+        # somebody already waiting at the floor shares their elevator, no dispatch needed
+        elevator_assigned_obj = get_elevator_waited_for(
+            pickup_floor, system.id if system else None
+        ) if hall_call_coalescing_enabled() else None
+        dispatch_tier = COALESCED_TIER
+        if elevator_assigned_obj is None and uses_cost_matrix(system):
+            elevator_assigned_obj, = choose_elevators_by_cost(list(get_available_elevators(system.id).order_by('id')), [pickup_floor])
+            elevator_assigned_obj.systems_max_floor = system.max_floors
+            dispatch_tier = COST_MATRIX_TIER
+        elif elevator_assigned_obj is None:
+            elevator_assigned_id, dispatch_tier = rank_most_suitable_elevator(pickup_floor, system_id=system.id if system else None)
+            elevator_assigned_obj = Elevator.objects.filter(id=elevator_assigned_id).annotate(
+                systems_max_floor = F('system__max_floors')
+            ).first()
+        was_idle = elevator_assigned_obj.elevator_status == ELEVATOR_STATUS_CHOICES.IDLE
+        status = assign_elevator_to_pickup(
+            elevator_assigned_obj, pickup_floor, elevator_assigned_obj.systems_max_floor
+        )
+        if status == REQUEST_STATUS_CHOICES.BOARDED:
+            counters = change_request_counters(elevator_assigned_obj, boarded=1)
+        else:
+            counters = change_request_counters(elevator_assigned_obj, active=1, pick_up_floors=[pickup_floor])
+        save_elevator_fields(elevator_assigned_obj, ['elevator_status', 'next_floor'] if was_idle else [], counters)
+        serializer.validated_data['status'] = status
+        if status == REQUEST_STATUS_CHOICES.BOARDED:
+            serializer.validated_data['boarded_at'] = timezone.now()
+
         serializer.validated_data['elevator'] = elevator_assigned_obj
-        # if an eleavtor at same floor was assigned mark the request as boarded
-        if elevator_assigned_obj.current_floor == pickup_floor:
-            serializer.validated_data['status'] = REQUEST_STATUS_CHOICES.BOARDED
-        
         serializer.save()
+        record_requests_created([serializer.instance], {elevator_assigned_obj.id: elevator_assigned_obj.system_id})
+        return dispatch_tier
 
-        return Response(serializer.data)
 
+    def perform_destroy(self, instance):
+        """
+        deletes the request and takes it out of the counters and the route plan of its elevator
+        """
+        elevator = instance.elevator
+
+        def delete_request():
+            Request.objects.filter(id=instance.id).delete()
+            refresh_request_counters(elevator)
+            save_elevator_fields(elevator, PENDING_REQUEST_FIELDS)
+
+        run_with_elevator_retry(delete_request, elevator)
+        invalidate_elevator_cache(elevator.id)
+        publish_on_commit(elevator.system_id, elevator_event(elevator))
 
     def update(self, request, *args, **kwargs):
         """
@@ -238,7 +598,56 @@ class RequestViewSet(viewsets.ModelViewSet):
             if field in request.data:
                 setattr(instance, field, request.data[field])
 
-        instance.save()
+        def save_destination():
+            instance.save()
+            # the destination replaces the previous one in the route plan unless another user still gets off there
+            refresh_request_counters(instance.elevator, [instance])
+            save_elevator_fields(instance.elevator, PENDING_REQUEST_FIELDS)
+
+        run_with_elevator_retry(save_destination, instance.elevator)
+        invalidate_elevator_cache(instance.elevator_id)
+        publish_on_commit(instance.elevator.system_id, request_event(instance))
 
         return Response(serializer.data)
 
+
+class RequestHistoryPagination(RequestPagination):
+    """
+    newest first
+    """
+    ordering = '-id'
+
+
+class RequestHistoryViewSet(InstrumentedViewSetMixin, ReadReplicaViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Api to report on archived (fulfilled) requests
+    can be filtered by system, elevator and archived_after / archived_before (ISO 8601)
+    """
+    queryset = RequestHistory.objects.all()
+    serializer_class = RequestHistorySerializer
+    pagination_class = RequestHistoryPagination
+    filter_fields = ('system', 'elevator')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for field in self.filter_fields:
+            value = self.request.query_params.get(field)
+            if value is not None:
+                if not value.isdigit():
+                    raise ValidationError(f'{field} must be an id')
+                queryset = queryset.filter(**{f'{field}_id': value})
+        for param, lookup in (('archived_after', 'archived_at__gte'), ('archived_before', 'archived_at__lt')):
+            value = self.request.query_params.get(param)
+            if value is not None:
+                moment = parse_datetime(value)
+                if moment is None:
+                    raise ValidationError(f'{param} must be an ISO 8601 date time')
+                queryset = queryset.filter(**{lookup: moment})
+        return queryset
+
+
+def metrics(request):
+    """
+    exposes api and dispatch metrics in the prometheus text format
+    """
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
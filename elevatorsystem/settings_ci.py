@@ -0,0 +1,22 @@
+"""
+Settings for CI, runs the project on SQLite so the test suite and the simulator need no database server:
+
+DJANGO_SETTINGS_MODULE=elevatorsystem.settings_ci python manage.py test
+"""
+
+from elevatorsystem.settings_example import *  # noqa: F401,F403
+from elevatorsystem.settings_example import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'ci.sqlite3',
+        # a file rather than the in memory default, the threads of the concurrency test share it
+        'TEST': {'NAME': BASE_DIR / 'ci_test.sqlite3'},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'ci.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
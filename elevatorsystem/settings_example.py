@@ -84,9 +84,35 @@ DATABASES = {
         'PASSWORD': 'password',
         'HOST': '127.0.0.1', 
         'PORT': '5432',
-    }
+        # keep connections open between requests instead of connecting for every request
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # streaming replica of default, point HOST at the replica
+    'replica': {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'NAME': 'your_db_name',
+        'USER': 'owner_name',
+        'PASSWORD': 'password',
+        'HOST': '127.0.0.1',
+        'PORT': '5432',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['elevator.routing.ReadReplicaRouter']
+
+# alias the read only api actions are served from ('replica'), None serves everything from default
+ELEVATOR_READ_DATABASE = None
+# clients which changed something and elevators which were changed are read from default for this long
+ELEVATOR_READ_YOUR_WRITES_SECONDS = 5
+# idle elevators of predictive parking systems head for floors with recent calls, a call weighs half after the half life
+ELEVATOR_PARKING_HALF_LIFE_SECONDS = 900
+# floors an idle elevator moves towards its parking floor per move
+ELEVATOR_PARKING_HOP_FLOORS = 3
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
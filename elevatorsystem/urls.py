@@ -17,9 +17,11 @@ from django.contrib import admin
 from django.urls import path, include
 from system import urls as system_urls
 from elevator import urls as elevator_urls
+from elevator.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/elevatorsystem/', include(system_urls)),
-    path('api/elevator/', include(elevator_urls))
+    path('api/elevator/', include(elevator_urls)),
+    path('api/metrics', metrics, name='metrics'),
 ]
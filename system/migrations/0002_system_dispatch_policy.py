@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='system',
+            name='dispatch_policy',
+            field=models.CharField(choices=[('rules', 'Rules'), ('cost_matrix', 'Cost_matrix')], default='rules', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0002_system_dispatch_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='system',
+            name='parking_policy',
+            field=models.CharField(choices=[('stay', 'Stay'), ('predictive', 'Predictive')], default='stay', max_length=20),
+        ),
+    ]
@@ -1,9 +1,30 @@
+from collections import namedtuple
 from django.db import models
 
+DispatchPolicyChoices = namedtuple('DispatchPolicyChoices', ['RULES', 'COST_MATRIX'])
+ParkingPolicyChoices = namedtuple('ParkingPolicyChoices', ['STAY', 'PREDICTIVE'])
+
+DISPATCH_POLICY_CHOICES = DispatchPolicyChoices(RULES='rules', COST_MATRIX='cost_matrix')
+PARKING_POLICY_CHOICES = ParkingPolicyChoices(STAY='stay', PREDICTIVE='predictive')
+
+
 class System(models.Model):
     """
     Model to store each elevator systems
     """
+    dispatch_policy_choices = [
+        (getattr(DISPATCH_POLICY_CHOICES, attr), attr.capitalize()) for attr in DISPATCH_POLICY_CHOICES._fields
+    ]
+    parking_policy_choices = [
+        (getattr(PARKING_POLICY_CHOICES, attr), attr.capitalize()) for attr in PARKING_POLICY_CHOICES._fields
+    ]
+
     name = models.CharField(max_length=60)
     elevators_count = models.IntegerField()
     max_floors = models.IntegerField()
+    # rules picks one elevator per call with the tiered policy, cost_matrix estimates the time to arrival
+    # of every elevator for every call and needs numpy
+    dispatch_policy = models.CharField(max_length=20, choices=dispatch_policy_choices, default=DISPATCH_POLICY_CHOICES.RULES)
+    # stay leaves an elevator without requests where it stopped, predictive moves it towards the floors
+    # expected to call next from the recent calls of the system
+    parking_policy = models.CharField(max_length=20, choices=parking_policy_choices, default=PARKING_POLICY_CHOICES.STAY)
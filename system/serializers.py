@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import System
+from elevator.dispatch import cost_matrix_available
+from .models import DISPATCH_POLICY_CHOICES, System
 
 class CreateElevatorSystemSerializer(serializers.ModelSerializer):
     """
@@ -7,4 +8,9 @@ class CreateElevatorSystemSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = System
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+    def validate_dispatch_policy(self, value):
+        if value == DISPATCH_POLICY_CHOICES.COST_MATRIX and not cost_matrix_available():
+            raise serializers.ValidationError('cost_matrix dispatch needs numpy to be installed')
+        return value
@@ -1,3 +1,96 @@
+from unittest import mock
+
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from elevator.events import broker
+from elevator.models import DOOR_STATUS_CHOICES, REQUEST_STATUS_CHOICES, Elevator, Request
+from elevator.utils import reconcile_request_counters
+from system.models import System
+
+
+class SystemStepTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_system(self):
+        response = self.client.post(
+            '/api/elevatorsystem/', {'name': 'system', 'elevators_count': 5, 'max_floors': 20}, format='json'
+        )
+        system_id = response.data['id']
+        elevators = list(Elevator.objects.filter(system_id=system_id).order_by('id'))
+        for pickup_floor in [3, 9, 14, 0, 6, 11]:
+            self.client.post('/api/elevator/request-elevator/', {'pick_up_floor': pickup_floor, 'system': system_id}, format='json')
+        Request.objects.filter(elevator__system_id=system_id, pick_up_floor=0).update(
+            destination_floor=12, status=REQUEST_STATUS_CHOICES.BOARDED
+        )
+        reconcile_request_counters()
+        elevators[-1].door_status = DOOR_STATUS_CHOICES.OPEN
+        elevators[-1].save()
+        return system_id
+
+    def get_state(self, system_id):
+        elevators = list(
+            Elevator.objects.filter(system_id=system_id).order_by('id').values_list('current_floor', 'next_floor', 'elevator_status')
+        )
+        requests = list(
+            Request.objects.filter(elevator__system_id=system_id).order_by('id').values_list('pick_up_floor', 'status')
+        )
+        return elevators, requests
+
+    def test_step_matches_moving_each_elevator(self):
+        system_id = self.create_system()
+        for _ in range(3):
+            for elevator_id in Elevator.objects.filter(system_id=system_id).order_by('id').values_list('id', flat=True):
+                self.client.patch(f'/api/elevator/{elevator_id}/move-elevator', {}, format='json')
+        moved_one_by_one = self.get_state(system_id)
+
+        system_id = self.create_system()
+        for _ in range(3):
+            response = self.client.post(f'/api/elevatorsystem/{system_id}/step/', format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_state(system_id), moved_one_by_one)
+        self.assertIn('close the door', list(response.data['skipped'].values())[-1])
+
+    def test_step_costs_a_fixed_number_of_queries(self):
+        system_id = self.create_system()
+        # system, elevators, requests, request update, elevator update, demand rollup and the transaction savepoint pair
+        with self.assertNumQueries(8):
+            response = self.client.post(f'/api/elevatorsystem/{system_id}/step/', format='json')
+        self.assertEqual(len(response.data['elevators']), 5)
+
+
+class SystemEventsTestCase(TestCase):
+
+    async def test_stream_receives_published_events(self):
+        system = await System.objects.acreate(name='system', elevators_count=1, max_floors=10)
+        response = await self.async_client.get(f'/api/elevatorsystem/{system.id}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+
+        broker.publish(system.id, {'type': 'elevator', 'id': 1, 'floor': 3})
+        broker.publish(system.id + 1, {'type': 'elevator', 'id': 2, 'floor': 4})
+        self.assertEqual(await anext(stream), b'event: elevator\ndata: {"type":"elevator","id":1,"floor":3}\n\n')
+        await stream.aclose()
+
+    async def test_unknown_system(self):
+        response = await self.async_client.get('/api/elevatorsystem/999/events/')
+        self.assertEqual(response.status_code, 404)
 
-# Create your tests here.
+    def test_mutations_publish_events_after_commit(self):
+        client = APIClient()
+        system = System.objects.create(name='system', elevators_count=1, max_floors=10)
+        elevator = Elevator.objects.create(system=system)
+        with mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post('/api/elevator/request-elevator/', {'pick_up_floor': 3, 'system': system.id}, format='json')
+                client.patch(f'/api/elevator/{elevator.id}/move-elevator', {}, format='json')
+                client.patch(f'/api/elevator/{elevator.id}/open-close-doors', {}, format='json')
+        events = [call.args[1] for call in publish.call_args_list]
+        self.assertEqual([event['type'] for event in events], ['elevator', 'request', 'elevator', 'stop', 'request', 'elevator'])
+        self.assertEqual((events[3]['floor'], events[3]['boarding_floors'], events[3]['arrival_floor']), (3, [0, 3], 3))
+        # the move publishes the requests it changed like the system step does
+        self.assertEqual(events[4]['status'], REQUEST_STATUS_CHOICES.BOARDED)
+        self.assertEqual(events[5]['door'], DOOR_STATUS_CHOICES.OPEN)
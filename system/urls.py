@@ -1,8 +1,10 @@
 from django.urls import path
 from rest_framework.routers import SimpleRouter
-from .views import ElevatorSystemViewSet
+from .views import ElevatorSystemViewSet, system_events
 
 router = SimpleRouter()
 router.register('', ElevatorSystemViewSet)
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('<int:system_id>/events/', system_events, name='system_events'),
+] + router.urls
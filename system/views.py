@@ -1,19 +1,33 @@
+import asyncio
+
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from django.db import transaction
-from elevator.models import Elevator
+from django.http import Http404, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from elevator.analytics import DEMAND_BUCKET_MINUTES, get_demand, record_requests_fulfilled
+from elevator.cache import invalidate_elevator_cache
+from elevator.events import broker, elevator_event, format_server_sent_event, publish_on_commit, request_event
+from elevator.metrics import InstrumentedViewSetMixin
+from elevator.routing import ReadReplicaViewSetMixin
+from elevator.models import REQUEST_STATUS_CHOICES, Elevator, Request
+from elevator.parking import get_parking_stops
+from elevator.serializers import MoveElevatorSerializer
+from elevator.utils import PENDING_REQUEST_FIELDS, REQUEST_STATUS_FIELDS, move_elevator_in_memory, set_request_counters_in_memory
 from rest_framework.response import Response
-from .models import System
+from .models import PARKING_POLICY_CHOICES, System
 from rest_framework.exceptions import ValidationError
 
 from system.serializers import CreateElevatorSystemSerializer
 
-class ElevatorSystemViewSet(viewsets.ModelViewSet):
+class ElevatorSystemViewSet(InstrumentedViewSetMixin, ReadReplicaViewSetMixin, viewsets.ModelViewSet):
     """
     View to create an elevator system.
     """
     queryset = System.objects.all()
     serializer_class = CreateElevatorSystemSerializer
     http_method_names = ['get', 'post']
+    read_actions = ('list', 'retrieve', 'demand')
     
     @transaction.atomic
     def create(self, request, *args, **kwargs):
@@ -34,4 +48,129 @@ class ElevatorSystemViewSet(viewsets.ModelViewSet):
         Elevator.objects.bulk_create(elevators_to_create)
 
         return Response(serializer.data)
-            
+
+    @action(detail=True, methods=['post'])
+    def step(self, request, pk=None):
+        """
+        moves every elevator of the system to its next floor in one transaction
+        returns the new state of all elevators and the reason for the ones which could not move
+        """
+        system = self.get_object()
+        elevators, skipped = self.perform_step(system)
+        return Response({
+            'elevators': MoveElevatorSerializer(elevators, many=True).data,
+            'skipped': skipped,
+        })
+
+    @transaction.atomic
+    def perform_step(self, system):
+        """
+        loads all elevators and pending requests of the system once and writes back all changes in bulk
+        """
+        elevators = list(Elevator.objects.filter(system=system).select_for_update().order_by('id'))
+        pending_requests_by_elevator = {elevator.id: [] for elevator in elevators}
+        for pending_request in Request.objects.filter(
+            elevator__system=system, status__in=[REQUEST_STATUS_CHOICES.ACTIVE, REQUEST_STATUS_CHOICES.BOARDED]
+        ):
+            pending_requests_by_elevator[pending_request.elevator_id].append(pending_request)
+
+        # the parking floors are shared out among the elevators idle before the step
+        parking_stops = get_parking_stops(elevators) if system.parking_policy == PARKING_POLICY_CHOICES.PREDICTIVE else {}
+        requests_changed = []
+        skipped = {}
+        for elevator in elevators:
+            changed, reason = move_elevator_in_memory(
+                elevator, pending_requests_by_elevator[elevator.id], parking_stops.get(elevator.id)
+            )
+            requests_changed.extend(changed)
+            if reason:
+                skipped[elevator.id] = reason
+
+        for elevator in elevators:
+            elevator.version += 1
+            set_request_counters_in_memory(elevator, [
+                pending_request for pending_request in pending_requests_by_elevator[elevator.id]
+                if pending_request.status != REQUEST_STATUS_CHOICES.FULFILLED
+            ])
+        Request.objects.bulk_update(requests_changed, REQUEST_STATUS_FIELDS)
+        Elevator.objects.bulk_update(
+            elevators, ['current_floor', 'next_floor', 'elevator_status', 'version', *PENDING_REQUEST_FIELDS]
+        )
+        record_requests_fulfilled(
+            [changed_request for changed_request in requests_changed if changed_request.status == REQUEST_STATUS_CHOICES.FULFILLED],
+            {elevator.id: system.id for elevator in elevators}
+        )
+        invalidate_elevator_cache(*[elevator.id for elevator in elevators])
+        publish_on_commit(
+            system.id,
+            *[elevator_event(elevator) for elevator in elevators],
+            *[request_event(changed_request) for changed_request in requests_changed]
+        )
+        return elevators, skipped
+
+    @action(detail=True, methods=['get'])
+    def demand(self, request, pk=None):
+        """
+        requests made, trips and average wait / ride seconds per pick up floor, direction and 5 minute bucket,
+        read from the demand rollups only. filtered by after / before (ISO 8601), floor and hour (0-23),
+        group_by=floor sums every floor over the buckets busiest first
+        """
+        system = self.get_object()
+        params = request.query_params
+        filters = {}
+        for param in ('after', 'before'):
+            if param in params:
+                filters[param] = parse_datetime(params[param])
+                if filters[param] is None:
+                    raise ValidationError(f'{param} must be an ISO 8601 date time')
+        for param in ('floor', 'hour'):
+            if param in params:
+                if not params[param].isdigit():
+                    raise ValidationError(f'{param} must be a positive number')
+                filters[param] = int(params[param])
+        if filters.get('hour', 0) > 23:
+            raise ValidationError('hour must be between 0 and 23')
+        if params.get('group_by', 'floor') != 'floor':
+            raise ValidationError('demand can only be grouped by floor')
+        return Response({
+            'bucket_minutes': DEMAND_BUCKET_MINUTES,
+            'demand': get_demand(system.id, by_floor='group_by' in params, **filters),
+        })
+
+
+EVENT_STREAM_KEEPALIVE_SECONDS = 15
+# streams end after this long and the browser reconnects, so a stream of a client
+# which went away without us noticing does not live forever
+EVENT_STREAM_MAX_SECONDS = 300
+
+
+async def system_events(request, system_id):
+    """
+    server sent events stream of the elevator and request changes of a system, needs to be served over ASGI
+    """
+    if not await System.objects.filter(id=system_id).aexists():
+        raise Http404('System does not exist')
+
+    queue = broker.subscribe(system_id)
+
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            loop = asyncio.get_running_loop()
+            ends_at = loop.time() + EVENT_STREAM_MAX_SECONDS
+            while loop.time() < ends_at:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=min(EVENT_STREAM_KEEPALIVE_SECONDS, ends_at - loop.time())
+                    )
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_server_sent_event(event)
+        finally:
+            broker.unsubscribe(system_id, queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response